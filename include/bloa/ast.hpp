@@ -1,4 +1,5 @@
 #pragma once
+#include <cstdint>
 #include <memory>
 #include <optional>
 #include <string>
@@ -11,37 +12,63 @@ struct Node;
 using NodePtr = std::shared_ptr<Node>;
 using NodeList = std::vector<NodePtr>;
 
+enum class NodeKind : uint8_t {
+  Say,
+  Ask,
+  Assign,
+  Declare,
+  If,
+  Repeat,
+  FunctionDef,
+  FunctionCall,
+  Return,
+  Import,
+  Require,
+  ExprStmt,
+  MemberAssign,
+  ClassDef,
+  While,
+  Break,
+  Continue,
+  ForIn,
+  TryExcept,
+};
+
 struct Node {
+  NodeKind kind;
+  explicit Node(NodeKind k) : kind(k) {}
   virtual ~Node() = default;
 };
 
 struct Say : Node {
   std::string expr;
-  Say(std::string e) : expr(std::move(e)) {}
+  Say(std::string e) : Node(NodeKind::Say), expr(std::move(e)) {}
 };
 struct Ask : Node {
   std::string prompt;
   std::string var;
-  Ask(std::string p, std::string v) : prompt(std::move(p)), var(std::move(v)) {}
+  Ask(std::string p, std::string v)
+      : Node(NodeKind::Ask), prompt(std::move(p)), var(std::move(v)) {}
 };
 struct Assign : Node {
   std::string name;
   std::string expr;
   Assign(std::string n, std::string e)
-      : name(std::move(n)), expr(std::move(e)) {}
+      : Node(NodeKind::Assign), name(std::move(n)), expr(std::move(e)) {}
 };
 struct Declare : Node {
   std::string name;
   std::string expr;
   Declare(std::string n, std::string e)
-      : name(std::move(n)), expr(std::move(e)) {}
+      : Node(NodeKind::Declare), name(std::move(n)), expr(std::move(e)) {}
 };
 struct If : Node {
   std::string cond;
   NodeList then_block;
   NodeList else_block;
   If(std::string c, NodeList t, NodeList e)
-      : cond(std::move(c)),
+      : Node(NodeKind::If),
+        cond(std::move(c)),
         then_block(std::move(t)),
         else_block(std::move(e)) {}
 };
@@ -49,36 +76,40 @@ struct Repeat : Node {
   std::string times_expr;
   NodeList block;
   Repeat(std::string t, NodeList b)
-      : times_expr(std::move(t)), block(std::move(b)) {}
+      : Node(NodeKind::Repeat), times_expr(std::move(t)), block(std::move(b)) {}
 };
 struct FunctionDef : Node {
   std::string name;
   std::vector<std::string> params;
   NodeList block;
   FunctionDef(std::string n, std::vector<std::string> p, NodeList b)
-      : name(std::move(n)), params(std::move(p)), block(std::move(b)) {}
+      : Node(NodeKind::FunctionDef),
+        name(std::move(n)),
+        params(std::move(p)),
+        block(std::move(b)) {}
 };
 struct FunctionCall : Node {
   std::string name;
   std::vector<std::string> args;
   FunctionCall(std::string n, std::vector<std::string> a)
-      : name(std::move(n)), args(std::move(a)) {}
+      : Node(NodeKind::FunctionCall), name(std::move(n)), args(std::move(a)) {}
 };
 struct Return : Node {
   std::optional<std::string> expr;
-  Return(std::optional<std::string> e) : expr(std::move(e)) {}
+  Return(std::optional<std::string> e)
+      : Node(NodeKind::Return), expr(std::move(e)) {}
 };
 struct Import : Node {
   std::string name;
-  Import(std::string n) : name(std::move(n)) {}
+  Import(std::string n) : Node(NodeKind::Import), name(std::move(n)) {}
 };
 struct Require : Node {
   std::string path;
-  Require(std::string p) : path(std::move(p)) {}
+  Require(std::string p) : Node(NodeKind::Require), path(std::move(p)) {}
 };
 struct ExprStmt : Node {
   std::string expr;
-  ExprStmt(std::string e) : expr(std::move(e)) {}
+  ExprStmt(std::string e) : Node(NodeKind::ExprStmt), expr(std::move(e)) {}
 };
 
 struct MemberAssign : Node {
@@ -86,7 +117,10 @@ struct MemberAssign : Node {
   std::string member;
   std::string expr;
   MemberAssign(std::string o, std::string m, std::string e)
-      : object(std::move(o)), member(std::move(m)), expr(std::move(e)) {}
+      : Node(NodeKind::MemberAssign),
+        object(std::move(o)),
+        member(std::move(m)),
+        expr(std::move(e)) {}
 };
 
 struct ClassDef : Node {
@@ -94,28 +128,41 @@ struct ClassDef : Node {
   std::optional<std::string> parent;
   NodeList block;
   ClassDef(std::string n, std::optional<std::string> p, NodeList b)
-      : name(std::move(n)), parent(std::move(p)), block(std::move(b)) {}
+      : Node(NodeKind::ClassDef),
+        name(std::move(n)),
+        parent(std::move(p)),
+        block(std::move(b)) {}
 };
 
 struct While : Node {
   std::string cond;
   NodeList block;
-  While(std::string c, NodeList b) : cond(std::move(c)), block(std::move(b)) {}
+  While(std::string c, NodeList b)
+      : Node(NodeKind::While), cond(std::move(c)), block(std::move(b)) {}
+};
+struct Break : Node {
+  Break() : Node(NodeKind::Break) {}
+};
+struct Continue : Node {
+  Continue() : Node(NodeKind::Continue) {}
 };
-struct Break : Node {};
-struct Continue : Node {};
 struct ForIn : Node {
   std::string var;
   std::string iterable;
   NodeList block;
   ForIn(std::string v, std::string it, NodeList b)
-      : var(std::move(v)), iterable(std::move(it)), block(std::move(b)) {}
+      : Node(NodeKind::ForIn),
+        var(std::move(v)),
+        iterable(std::move(it)),
+        block(std::move(b)) {}
 };
 struct TryExcept : Node {
   NodeList try_block;
   NodeList except_block;
   TryExcept(NodeList t, NodeList e)
-      : try_block(std::move(t)), except_block(std::move(e)) {}
+      : Node(NodeKind::TryExcept),
+        try_block(std::move(t)),
+        except_block(std::move(e)) {}
 };
 
 }  // namespace bloa
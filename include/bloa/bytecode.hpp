@@ -0,0 +1,69 @@
+#pragma once
+#include <cstdint>
+#include <memory>
+#include <string>
+#include <vector>
+
+#include "bloa/ast.hpp"
+#include "bloa/env.hpp"
+#include "bloa/expr.hpp"
+
+namespace bloa {
+
+// Statement-level instructions. Operands index into the pools of the Code
+// object that owns the instruction; jump targets are instruction indices.
+// Expressions are compiled along with the statements that use them.
+enum class Op : uint8_t {
+  Halt,            // end of code
+  Say,             // a: first expr, b: number of consecutive exprs
+  Ask,             // a: symbol (variable), b: expr (prompt)
+  Declare,         // a: symbol, b: expr
+  Assign,          // a: symbol, b: expr, c: binding
+  MemberAssign,    // a: symbol (object), b: expr, c: symbol (member)
+  Eval,            // a: expr
+  Jump,            // b: target
+  JumpIfFalse,     // a: expr, b: target
+  PushScope,       // enter a child environment
+  PopScope,        // return to the enclosing environment
+  RepeatInit,      // a: expr (iteration count), or -1 and b: the count
+  RepeatNext,      // b: exit target
+  RepeatSay,       // a: expr (count), b: first expr, c: number of exprs
+  ForInit,         // a: expr (list)
+  ForNext,         // a: symbol (loop variable), b: exit target
+  WhileInit,       // start a while loop
+  WhileNext,       // a: expr (condition), b: exit target
+  Unwind,          // a: scope depth, b: loop depth, c: handler depth
+  SetupExcept,     // b: handler target
+  PopExcept,       // leave the innermost try block
+  DefineFunction,  // a: node (FunctionDef), b: child code
+  DefineClass,     // a: node (ClassDef), b: first child code (one per method)
+  Import,          // a: node (Import)
+  Require,         // a: node (Require)
+  Return,          // a: expr, or -1 for a bare return
+  Fail,            // a: name (error message)
+};
+
+struct Instr {
+  Op op;
+  int32_t a = 0;
+  int32_t b = 0;
+  int32_t c = 0;
+};
+
+struct Code {
+  std::vector<Instr> instrs;
+  std::vector<ExprPtr> exprs;
+  std::vector<std::string> names;
+  std::vector<Symbol> symbols;
+  NodeList nodes;
+  std::vector<std::shared_ptr<const Code>> children;
+  // The variable each assignment last stored to, so that repeated
+  // assignments skip the walk up the scope chain.
+  mutable std::vector<CachedBinding> bindings;
+};
+
+// compile lowers a parsed block into a flat instruction list. Function and
+// method bodies are compiled once into child Code objects.
+std::shared_ptr<const Code> compile(const NodeList &nodes);
+
+}  // namespace bloa
@@ -1,9 +1,11 @@
 #pragma once
+#include <algorithm>
 #include <cmath>
 #include <memory>
 #include <optional>
 #include <stdexcept>
 #include <string>
+#include <string_view>
 #include <unordered_map>
 #include <variant>
 #include <vector>
@@ -131,74 +133,157 @@ struct Value {
   }
 };
 
-struct Variable {
-  Value value;
-  std::string visibility;
+// Variable names are interned once into integer symbols so that scope
+// lookups hash and compare integers instead of strings.
+using Symbol = uint32_t;
+Symbol intern(std::string_view name);
+std::optional<Symbol> find_symbol(std::string_view name);
+const std::string &symbol_name(Symbol sym);
+
+// Where a symbol was found from one scope. It stays valid for as long as
+// Environment::binding_generation does not change.
+struct CachedBinding {
+  uint64_t generation = 0;
+  uint64_t env = 0;
+  Value *value = nullptr;
 };
 
 struct Environment {
   Environment(std::shared_ptr<Environment> parent = nullptr);
+  Environment(const Environment &other);
+  // Changes whenever any scope gains or loses a variable. While it stays the
+  // same, looking a symbol up from a scope finds the same value.
+  static inline uint64_t binding_generation = 0;
+  // Identifies the scope; unlike its address, never reused by another one.
+  const uint64_t id;
+  std::optional<Value> get(Symbol sym) const;
+  // lookup returns the stored value without copying it. The pointer is only
+  // valid until the variable is next assigned or removed.
+  const Value *lookup(Symbol sym) const;
+  const Value *lookup(const std::string &name) const;
   std::optional<Value> get(const std::string &name) const;
   std::optional<Value> get_local(const std::string &name) const;
+  // assignable returns the binding set() would overwrite, or null when set()
+  // would create a new variable or reject the assignment.
+  Value *assignable(Symbol sym);
+  Value *assignable(Symbol sym, CachedBinding &cache) {
+    if (cache.env != id || cache.generation != binding_generation) {
+      cache.value = assignable(sym);
+      cache.env = id;
+      cache.generation = binding_generation;
+    }
+    return cache.value;
+  }
+  void set(Symbol sym, Value val);
   void set(const std::string &name, Value val);
+  void set_local(Symbol sym, Value val);
   void set_local(const std::string &name, Value val);
   bool has(const std::string &name) const;
   bool has_local(const std::string &name) const;
+  bool has_local(Symbol sym) const { return vars.contains(sym); }
   bool remove(const std::string &name);
+  void clear() {
+    if (vars.empty()) return;
+    vars.clear();
+    ++binding_generation;
+  }
+  // Removes every variable except sym, keeping its slot for reassignment.
+  void clear_except(Symbol sym) {
+    if (vars.size() == 1 && vars.begin()->first == sym) return;
+    if (std::erase_if(vars,
+                      [sym](const auto &var) { return var.first != sym; }))
+      ++binding_generation;
+  }
+  void clear_except(const std::vector<Symbol> &keep) {
+    if (std::erase_if(vars, [&keep](const auto &var) {
+          return std::find(keep.begin(), keep.end(), var.first) == keep.end();
+        }))
+      ++binding_generation;
+  }
   std::vector<std::string> local_keys() const;
+  size_t local_size() const { return vars.size(); }
   std::vector<std::string> keys() const;
   std::shared_ptr<Environment> parent;
 
  private:
-  std::unordered_map<std::string, Variable> vars;
+  std::unordered_map<Symbol, Value> vars;
 };
 
+inline const Value *Environment::lookup(const std::string &name) const {
+  auto sym = find_symbol(name);
+  return sym ? lookup(*sym) : nullptr;
+}
+
+inline std::optional<Value> Environment::get(const std::string &name) const {
+  auto sym = find_symbol(name);
+  if (!sym) return std::nullopt;
+  return get(*sym);
+}
+
 inline std::optional<Value> Environment::get_local(
     const std::string &name) const {
-  auto it = vars.find(name);
-  if (it != vars.end()) return it->second.value;
+  auto sym = find_symbol(name);
+  if (!sym) return std::nullopt;
+  auto it = vars.find(*sym);
+  if (it != vars.end()) return it->second;
   return std::nullopt;
 }
 
+inline void Environment::set(const std::string &name, Value val) {
+  set(intern(name), std::move(val));
+}
+
+inline void Environment::set_local(Symbol sym, Value val) {
+  if (vars.insert_or_assign(sym, std::move(val)).second) ++binding_generation;
+}
+
 inline void Environment::set_local(const std::string &name, Value val) {
-  vars[name] = Variable{std::move(val), std::string{}};
+  set_local(intern(name), std::move(val));
 }
 
 inline std::vector<std::string> Environment::local_keys() const {
   std::vector<std::string> result;
   result.reserve(vars.size());
   for (const auto &entry : vars) {
-    result.push_back(entry.first);
+    result.push_back(symbol_name(entry.first));
   }
   return result;
 }
 
 inline std::vector<std::string> Environment::keys() const {
-  std::vector<std::string> result = local_keys();
-  if (parent) {
-    std::vector<std::string> parent_keys = parent->keys();
-    result.insert(result.end(), parent_keys.begin(), parent_keys.end());
+  std::vector<std::string> result;
+  for (const Environment *e = this; e; e = e->parent.get()) {
+    for (const auto &entry : e->vars)
+      result.push_back(symbol_name(entry.first));
   }
   return result;
 }
 
 inline bool Environment::has_local(const std::string &name) const {
-  return vars.find(name) != vars.end();
+  auto sym = find_symbol(name);
+  return sym && has_local(*sym);
 }
 
 inline bool Environment::has(const std::string &name) const {
-  if (vars.find(name) != vars.end()) return true;
-  if (parent) return parent->has(name);
+  auto sym = find_symbol(name);
+  if (!sym) return false;
+  for (const Environment *e = this; e; e = e->parent.get()) {
+    if (e->vars.contains(*sym)) return true;
+  }
   return false;
 }
 
 inline bool Environment::remove(const std::string &name) {
-  auto it = vars.find(name);
-  if (it != vars.end()) {
-    vars.erase(it);
-    return true;
+  auto sym = find_symbol(name);
+  if (!sym) return false;
+  for (Environment *e = this; e; e = e->parent.get()) {
+    auto it = e->vars.find(*sym);
+    if (it != e->vars.end()) {
+      e->vars.erase(it);
+      ++binding_generation;
+      return true;
+    }
   }
-  if (parent) return parent->remove(name);
   return false;
 }
 
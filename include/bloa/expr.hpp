@@ -0,0 +1,165 @@
+#pragma once
+#include <cstdint>
+#include <memory>
+#include <string>
+#include <vector>
+
+#include "bloa/env.hpp"
+
+namespace bloa {
+
+// Expressions are compiled once from their source text into a tree that the
+// interpreter evaluates directly. The tree mirrors the evaluation order of
+// the expression grammar: || over && over comparisons over + - over * / %
+// over ^ over unary operators over primaries.
+enum class ExprKind : uint8_t {
+  Literal,
+  List,
+  Name,
+  New,
+  Not,
+  Ref,
+  Deref,
+  Binary,
+  And,
+  Or,
+  Source,
+};
+
+enum class BinaryOp : uint8_t {
+  Add,
+  Sub,
+  Mul,
+  Div,
+  Mod,
+  Pow,
+  Eq,
+  Ne,
+  Lt,
+  Le,
+  Gt,
+  Ge
+};
+
+struct FunctionDefEntry;
+struct ClassDefEntry;
+
+struct Expr;
+using ExprPtr = std::shared_ptr<const Expr>;
+using ExprList = std::vector<ExprPtr>;
+
+struct Expr {
+  ExprKind kind;
+  // Whether evaluating the expression can run user code or builtins, and so
+  // modify variables. Expressions without calls only read their operands.
+  bool has_calls = false;
+  explicit Expr(ExprKind k, bool calls = false) : kind(k), has_calls(calls) {}
+  virtual ~Expr() = default;
+};
+
+inline bool any_calls(const ExprList &exprs) {
+  for (const auto &e : exprs)
+    if (e->has_calls) return true;
+  return false;
+}
+
+struct LiteralExpr : Expr {
+  Value value;
+  LiteralExpr(Value v) : Expr(ExprKind::Literal), value(std::move(v)) {}
+};
+struct ListExpr : Expr {
+  ExprList elems;
+  ListExpr(ExprList e)
+      : Expr(ExprKind::List, any_calls(e)), elems(std::move(e)) {}
+};
+
+// A call, subscript, property access or method call applied after a name.
+// A method call caches the method it last called, with the receiver's class
+// and the interpreter generation it was found for.
+struct Postfix {
+  enum class Kind : uint8_t { Call, Index, Member, MethodCall } kind;
+  std::string member;
+  ExprList args;          // call arguments, or the single subscript expression
+  Symbol member_sym = 0;  // the property name, interned for Member
+  mutable uint64_t resolved_generation = 0;
+  mutable std::string resolved_class;
+  mutable const FunctionDefEntry *method = nullptr;
+};
+
+// An identifier followed by any number of postfix operations. Calls resolve
+// against the identifier itself, so the name is kept alongside its symbol.
+// The function or class the identifier names is cached on the node and
+// reused for as long as the interpreter's definitions stay unchanged, and
+// the variable it names is cached the same way against the scope it was
+// looked up from; see Environment::binding_generation.
+struct NameExpr : Expr {
+  std::string id;
+  Symbol sym;
+  std::vector<Postfix> chain;
+  mutable uint64_t bound_generation = 0;
+  mutable uint64_t bound_env = 0;
+  mutable const Value *binding = nullptr;
+  mutable uint64_t resolved_generation = 0;
+  mutable const FunctionDefEntry *function = nullptr;
+  mutable const ClassDefEntry *class_def = nullptr;
+  NameExpr(std::string i, std::vector<Postfix> c)
+      : Expr(ExprKind::Name),
+        id(std::move(i)),
+        sym(intern(id)),
+        chain(std::move(c)) {
+    for (const auto &op : chain) {
+      if (op.kind == Postfix::Kind::Call ||
+          op.kind == Postfix::Kind::MethodCall || any_calls(op.args))
+        has_calls = true;
+    }
+  }
+};
+struct NewExpr : Expr {
+  std::string class_name;
+  ExprList args;
+  NewExpr(std::string c, ExprList a)
+      : Expr(ExprKind::New, true),
+        class_name(std::move(c)),
+        args(std::move(a)) {}
+};
+struct UnaryExpr : Expr {
+  ExprPtr operand;
+  UnaryExpr(ExprKind k, ExprPtr o)
+      : Expr(k, o->has_calls), operand(std::move(o)) {}
+};
+struct RefExpr : Expr {
+  std::string name;
+  RefExpr(std::string n) : Expr(ExprKind::Ref), name(std::move(n)) {}
+};
+struct BinaryExpr : Expr {
+  BinaryOp op;
+  ExprPtr lhs;
+  ExprPtr rhs;
+  BinaryExpr(BinaryOp o, ExprPtr l, ExprPtr r)
+      : Expr(ExprKind::Binary, l->has_calls || r->has_calls),
+        op(o),
+        lhs(std::move(l)),
+        rhs(std::move(r)) {}
+};
+
+// A chain of && (kind And) or || (kind Or) operands. A false operand in an
+// && chain ends the whole expression with false, even under an enclosing ||.
+struct LogicalExpr : Expr {
+  ExprList terms;
+  LogicalExpr(ExprKind k, ExprList t)
+      : Expr(k, any_calls(t)), terms(std::move(t)) {}
+};
+
+// Source text that did not compile. It is evaluated by the original
+// evaluating parser so that partial side effects and errors are unchanged.
+struct SourceExpr : Expr {
+  std::string text;
+  SourceExpr(std::string t)
+      : Expr(ExprKind::Source, true), text(std::move(t)) {}
+};
+
+// compile_expression never throws; text with a syntax error compiles to a
+// SourceExpr.
+ExprPtr compile_expression(const std::string &text);
+
+}  // namespace bloa
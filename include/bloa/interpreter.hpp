@@ -4,10 +4,38 @@
 #include <unordered_map>
 
 #include "bloa/ast.hpp"
+#include "bloa/bytecode.hpp"
 #include "bloa/env.hpp"
+#include "bloa/expr.hpp"
 
 namespace bloa {
 
+struct FunctionDefEntry {
+  std::vector<Symbol> params;
+  std::shared_ptr<const Code> code;
+  std::shared_ptr<Environment> def_env;
+  // The scope of the last call, reused by the next call once nothing else
+  // holds on to it.
+  mutable std::shared_ptr<Environment> frame;
+  // A pure recursive function's result depends only on its arguments, so
+  // it is remembered per argument list.
+  bool pure = false;
+  mutable std::unordered_map<std::string, Value> results;
+};
+
+struct ClassDefEntry {
+  std::string name;
+  std::optional<std::string> parent;
+  std::unordered_map<std::string, FunctionDefEntry> methods;
+  std::shared_ptr<Environment> class_env;
+};
+
+// A module run by `use`, with the code it was run from.
+struct LoadedModule {
+  std::shared_ptr<const Code> code;
+  std::shared_ptr<Environment> env;
+};
+
 class Interpreter {
  public:
   Interpreter(std::string stdlib_path = "", const std::string &source = "");
@@ -15,23 +43,18 @@ class Interpreter {
   void run(const std::string &code, const std::string &filename = "<string>");
   Value eval_expr(const std::string &expr, std::shared_ptr<Environment> env);
   Value execute_block(const NodeList &nodes, std::shared_ptr<Environment> env);
+  Value execute(const Code &code, std::shared_ptr<Environment> env);
 
  private:
+  // Set up on first use, so that interpreters which only run module code
+  // never build it.
   std::shared_ptr<Environment> global_env;
-  struct FunctionDefEntry {
-    std::vector<std::string> params;
-    NodeList block;
-    std::shared_ptr<Environment> def_env;
-  };
-  struct ClassDefEntry {
-    std::string name;
-    std::optional<std::string> parent;
-    std::unordered_map<std::string, FunctionDefEntry> methods;
-    std::shared_ptr<Environment> class_env;
-  };
+  const std::shared_ptr<Environment> &globals();
   std::unordered_map<std::string, FunctionDefEntry> functions;
   std::unordered_map<std::string, ClassDefEntry> classes;
-  std::unordered_map<std::string, std::shared_ptr<Environment>> loaded_modules;
+  // Changes whenever functions or classes change; see resolve_call.
+  uint64_t generation;
+  std::unordered_map<std::string, LoadedModule> loaded_modules;
   std::string stdlib_path;
 
   // helpers for expression parsing
@@ -39,6 +62,29 @@ class Interpreter {
   size_t pos = 0;
   // parse expression helpers (implemented in .cpp)
   Value parse_expression(std::string expr, std::shared_ptr<Environment> env);
+
+  // evaluation of compiled expressions
+  Value evaluate(const Expr &expr, const std::shared_ptr<Environment> &env);
+  const Value &operand(const Expr &expr,
+                       const std::shared_ptr<Environment> &env, Value &scratch);
+  Value update_in_place(const Value &target, Symbol sym, const Expr &rhs,
+                        const std::shared_ptr<Environment> &env);
+  Value evaluate_name(const NameExpr &name,
+                      const std::shared_ptr<Environment> &env);
+  Value instantiate(const std::string &class_name,
+                    const ClassDefEntry &class_def,
+                    const std::vector<Value> &args);
+  void resolve_call(const NameExpr &name);
+  Value call_function(const std::string &name, const std::vector<Value> &args);
+  Value invoke(const std::string &name, const FunctionDefEntry &entry,
+               const std::vector<Value> &args);
+  const FunctionDefEntry &find_method(const std::string &class_name,
+                                      const std::string &member);
+  Value call_method(const Value &self, const std::string &member,
+                    const std::vector<Value> &args);
+  Value invoke_method(const Value &self, const std::string &member,
+                      const FunctionDefEntry &method,
+                      const std::vector<Value> &args);
 };
 
 }  // namespace bloa
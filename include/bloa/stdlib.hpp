@@ -6,7 +6,16 @@
 
 namespace bloa {
 
+using BuiltinHandler = Value (*)(const std::string &marker,
+                                 const std::vector<Value> &args,
+                                 const std::shared_ptr<Environment> &env);
+// A builtin's marker and handler. Entries live for the whole program.
+using Builtin = std::pair<const std::string, BuiltinHandler>;
+
 void register_stdlib(std::shared_ptr<Environment> env);
+const Builtin *find_builtin(const std::string &marker);
+// What len() returns for arg, for callers that can pass it without a copy.
+Value value_length(const Value &arg);
 Value handle_builtin(const std::string &marker, const std::vector<Value> &args,
                      std::shared_ptr<Environment> env = nullptr);
 std::vector<std::pair<std::string, std::string>> read_archive(
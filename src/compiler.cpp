@@ -0,0 +1,421 @@
+#include <limits>
+#include <optional>
+#include <sstream>
+
+#include "bloa/bytecode.hpp"
+
+namespace bloa {
+
+namespace {
+
+struct Depth {
+  int scopes;
+  int loops;
+  int handlers;
+};
+
+struct LoopContext {
+  int continue_target;
+  Depth continue_depth;
+  Depth break_depth;
+  std::vector<int> break_jumps;
+};
+
+class Compiler {
+ public:
+  explicit Compiler(Code &code) : code(code) {}
+
+  void compile_block(const NodeList &nodes) {
+    for (size_t i = 0; i < nodes.size();) {
+      if (nodes[i]->kind != NodeKind::Say) {
+        compile_node(nodes[i++]);
+        continue;
+      }
+      // A run of says is written by a single instruction
+      int first = add_expr(static_cast<const Say &>(*nodes[i++]).expr);
+      int count = 1;
+      for (; i < nodes.size() && nodes[i]->kind == NodeKind::Say; ++i, ++count)
+        add_expr(static_cast<const Say &>(*nodes[i]).expr);
+      emit(Op::Say, first, count);
+    }
+  }
+
+ private:
+  Code &code;
+  Depth depth{0, 0, 0};
+  std::vector<LoopContext> loops;
+
+  int emit(Op op, int a = 0, int b = 0, int c = 0) {
+    code.instrs.push_back(Instr{op, a, b, c});
+    return static_cast<int>(code.instrs.size()) - 1;
+  }
+
+  int here() const { return static_cast<int>(code.instrs.size()); }
+
+  void patch(int at, int target) { code.instrs[at].b = target; }
+
+  int add_expr(const std::string &expr) {
+    return add_expr(compile_expression(expr));
+  }
+
+  int add_expr(ExprPtr expr) {
+    code.exprs.push_back(std::move(expr));
+    return static_cast<int>(code.exprs.size()) - 1;
+  }
+
+  int add_name(const std::string &name) {
+    code.names.push_back(name);
+    return static_cast<int>(code.names.size()) - 1;
+  }
+
+  int add_symbol(const std::string &name) {
+    code.symbols.push_back(intern(name));
+    return static_cast<int>(code.symbols.size()) - 1;
+  }
+
+  int add_node(const NodePtr &node) {
+    code.nodes.push_back(node);
+    return static_cast<int>(code.nodes.size()) - 1;
+  }
+
+  int add_child(const NodeList &block) {
+    code.children.push_back(compile(block));
+    return static_cast<int>(code.children.size()) - 1;
+  }
+
+  // The truth value of a condition made only of literals, negation and
+  // comparisons that need no conversion, such as true, !false or 1 == 1.
+  static std::optional<bool> constant_condition(const Expr &cond) {
+    switch (cond.kind) {
+      case ExprKind::Literal: {
+        const auto &v = static_cast<const LiteralExpr &>(cond).value.v;
+        if (auto b = std::get_if<bool>(&v)) return *b;
+        if (auto i = std::get_if<int64_t>(&v)) return *i != 0;
+        if (auto str = std::get_if<std::string>(&v)) return !str->empty();
+        if (auto list = std::get_if<std::vector<Value>>(&v))
+          return !list->empty();
+        if (std::holds_alternative<std::monostate>(v)) return false;
+        return std::nullopt;
+      }
+      case ExprKind::Not: {
+        auto known =
+            constant_condition(*static_cast<const UnaryExpr &>(cond).operand);
+        if (known) return !*known;
+        return std::nullopt;
+      }
+      case ExprKind::Binary:
+        return constant_comparison(static_cast<const BinaryExpr &>(cond));
+      default:
+        return std::nullopt;
+    }
+  }
+
+  // Mirrors the interpreter's comparisons for integer, string and boolean
+  // literals. Anything involving a float is left to run time.
+  static std::optional<bool> constant_comparison(const BinaryExpr &bin) {
+    if (bin.lhs->kind != ExprKind::Literal ||
+        bin.rhs->kind != ExprKind::Literal)
+      return std::nullopt;
+    const auto &l = static_cast<const LiteralExpr &>(*bin.lhs).value.v;
+    const auto &r = static_cast<const LiteralExpr &>(*bin.rhs).value.v;
+    if (std::holds_alternative<double>(l) || std::holds_alternative<double>(r))
+      return std::nullopt;
+    auto li = std::get_if<int64_t>(&l);
+    auto ri = std::get_if<int64_t>(&r);
+    switch (bin.op) {
+      case BinaryOp::Eq:
+      case BinaryOp::Ne: {
+        // Values of mismatched types are never equal
+        bool equal = false;
+        if (li && ri) {
+          equal = *li == *ri;
+        } else if (auto ls = std::get_if<std::string>(&l),
+                   rs = std::get_if<std::string>(&r);
+                   ls && rs) {
+          equal = *ls == *rs;
+        } else if (auto lb = std::get_if<bool>(&l), rb = std::get_if<bool>(&r);
+                   lb && rb) {
+          equal = *lb == *rb;
+        }
+        return bin.op == BinaryOp::Eq ? equal : !equal;
+      }
+      case BinaryOp::Lt:
+        if (li && ri) return *li < *ri;
+        return std::nullopt;
+      case BinaryOp::Le:
+        if (li && ri) return *li <= *ri;
+        return std::nullopt;
+      case BinaryOp::Gt:
+        if (li && ri) return *li > *ri;
+        return std::nullopt;
+      case BinaryOp::Ge:
+        if (li && ri) return *li >= *ri;
+        return std::nullopt;
+      default:
+        return std::nullopt;
+    }
+  }
+
+  // The iteration count of a repeat whose count is a valid integer literal.
+  static std::optional<int> constant_count(const Expr &times) {
+    if (times.kind != ExprKind::Literal) return std::nullopt;
+    const auto &value = static_cast<const LiteralExpr &>(times).value;
+    auto n = std::get_if<int64_t>(&value.v);
+    if (!n || *n < 0 || *n > std::numeric_limits<int32_t>::max())
+      return std::nullopt;
+    return static_cast<int>(*n);
+  }
+
+  // The compiled expressions of a block made only of says of literals.
+  static std::optional<ExprList> literal_says(const NodeList &nodes) {
+    if (nodes.empty()) return std::nullopt;
+    ExprList lines;
+    for (const auto &node : nodes) {
+      if (node->kind != NodeKind::Say) return std::nullopt;
+      ExprPtr line = compile_expression(static_cast<const Say &>(*node).expr);
+      if (line->kind != ExprKind::Literal) return std::nullopt;
+      lines.push_back(std::move(line));
+    }
+    return lines;
+  }
+
+  void unwind_to(const Depth &target) {
+    if (target.scopes == depth.scopes && target.loops == depth.loops &&
+        target.handlers == depth.handlers)
+      return;
+    emit(Op::Unwind, target.scopes, target.loops, target.handlers);
+  }
+
+  // Whether running the statements can add a variable to the scope they run
+  // in. Nested blocks and loops get scopes of their own.
+  static bool binds_names(const NodeList &nodes) {
+    for (const auto &node : nodes) {
+      switch (node->kind) {
+        case NodeKind::Ask:
+        case NodeKind::Assign:
+        case NodeKind::Declare:
+        case NodeKind::FunctionDef:
+        case NodeKind::ClassDef:
+        case NodeKind::Import:
+        case NodeKind::Require:
+          return true;
+        default:
+          break;
+      }
+    }
+    return false;
+  }
+
+  // A block gets its own scope only if it could put a variable in it.
+  void scoped_block(const NodeList &nodes) {
+    if (!binds_names(nodes)) {
+      compile_block(nodes);
+      return;
+    }
+    emit(Op::PushScope);
+    depth.scopes++;
+    compile_block(nodes);
+    depth.scopes--;
+    emit(Op::PopScope);
+  }
+
+  // Lowers the shared shape of repeat, for-in and while loops: the Next
+  // instruction opens a fresh scope for each iteration and exits once the
+  // loop is done, reusing the iteration scope held on the VM's loop stack.
+  void counted_loop(Op next_op, int next_a, const NodeList &body) {
+    Depth outer{depth.scopes, depth.loops - 1, depth.handlers};
+    int top = here();
+    int next = emit(next_op, next_a);
+    loops.push_back(LoopContext{
+        top, Depth{outer.scopes, depth.loops, outer.handlers}, outer, {}});
+    depth.scopes++;
+    compile_block(body);
+    depth.scopes--;
+    emit(Op::PopScope);
+    emit(Op::Jump, 0, top);
+    depth.loops--;
+    finish_loop(next);
+  }
+
+  void finish_loop(int exit_jump) {
+    int end = here();
+    patch(exit_jump, end);
+    for (int j : loops.back().break_jumps) patch(j, end);
+    loops.pop_back();
+  }
+
+  void compile_node(const NodePtr &node) {
+    switch (node->kind) {
+      case NodeKind::Say:
+        emit(Op::Say, add_expr(static_cast<const Say &>(*node).expr), 1);
+        break;
+      case NodeKind::Ask: {
+        const auto &ask = static_cast<const Ask &>(*node);
+        emit(Op::Ask, add_symbol(ask.var), add_expr(ask.prompt));
+        break;
+      }
+      case NodeKind::Declare: {
+        const auto &decl = static_cast<const Declare &>(*node);
+        emit(Op::Declare, add_symbol(decl.name), add_expr(decl.expr));
+        break;
+      }
+      case NodeKind::Assign: {
+        const auto &asg = static_cast<const Assign &>(*node);
+        code.bindings.emplace_back();
+        emit(Op::Assign, add_symbol(asg.name), add_expr(asg.expr),
+             static_cast<int>(code.bindings.size()) - 1);
+        break;
+      }
+      case NodeKind::MemberAssign: {
+        const auto &masg = static_cast<const MemberAssign &>(*node);
+        emit(Op::MemberAssign, add_symbol(masg.object), add_expr(masg.expr),
+             add_symbol(masg.member));
+        break;
+      }
+      case NodeKind::If: {
+        const auto &iff = static_cast<const If &>(*node);
+        ExprPtr cond = compile_expression(iff.cond);
+        if (auto known = constant_condition(*cond)) {
+          // Only the branch that would run is compiled
+          const NodeList &taken = *known ? iff.then_block : iff.else_block;
+          if (!taken.empty()) scoped_block(taken);
+          break;
+        }
+        int to_else = emit(Op::JumpIfFalse, add_expr(std::move(cond)));
+        scoped_block(iff.then_block);
+        if (iff.else_block.empty()) {
+          patch(to_else, here());
+        } else {
+          int to_end = emit(Op::Jump);
+          patch(to_else, here());
+          scoped_block(iff.else_block);
+          patch(to_end, here());
+        }
+        break;
+      }
+      case NodeKind::Repeat: {
+        const auto &rep = static_cast<const Repeat &>(*node);
+        ExprPtr times = compile_expression(rep.times_expr);
+        if (auto lines = literal_says(rep.block)) {
+          // Nothing in the body can change between iterations
+          int count = add_expr(std::move(times));
+          int first = static_cast<int>(code.exprs.size());
+          for (auto &line : *lines) add_expr(std::move(line));
+          emit(Op::RepeatSay, count, first, static_cast<int>(lines->size()));
+          break;
+        }
+        if (auto count = constant_count(*times))
+          emit(Op::RepeatInit, -1, *count);
+        else
+          emit(Op::RepeatInit, add_expr(std::move(times)));
+        depth.loops++;
+        counted_loop(Op::RepeatNext, 0, rep.block);
+        break;
+      }
+      case NodeKind::ForIn: {
+        const auto &fin = static_cast<const ForIn &>(*node);
+        emit(Op::ForInit, add_expr(fin.iterable));
+        depth.loops++;
+        counted_loop(Op::ForNext, add_symbol(fin.var), fin.block);
+        break;
+      }
+      case NodeKind::While: {
+        const auto &wh = static_cast<const While &>(*node);
+        ExprPtr cond = compile_expression(wh.cond);
+        if (constant_condition(*cond) == false) break;
+        emit(Op::WhileInit);
+        depth.loops++;
+        counted_loop(Op::WhileNext, add_expr(std::move(cond)), wh.block);
+        break;
+      }
+      case NodeKind::Break:
+        if (loops.empty()) {
+          emit(Op::Fail, add_name("'break' outside of a loop"));
+          break;
+        }
+        unwind_to(loops.back().break_depth);
+        loops.back().break_jumps.push_back(emit(Op::Jump));
+        break;
+      case NodeKind::Continue:
+        if (loops.empty()) {
+          emit(Op::Fail, add_name("'continue' outside of a loop"));
+          break;
+        }
+        unwind_to(loops.back().continue_depth);
+        emit(Op::Jump, 0, loops.back().continue_target);
+        break;
+      case NodeKind::TryExcept: {
+        const auto &te = static_cast<const TryExcept &>(*node);
+        if (te.except_block.empty()) {
+          // Without a handler the error propagates unchanged.
+          scoped_block(te.try_block);
+          break;
+        }
+        int setup = emit(Op::SetupExcept);
+        depth.handlers++;
+        scoped_block(te.try_block);
+        depth.handlers--;
+        emit(Op::PopExcept);
+        int to_end = emit(Op::Jump);
+        patch(setup, here());
+        scoped_block(te.except_block);
+        patch(to_end, here());
+        break;
+      }
+      case NodeKind::FunctionDef:
+        emit(Op::DefineFunction, add_node(node),
+             add_child(static_cast<const FunctionDef &>(*node).block));
+        break;
+      case NodeKind::ClassDef: {
+        int first = static_cast<int>(code.children.size());
+        for (const auto &stmt : static_cast<const ClassDef &>(*node).block) {
+          if (stmt->kind == NodeKind::FunctionDef)
+            add_child(static_cast<const FunctionDef &>(*stmt).block);
+        }
+        emit(Op::DefineClass, add_node(node), first);
+        break;
+      }
+      case NodeKind::FunctionCall: {
+        const auto &fc = static_cast<const FunctionCall &>(*node);
+        std::ostringstream call;
+        call << fc.name << '(';
+        for (size_t i = 0; i < fc.args.size(); ++i) {
+          if (i > 0) call << ", ";
+          call << fc.args[i];
+        }
+        call << ')';
+        emit(Op::Eval, add_expr(call.str()));
+        break;
+      }
+      case NodeKind::Return: {
+        const auto &ret = static_cast<const Return &>(*node);
+        emit(Op::Return, ret.expr ? add_expr(*ret.expr) : -1);
+        break;
+      }
+      case NodeKind::Import:
+        emit(Op::Import, add_node(node));
+        break;
+      case NodeKind::Require:
+        emit(Op::Require, add_node(node));
+        break;
+      case NodeKind::ExprStmt:
+        emit(Op::Eval, add_expr(static_cast<const ExprStmt &>(*node).expr));
+        break;
+      default:
+        emit(Op::Fail, add_name("Unknown AST node"));
+        break;
+    }
+  }
+};
+
+}  // namespace
+
+std::shared_ptr<const Code> compile(const NodeList &nodes) {
+  auto code = std::make_shared<Code>();
+  Compiler compiler(*code);
+  compiler.compile_block(nodes);
+  code->instrs.push_back(Instr{Op::Halt});
+  return code;
+}
+
+}  // namespace bloa
@@ -0,0 +1,358 @@
+#include "bloa/expr.hpp"
+
+#include <cctype>
+#include <stdexcept>
+
+namespace bloa {
+
+namespace {
+
+bool is_ident_start(char c) {
+  return std::isalpha(static_cast<unsigned char>(c)) || c == '_';
+}
+
+bool is_ident_continue(char c) {
+  return std::isalnum(static_cast<unsigned char>(c)) || c == '_' || c == '\'';
+}
+
+std::string trim(const std::string &s) {
+  size_t a = s.find_first_not_of(" \t\r\n");
+  if (a == std::string::npos) return "";
+  size_t b = s.find_last_not_of(" \t\r\n");
+  return s.substr(a, (b - a + 1));
+}
+
+// Builds the tree with the same recursive descent the evaluating parser in
+// the interpreter uses, so both accept exactly the same text.
+class ExprCompiler {
+ public:
+  explicit ExprCompiler(const std::string &text) : s(text) {}
+
+  ExprPtr compile() { return parse_or(); }
+
+ private:
+  const std::string &s;
+  size_t pos = 0;
+
+  [[noreturn]] void error(const std::string &msg) const {
+    throw std::runtime_error(msg);
+  }
+
+  void skip_space() {
+    while (pos < s.size() && std::isspace(static_cast<unsigned char>(s[pos])))
+      ++pos;
+  }
+
+  bool match(char c) {
+    skip_space();
+    if (pos < s.size() && s[pos] == c) {
+      ++pos;
+      return true;
+    }
+    return false;
+  }
+
+  bool match_keyword(const std::string &kw) {
+    skip_space();
+    if (pos + kw.size() <= s.size() && s.compare(pos, kw.size(), kw) == 0) {
+      if (pos + kw.size() == s.size() ||
+          !is_ident_continue(s[pos + kw.size()])) {
+        pos += kw.size();
+        return true;
+      }
+    }
+    return false;
+  }
+
+  std::string identifier() {
+    size_t start = pos;
+    ++pos;
+    while (pos < s.size() && is_ident_continue(s[pos])) ++pos;
+    return s.substr(start, pos - start);
+  }
+
+  ExprList arguments() {
+    ExprList args;
+    if (match(')')) return args;
+    while (true) {
+      args.push_back(parse_expr());
+      if (match(')')) break;
+      if (!match(',')) error("Expected ',' or ')' in argument list");
+    }
+    return args;
+  }
+
+  ExprPtr string_literal() {
+    char quote = s[pos++];
+    std::string out;
+    while (pos < s.size() && s[pos] != quote) {
+      if (s[pos] == '\\' && pos + 1 < s.size()) {
+        ++pos;
+        switch (s[pos]) {
+          case 'n':
+            out.push_back('\n');
+            break;
+          case 't':
+            out.push_back('\t');
+            break;
+          case 'r':
+            out.push_back('\r');
+            break;
+          case '\\':
+            out.push_back('\\');
+            break;
+          case '\'':
+            out.push_back('\'');
+            break;
+          case '\"':
+            out.push_back('\"');
+            break;
+          default:
+            out.push_back('\\');
+            out.push_back(s[pos]);
+            break;
+        }
+        ++pos;
+      } else {
+        out.push_back(s[pos++]);
+      }
+    }
+    if (pos >= s.size()) error("Unterminated string literal");
+    ++pos;
+    return std::make_shared<LiteralExpr>(Value::make_str(std::move(out)));
+  }
+
+  ExprPtr number_literal() {
+    size_t start = pos;
+    if (s[pos] == '-') ++pos;
+    while (pos < s.size() && std::isdigit(static_cast<unsigned char>(s[pos])))
+      ++pos;
+    bool is_float = false;
+    if (pos < s.size() && s[pos] == '.') {
+      is_float = true;
+      ++pos;
+      while (pos < s.size() && std::isdigit(static_cast<unsigned char>(s[pos])))
+        ++pos;
+    }
+    std::string num_str = s.substr(start, pos - start);
+    if (is_float)
+      return std::make_shared<LiteralExpr>(
+          Value::make_double(std::stod(num_str)));
+    return std::make_shared<LiteralExpr>(Value::make_int(std::stoll(num_str)));
+  }
+
+  // A list whose elements are all literals is built once, here, rather than
+  // element by element each time it is evaluated.
+  static ExprPtr list_literal(ExprList elems) {
+    std::vector<Value> values;
+    values.reserve(elems.size());
+    for (const auto &e : elems) {
+      if (e->kind != ExprKind::Literal)
+        return std::make_shared<ListExpr>(std::move(elems));
+      values.push_back(static_cast<const LiteralExpr &>(*e).value);
+    }
+    return std::make_shared<LiteralExpr>(Value::make_list(std::move(values)));
+  }
+
+  ExprPtr parse_primary() {
+    skip_space();
+    if (pos >= s.size()) error("Unexpected end of expression");
+
+    if (match('(')) {
+      ExprPtr e = parse_expr();
+      if (!match(')')) error("Expected ')'");
+      return e;
+    }
+
+    if (match('[')) {
+      ExprList elems;
+      if (match(']')) return list_literal(std::move(elems));
+      while (true) {
+        elems.push_back(parse_expr());
+        if (match(']')) break;
+        if (!match(',')) error("Expected ',' or ']' in list literal");
+      }
+      return list_literal(std::move(elems));
+    }
+
+    if (s[pos] == '\"' || s[pos] == '\'') return string_literal();
+
+    if (std::isdigit(static_cast<unsigned char>(s[pos])) ||
+        (s[pos] == '-' && pos + 1 < s.size() &&
+         std::isdigit(static_cast<unsigned char>(s[pos + 1])))) {
+      return number_literal();
+    }
+
+    if (match_keyword("new")) {
+      skip_space();
+      if (pos >= s.size() || !is_ident_start(s[pos]))
+        error("Expected class name after 'new'");
+      std::string class_name = identifier();
+      ExprList args;
+      if (match('(')) args = arguments();
+      return std::make_shared<NewExpr>(std::move(class_name), std::move(args));
+    }
+
+    if (is_ident_start(s[pos])) {
+      std::string id = identifier();
+      if (id == "true")
+        return std::make_shared<LiteralExpr>(Value::make_bool(true));
+      if (id == "false")
+        return std::make_shared<LiteralExpr>(Value::make_bool(false));
+      if (id == "null") return std::make_shared<LiteralExpr>(Value());
+
+      std::vector<Postfix> chain;
+      while (true) {
+        skip_space();
+        if (match('(')) {
+          chain.push_back(Postfix{Postfix::Kind::Call, {}, arguments()});
+          continue;
+        }
+        if (match('[')) {
+          ExprList index{parse_expr()};
+          if (!match(']')) error("Expected ']'");
+          chain.push_back(Postfix{Postfix::Kind::Index, {}, std::move(index)});
+          continue;
+        }
+        if (match('.')) {
+          skip_space();
+          size_t member_start = pos;
+          while (pos < s.size() && is_ident_continue(s[pos])) ++pos;
+          if (member_start == pos) error("Expected member name after '.'");
+          std::string member = s.substr(member_start, pos - member_start);
+          skip_space();
+          if (match('(')) {
+            chain.push_back(Postfix{Postfix::Kind::MethodCall,
+                                    std::move(member), arguments()});
+          } else {
+            Symbol sym = intern(member);
+            chain.push_back(
+                Postfix{Postfix::Kind::Member, std::move(member), {}, sym});
+          }
+          continue;
+        }
+        break;
+      }
+      return std::make_shared<NameExpr>(std::move(id), std::move(chain));
+    }
+
+    error("Unexpected token: '" + std::string(1, s[pos]) + "'");
+  }
+
+  ExprPtr parse_unary() {
+    skip_space();
+    if (match('!'))
+      return std::make_shared<UnaryExpr>(ExprKind::Not, parse_unary());
+    if (match('&')) {
+      skip_space();
+      if (pos >= s.size() || !is_ident_start(s[pos]))
+        error("Expected identifier after '&'");
+      return std::make_shared<RefExpr>(identifier());
+    }
+    if (match('*'))
+      return std::make_shared<UnaryExpr>(ExprKind::Deref, parse_unary());
+    return parse_primary();
+  }
+
+  ExprPtr parse_power() {
+    ExprPtr left = parse_unary();
+    while (match('^'))
+      left = std::make_shared<BinaryExpr>(BinaryOp::Pow, left, parse_unary());
+    return left;
+  }
+
+  ExprPtr parse_term() {
+    ExprPtr left = parse_power();
+    while (true) {
+      skip_space();
+      if (pos >= s.size()) break;
+      BinaryOp op;
+      if (s[pos] == '*') {
+        op = BinaryOp::Mul;
+      } else if (s[pos] == '/') {
+        op = BinaryOp::Div;
+      } else if (s[pos] == '%') {
+        op = BinaryOp::Mod;
+      } else {
+        break;
+      }
+      ++pos;
+      left = std::make_shared<BinaryExpr>(op, left, parse_power());
+    }
+    return left;
+  }
+
+  ExprPtr parse_expr() {
+    ExprPtr left = parse_term();
+    while (true) {
+      skip_space();
+      if (pos >= s.size() || (s[pos] != '+' && s[pos] != '-')) break;
+      BinaryOp op = s[pos++] == '+' ? BinaryOp::Add : BinaryOp::Sub;
+      left = std::make_shared<BinaryExpr>(op, left, parse_term());
+    }
+    return left;
+  }
+
+  ExprPtr parse_comparison() {
+    ExprPtr left = parse_expr();
+    while (true) {
+      skip_space();
+      BinaryOp op;
+      if (s.compare(pos, 2, "==") == 0) {
+        op = BinaryOp::Eq;
+      } else if (s.compare(pos, 2, "!=") == 0) {
+        op = BinaryOp::Ne;
+      } else if (s.compare(pos, 2, "<=") == 0) {
+        op = BinaryOp::Le;
+      } else if (s.compare(pos, 2, ">=") == 0) {
+        op = BinaryOp::Ge;
+      } else if (pos < s.size() && s[pos] == '<') {
+        op = BinaryOp::Lt;
+      } else if (pos < s.size() && s[pos] == '>') {
+        op = BinaryOp::Gt;
+      } else {
+        break;
+      }
+      pos += (op == BinaryOp::Lt || op == BinaryOp::Gt) ? 1 : 2;
+      left = std::make_shared<BinaryExpr>(op, left, parse_expr());
+    }
+    return left;
+  }
+
+  ExprPtr parse_and() {
+    ExprList terms{parse_comparison()};
+    while (true) {
+      skip_space();
+      if (s.compare(pos, 2, "&&") != 0) break;
+      pos += 2;
+      terms.push_back(parse_comparison());
+    }
+    if (terms.size() == 1) return terms.front();
+    return std::make_shared<LogicalExpr>(ExprKind::And, std::move(terms));
+  }
+
+  ExprPtr parse_or() {
+    ExprList terms{parse_and()};
+    while (true) {
+      skip_space();
+      if (s.compare(pos, 2, "||") != 0) break;
+      pos += 2;
+      terms.push_back(parse_and());
+    }
+    if (terms.size() == 1) return terms.front();
+    return std::make_shared<LogicalExpr>(ExprKind::Or, std::move(terms));
+  }
+};
+
+}  // namespace
+
+ExprPtr compile_expression(const std::string &text) {
+  std::string expr = trim(text);
+  try {
+    return ExprCompiler(expr).compile();
+  } catch (const std::exception &) {
+    return std::make_shared<SourceExpr>(std::move(expr));
+  }
+}
+
+}  // namespace bloa
@@ -2,8 +2,10 @@
 
 #include <algorithm>
 #include <cctype>
+#include <cerrno>
 #include <chrono>
 #include <cmath>
+#include <cstdlib>
 #include <filesystem>
 #include <fstream>
 #include <iostream>
@@ -20,18 +22,54 @@ namespace bloa {
 
 using NodePtr = std::shared_ptr<Node>;
 
-struct BreakException {};
-struct ContinueException {};
+struct ParseCacheEntry {
+  std::string stamp;
+  std::shared_ptr<const Code> code;
+};
+
+// Compiled programs are never modified after compile() builds them, so a
+// source that is run or imported again reuses its code instead of being
+// split, parsed and lowered from scratch. Entries are keyed by file name; the
+// stamp records what the code was built from (the source text for run(), the
+// modification time and size for imported files) so edits invalidate them.
+static std::unordered_map<std::string, ParseCacheEntry> parse_cache;
+
+static std::shared_ptr<const Code> cached_parse(const std::string &key,
+                                                const std::string &stamp,
+                                                const std::string &source) {
+  auto it = parse_cache.find(key);
+  if (it != parse_cache.end() && it->second.stamp == stamp)
+    return it->second.code;
+  auto lines = split_lines(source);
+  auto code = compile(parse_block(lines, 0, 0).first);
+  parse_cache[key] = ParseCacheEntry{stamp, code};
+  return code;
+}
 
-static Value resolve_reference(const Value &v) {
-  if (std::holds_alternative<std::shared_ptr<Reference>>(v.v)) {
-    auto ref = std::get<std::shared_ptr<Reference>>(v.v);
-    auto target = ref->env->get(ref->name);
+static std::shared_ptr<const Code> cached_parse_file(const fs::path &p) {
+  std::string key = p.string();
+  std::string stamp =
+      std::to_string(fs::last_write_time(p).time_since_epoch().count()) + ":" +
+      std::to_string(fs::file_size(p));
+  auto it = parse_cache.find(key);
+  if (it != parse_cache.end() && it->second.stamp == stamp)
+    return it->second.code;
+  std::ifstream ifs(p);
+  std::string code((std::istreambuf_iterator<char>(ifs)),
+                   std::istreambuf_iterator<char>());
+  return cached_parse(key, stamp, code);
+}
+
+// Follows references to the value they name, which is read in place.
+static const Value &resolve_reference(const Value &v) {
+  const Value *cur = &v;
+  while (auto ref = std::get_if<std::shared_ptr<Reference>>(&cur->v)) {
+    const Value *target = (*ref)->env->lookup((*ref)->name);
     if (!target)
-      throw std::runtime_error("Invalid reference target: " + ref->name);
-    return resolve_reference(*target);
+      throw std::runtime_error("Invalid reference target: " + (*ref)->name);
+    cur = target;
   }
-  return v;
+  return *cur;
 }
 
 static std::string value_to_string(const Value &v) {
@@ -71,29 +109,30 @@ static std::string value_to_string(const Value &v) {
 }
 
 static bool is_list_value(const Value &v) {
-  Value resolved = resolve_reference(v);
+  const Value &resolved = resolve_reference(v);
   return std::holds_alternative<std::vector<Value>>(resolved.v);
 }
 
 static double value_as_number(const Value &v) {
-  Value resolved = resolve_reference(v);
+  const Value &resolved = resolve_reference(v);
   if (std::holds_alternative<int64_t>(resolved.v))
     return static_cast<double>(std::get<int64_t>(resolved.v));
   if (std::holds_alternative<double>(resolved.v))
     return std::get<double>(resolved.v);
   if (std::holds_alternative<std::string>(resolved.v)) {
+    // strtod accepts what stod does, but reports text that is not a number
+    // without throwing and catching an exception
     const std::string &s = std::get<std::string>(resolved.v);
-    try {
-      return std::stod(s);
-    } catch (...) {
-      // fall through to error
-    }
+    char *end = nullptr;
+    errno = 0;
+    double d = std::strtod(s.c_str(), &end);
+    if (end != s.c_str() && errno != ERANGE) return d;
   }
   throw std::runtime_error("Value is not numeric");
 }
 
 static bool value_is_true(const Value &v) {
-  Value resolved = resolve_reference(v);
+  const Value &resolved = resolve_reference(v);
   if (std::holds_alternative<std::monostate>(resolved.v)) return false;
   if (std::holds_alternative<bool>(resolved.v))
     return std::get<bool>(resolved.v);
@@ -111,65 +150,121 @@ static bool value_is_true(const Value &v) {
 }
 
 static std::vector<Value> as_list(const Value &v) {
-  Value resolved = resolve_reference(v);
+  const Value &resolved = resolve_reference(v);
   return std::get<std::vector<Value>>(resolved.v);
 }
 
+static uint64_t environment_counter = 0;
+
 Environment::Environment(std::shared_ptr<Environment> parent_)
-    : parent(std::move(parent_)), vars() {}
+    : id(++environment_counter), parent(std::move(parent_)), vars() {}
 
-std::optional<Value> Environment::get(const std::string &name) const {
-  auto it = vars.find(name);
-  if (it != vars.end()) return it->second.value;
-  if (parent) return parent->get(name);
-  return std::nullopt;
-}
+Environment::Environment(const Environment &other)
+    : id(++environment_counter), parent(other.parent), vars(other.vars) {}
 
-void Environment::set(const std::string &name, Value val) {
-  if (name == "true" || name == "false" || name == "none") {
-    if (vars.find(name) != vars.end()) {
-      throw std::runtime_error("Cannot reassign constant '" + name + "'");
-    }
+namespace {
+
+struct NameHash {
+  using is_transparent = void;
+  size_t operator()(std::string_view name) const {
+    return std::hash<std::string_view>{}(name);
   }
-  auto it = vars.find(name);
-  if (it != vars.end()) {
-    it->second.value = std::move(val);
-    return;
+};
+
+struct SymbolTable {
+  std::unordered_map<std::string, Symbol, NameHash, std::equal_to<>> ids;
+  std::vector<const std::string *> names;
+};
+
+SymbolTable &symbol_table() {
+  static SymbolTable table;
+  return table;
+}
+
+}  // namespace
+
+Symbol intern(std::string_view name) {
+  auto &table = symbol_table();
+  auto it = table.ids.find(name);
+  if (it != table.ids.end()) return it->second;
+  it = table.ids
+           .emplace(std::string(name), static_cast<Symbol>(table.names.size()))
+           .first;
+  table.names.push_back(&it->first);
+  return it->second;
+}
+
+std::optional<Symbol> find_symbol(std::string_view name) {
+  auto &table = symbol_table();
+  auto it = table.ids.find(name);
+  if (it == table.ids.end()) return std::nullopt;
+  return it->second;
+}
+
+const std::string &symbol_name(Symbol sym) {
+  return *symbol_table().names[sym];
+}
+
+const Value *Environment::lookup(Symbol sym) const {
+  for (const Environment *e = this; e; e = e->parent.get()) {
+    auto it = e->vars.find(sym);
+    if (it != e->vars.end()) return &it->second;
   }
+  return nullptr;
+}
 
-  auto current = parent;
-  while (current) {
-    auto pit = current->vars.find(name);
-    if (pit != current->vars.end()) {
-      pit->second.value = std::move(val);
-      return;
-    }
-    current = current->parent;
+std::optional<Value> Environment::get(Symbol sym) const {
+  if (const Value *v = lookup(sym)) return *v;
+  return std::nullopt;
+}
+
+Value *Environment::assignable(Symbol sym) {
+  static const Symbol constants[] = {intern("true"), intern("false"),
+                                     intern("none")};
+  for (Environment *e = this; e; e = e->parent.get()) {
+    auto it = e->vars.find(sym);
+    if (it == e->vars.end()) continue;
+    if (e == this && std::find(std::begin(constants), std::end(constants),
+                               sym) != std::end(constants))
+      return nullptr;
+    return &it->second;
   }
+  return nullptr;
+}
 
-  vars[name] = Variable{std::move(val), std::string{}};
+void Environment::set(Symbol sym, Value val) {
+  if (Value *slot = assignable(sym)) {
+    *slot = std::move(val);
+    return;
+  }
+  // A binding that assignable() skipped is a constant of this scope
+  if (!vars.try_emplace(sym, std::move(val)).second)
+    throw std::runtime_error("Cannot reassign constant '" + symbol_name(sym) +
+                             "'");
+  ++binding_generation;
 }
 
+// Generations are drawn from one counter shared by every interpreter, so a
+// call site cached by one interpreter never matches another's definitions.
+static uint64_t generation_counter = 0;
+
 Interpreter::Interpreter(std::string stdlib_path_, const std::string &source)
-    : global_env(std::make_shared<Environment>(nullptr)),
+    : global_env(),
       functions(),
       classes(),
+      generation(++generation_counter),
       loaded_modules(),
       stdlib_path(std::move(stdlib_path_)),
-      s(source) {
+      s(source) {}
+
+const std::shared_ptr<Environment> &Interpreter::globals() {
+  if (global_env) return global_env;
+  global_env = std::make_shared<Environment>(nullptr);
   global_env->set("null", Value());
   global_env->set("true", Value::make_bool(true));
   global_env->set("false", Value::make_bool(false));
 
-  global_env->set("print", Value::make_str("__builtin_print"));
-  global_env->set("range", Value::make_str("__builtin_range"));
-  global_env->set("len", Value::make_str("__builtin_len"));
-  global_env->set("str", Value::make_str("__builtin_str"));
-  global_env->set("int", Value::make_str("__builtin_int"));
-  global_env->set("float", Value::make_str("__builtin_float"));
-  global_env->set("append", Value::make_str("__builtin_append"));
-
-  // Register standard library
+  // Register standard library, core functions included
   register_stdlib(global_env);
 
   // Load default standard library modules
@@ -192,6 +287,7 @@ Interpreter::Interpreter(std::string stdlib_path_, const std::string &source)
     }
   }
   */
+  return global_env;
 }
 
 NodeList Interpreter::parse(const std::string &source) {
@@ -202,8 +298,8 @@ NodeList Interpreter::parse(const std::string &source) {
 
 void Interpreter::run(const std::string &code, const std::string &filename) {
   try {
-    auto nodes = parse(code);
-    execute_block(nodes, global_env);
+    auto program = cached_parse(filename, code, code);
+    execute(*program, globals());
   } catch (const std::exception &e) {
     std::cerr << "[BLOA Error] " << e.what() << "\n";
     std::cerr << "  File: " << filename << "\n";
@@ -385,47 +481,8 @@ Value Interpreter::parse_expression(std::string expr,
         auto class_it = interp->classes.find(class_name);
         if (class_it == interp->classes.end())
           error("Class '" + class_name + "' not found");
-
-        const auto &class_def = class_it->second;
-        auto instance_env = std::make_shared<Environment>(class_def.class_env);
-        auto instance = Value::make_object(class_name, instance_env);
-
-        const FunctionDefEntry *init_method = nullptr;
-        std::string current_class = class_name;
-        while (!current_class.empty()) {
-          auto cls_it = interp->classes.find(current_class);
-          if (cls_it != interp->classes.end()) {
-            auto meth_it = cls_it->second.methods.find("__init__");
-            if (meth_it != cls_it->second.methods.end()) {
-              init_method = &meth_it->second;
-              break;
-            }
-            current_class = cls_it->second.parent.value_or("");
-          } else {
-            break;
-          }
-        }
-
-        if (init_method) {
-          if (init_method->params.size() != constructor_args.size() + 1)
-            error("__init__() expects " +
-                  std::to_string(static_cast<int>(init_method->params.size()) -
-                                 1) +
-                  " arguments but got " +
-                  std::to_string(constructor_args.size()));
-          auto init_env = std::make_shared<Environment>(init_method->def_env);
-          init_env->set(init_method->params[0], instance);
-          for (size_t i = 0; i < constructor_args.size(); ++i) {
-            init_env->set(init_method->params[i + 1], constructor_args[i]);
-          }
-          try {
-            interp->execute_block(init_method->block, init_env);
-          } catch (const std::string &) {
-          }
-        } else if (!constructor_args.empty()) {
-          error("Class '" + class_name + "' does not accept arguments");
-        }
-        return instance;
+        return interp->instantiate(class_name, class_it->second,
+                                   constructor_args);
       }
 
       if (is_ident_start(s[pos])) {
@@ -487,73 +544,11 @@ Value Interpreter::parse_expression(std::string expr,
             // Check if it's a class instantiation
             auto class_it = interp->classes.find(id);
             if (class_it != interp->classes.end()) {
-              // Create new instance
-              const auto &class_def = class_it->second;
-              auto instance_env =
-                  std::make_shared<Environment>(class_def.class_env);
-              auto instance = Value::make_object(id, instance_env);
-
-              // Call __init__ if it exists (with inheritance)
-              const FunctionDefEntry *init_method = nullptr;
-              std::string current_class = id;
-              while (!current_class.empty()) {
-                auto cls_it = interp->classes.find(current_class);
-                if (cls_it != interp->classes.end()) {
-                  auto meth_it = cls_it->second.methods.find("__init__");
-                  if (meth_it != cls_it->second.methods.end()) {
-                    init_method = &meth_it->second;
-                    break;
-                  }
-                  current_class = cls_it->second.parent.value_or("");
-                } else {
-                  break;
-                }
-              }
-
-              if (init_method) {
-                if (init_method->params.size() != args.size() + 1) {
-                  error("__init__() expects " +
-                        std::to_string(
-                            static_cast<int>(init_method->params.size()) - 1) +
-                        " arguments but got " + std::to_string(args.size()));
-                }
-                auto init_env =
-                    std::make_shared<Environment>(init_method->def_env);
-                init_env->set(init_method->params[0], instance);  // self
-                for (size_t i = 0; i < args.size(); ++i) {
-                  init_env->set(init_method->params[i + 1], args[i]);
-                }
-                try {
-                  interp->execute_block(init_method->block, init_env);
-                } catch (const std::string &) {
-                }
-              } else if (!args.empty()) {
-                error("Class '" + id + "' does not accept arguments");
-              }
-              base_val = instance;
+              base_val = interp->instantiate(id, class_it->second, args);
               continue;
             }
 
-            auto it = interp->functions.find(id);
-            if (it == interp->functions.end()) {
-              error("'" + id + "' is not callable");
-            }
-            const auto &entry = it->second;
-            if (entry.params.size() != args.size()) {
-              error("Function '" + id + "' expects " +
-                    std::to_string(entry.params.size()) +
-                    " arguments but got " + std::to_string(args.size()));
-            }
-
-            auto call_env = std::make_shared<Environment>(entry.def_env);
-            for (size_t i = 0; i < args.size(); ++i) {
-              call_env->set(entry.params[i], args[i]);
-            }
-            try {
-              base_val = interp->execute_block(entry.block, call_env);
-            } catch (const std::string &) {
-              base_val = Value();
-            }
+            base_val = interp->call_function(id, args);
             continue;
           }
 
@@ -598,52 +593,7 @@ Value Interpreter::parse_expression(std::string expr,
                 }
               }
 
-              auto obj_inst =
-                  std::get<std::shared_ptr<ObjectInstance>>(base_val.v);
-              auto class_it = interp->classes.find(obj_inst->class_name);
-              if (class_it == interp->classes.end()) {
-                error("Class '" + obj_inst->class_name + "' not found");
-              }
-
-              // Find method with inheritance
-              const FunctionDefEntry *method = nullptr;
-              std::string current_class = obj_inst->class_name;
-              while (!current_class.empty()) {
-                auto cls_it = interp->classes.find(current_class);
-                if (cls_it != interp->classes.end()) {
-                  auto meth_it = cls_it->second.methods.find(member);
-                  if (meth_it != cls_it->second.methods.end()) {
-                    method = &meth_it->second;
-                    break;
-                  }
-                  current_class = cls_it->second.parent.value_or("");
-                } else {
-                  break;
-                }
-              }
-
-              if (!method) {
-                error("Method '" + member + "' not found in class '" +
-                      obj_inst->class_name + "' or its parents");
-              }
-
-              if (method->params.size() != args.size() + 1) {
-                error("Method '" + member + "' expects " +
-                      std::to_string(static_cast<int>(method->params.size()) -
-                                     1) +
-                      " arguments but got " + std::to_string(args.size()));
-              }
-
-              auto method_env = std::make_shared<Environment>(method->def_env);
-              method_env->set(method->params[0], base_val);  // self
-              for (size_t i = 0; i < args.size(); ++i) {
-                method_env->set(method->params[i + 1], args[i]);
-              }
-              try {
-                base_val = interp->execute_block(method->block, method_env);
-              } catch (const std::string &) {
-                base_val = Value();
-              }
+              base_val = interp->call_method(base_val, member, args);
               continue;
             } else {
               // Property access
@@ -692,8 +642,9 @@ Value Interpreter::parse_expression(std::string expr,
         ++pos;
         while (pos < s.size() && is_ident_continue(s[pos])) ++pos;
         std::string name = s.substr(start, pos - start);
-        auto ref_env = env;
-        while (ref_env && !ref_env->has_local(name)) ref_env = ref_env->parent;
+        auto sym = find_symbol(name);
+        auto ref_env = sym ? env : nullptr;
+        while (ref_env && !ref_env->has_local(*sym)) ref_env = ref_env->parent;
         if (!ref_env) error("Undefined variable '" + name + "'");
         return Value::make_ref(ref_env, name);
       }
@@ -886,238 +837,1031 @@ Value Interpreter::parse_expression(std::string expr,
   return p.parse_or();
 }
 
-Value Interpreter::eval_expr(const std::string &expr,
-                             std::shared_ptr<Environment> env) {
-  return parse_expression(trim(expr), env);
+// Whether an expression in the body of the function named self reads only
+// the parameters and calls only self, so that its value depends on nothing
+// but the arguments. recursive is set if it calls self.
+static bool is_pure(const Expr &expr, const std::string &self,
+                    const std::vector<Symbol> &params, bool &recursive) {
+  auto pure = [&](const Expr &e) {
+    return is_pure(e, self, params, recursive);
+  };
+  auto all_pure = [&](const ExprList &exprs) {
+    return std::all_of(exprs.begin(), exprs.end(),
+                       [&](const ExprPtr &e) { return pure(*e); });
+  };
+  switch (expr.kind) {
+    case ExprKind::Literal:
+      return true;
+    case ExprKind::List:
+      return all_pure(static_cast<const ListExpr &>(expr).elems);
+    case ExprKind::Not:
+      return pure(*static_cast<const UnaryExpr &>(expr).operand);
+    case ExprKind::Binary: {
+      const auto &bin = static_cast<const BinaryExpr &>(expr);
+      return pure(*bin.lhs) && pure(*bin.rhs);
+    }
+    case ExprKind::And:
+    case ExprKind::Or:
+      return all_pure(static_cast<const LogicalExpr &>(expr).terms);
+    case ExprKind::Name: {
+      const auto &name = static_cast<const NameExpr &>(expr);
+      bool param =
+          std::find(params.begin(), params.end(), name.sym) != params.end();
+      if (!param && name.id != self) return false;
+      for (size_t i = 0; i < name.chain.size(); ++i) {
+        const Postfix &op = name.chain[i];
+        bool call = op.kind == Postfix::Kind::Call && i == 0 && !param;
+        if ((op.kind != Postfix::Kind::Index && !call) || !all_pure(op.args))
+          return false;
+        if (call) recursive = true;
+      }
+      return true;
+    }
+    default:
+      return false;
+  }
 }
 
-Value Interpreter::execute_block(const NodeList &nodes,
-                                 std::shared_ptr<Environment> env) {
-  for (const auto &node : nodes) {
-    try {
-      if (auto s = std::dynamic_pointer_cast<Say>(node)) {
-        Value v = eval_expr(s->expr, env);
-        std::cout << value_to_string(v) << '\n';
-      } else if (auto a = std::dynamic_pointer_cast<Ask>(node)) {
-        Value prompt = eval_expr(a->prompt, env);
-        std::cout << value_to_string(prompt) << " ";
-        std::string input;
-        std::getline(std::cin, input);
-        try {
-          std::size_t pos;
-          long long xi = std::stoll(input, &pos);
-          if (pos == input.size()) {
-            env->set(a->var, Value::make_int(xi));
-            continue;
-          }
-          double xd = std::stod(input, &pos);
-          if (pos == input.size()) {
-            env->set(a->var, Value::make_double(xd));
-            continue;
-          }
-        } catch (...) {
-        }
-        env->set(a->var, Value::make_str(input));
-      } else if (auto decl = std::dynamic_pointer_cast<Declare>(node)) {
-        Value val = eval_expr(decl->expr, env);
-        env->set_local(decl->name, val);
-      } else if (auto asg = std::dynamic_pointer_cast<Assign>(node)) {
-        Value val = eval_expr(asg->expr, env);
-        env->set(asg->name, val);
-      } else if (auto masg = std::dynamic_pointer_cast<MemberAssign>(node)) {
-        // Get the object
-        auto obj_val_opt = env->get(masg->object);
-        if (!obj_val_opt.has_value()) {
-          throw std::runtime_error("Undefined object '" + masg->object + "'");
+// A recursive function whose body only branches and returns pure
+// expressions. Remembering results pays off for these; a function that does
+// not call itself is usually cheaper to run again than to look up.
+static bool is_memoizable(const Code &body, const std::string &self,
+                          const std::vector<Symbol> &params) {
+  for (const Instr &in : body.instrs) {
+    switch (in.op) {
+      case Op::Halt:
+      case Op::Jump:
+      case Op::JumpIfFalse:
+      case Op::PushScope:
+      case Op::PopScope:
+      case Op::Return:
+        break;
+      default:
+        return false;
+    }
+  }
+  bool recursive = false;
+  for (const auto &expr : body.exprs)
+    if (!is_pure(*expr, self, params, recursive)) return false;
+  return recursive;
+}
+
+// Encodes call arguments into a key for remembered results. Only plain
+// values qualify; lists, objects and references are refused.
+static bool result_key(const std::vector<Value> &args, std::string &key) {
+  for (const Value &arg : args) {
+    key.push_back(static_cast<char>(arg.v.index()));
+    if (auto i = std::get_if<int64_t>(&arg.v)) {
+      key.append(reinterpret_cast<const char *>(i), sizeof *i);
+    } else if (auto d = std::get_if<double>(&arg.v)) {
+      key.append(reinterpret_cast<const char *>(d), sizeof *d);
+    } else if (auto b = std::get_if<bool>(&arg.v)) {
+      key.push_back(*b);
+    } else if (auto str = std::get_if<std::string>(&arg.v)) {
+      size_t n = str->size();
+      key.append(reinterpret_cast<const char *>(&n), sizeof n);
+      key += *str;
+    } else if (!std::holds_alternative<std::monostate>(arg.v)) {
+      return false;
+    }
+  }
+  return true;
+}
+
+// Returns the scope for a call of entry. Parameters are about to be bound in
+// it, so when the previous call's scope can be reused only their bindings
+// are kept, to be overwritten in place.
+static std::shared_ptr<Environment> call_frame(const FunctionDefEntry &entry) {
+  if (entry.frame && entry.frame.use_count() == 1) {
+    entry.frame->clear_except(entry.params);
+  } else {
+    entry.frame = std::make_shared<Environment>(entry.def_env);
+  }
+  return entry.frame;
+}
+
+Value Interpreter::instantiate(const std::string &class_name,
+                               const ClassDefEntry &class_def,
+                               const std::vector<Value> &args) {
+  auto instance_env = std::make_shared<Environment>(class_def.class_env);
+  auto instance = Value::make_object(class_name, instance_env);
+
+  // Call __init__ if it exists (with inheritance)
+  const FunctionDefEntry *init_method = nullptr;
+  std::string current_class = class_name;
+  while (!current_class.empty()) {
+    auto cls_it = classes.find(current_class);
+    if (cls_it != classes.end()) {
+      auto meth_it = cls_it->second.methods.find("__init__");
+      if (meth_it != cls_it->second.methods.end()) {
+        init_method = &meth_it->second;
+        break;
+      }
+      current_class = cls_it->second.parent.value_or("");
+    } else {
+      break;
+    }
+  }
+
+  if (init_method) {
+    if (init_method->params.size() != args.size() + 1)
+      throw std::runtime_error(
+          "__init__() expects " +
+          std::to_string(static_cast<int>(init_method->params.size()) - 1) +
+          " arguments but got " + std::to_string(args.size()));
+    auto init_env = call_frame(*init_method);
+    init_env->set_local(init_method->params[0], instance);  // self
+    for (size_t i = 0; i < args.size(); ++i) {
+      init_env->set_local(init_method->params[i + 1], args[i]);
+    }
+    auto code = init_method->code;
+    execute(*code, init_env);
+  } else if (!args.empty()) {
+    throw std::runtime_error("Class '" + class_name +
+                             "' does not accept arguments");
+  }
+  return instance;
+}
+
+Value Interpreter::call_function(const std::string &name,
+                                 const std::vector<Value> &args) {
+  auto it = functions.find(name);
+  if (it == functions.end()) {
+    throw std::runtime_error("'" + name + "' is not callable");
+  }
+  return invoke(name, it->second, args);
+}
+
+Value Interpreter::invoke(const std::string &name,
+                          const FunctionDefEntry &entry,
+                          const std::vector<Value> &args) {
+  if (entry.params.size() != args.size()) {
+    throw std::runtime_error("Function '" + name + "' expects " +
+                             std::to_string(entry.params.size()) +
+                             " arguments but got " +
+                             std::to_string(args.size()));
+  }
+
+  // A variable named like the function would take its recursive calls
+  std::string key;
+  bool remember = entry.pure && result_key(args, key) &&
+                  !entry.def_env->lookup(intern(name));
+  if (remember) {
+    auto it = entry.results.find(key);
+    if (it != entry.results.end()) return it->second;
+  }
+
+  auto call_env = call_frame(entry);
+  for (size_t i = 0; i < args.size(); ++i) {
+    call_env->set_local(entry.params[i], args[i]);
+  }
+  // Keep the body alive even if it redefines the function it belongs to
+  auto code = entry.code;
+  Value result = execute(*code, call_env);
+  if (remember) {
+    if (entry.results.size() >= 4096) entry.results.clear();
+    entry.results.insert_or_assign(std::move(key), result);
+  }
+  return result;
+}
+
+const FunctionDefEntry &Interpreter::find_method(const std::string &class_name,
+                                                 const std::string &member) {
+  if (classes.find(class_name) == classes.end()) {
+    throw std::runtime_error("Class '" + class_name + "' not found");
+  }
+
+  // Find method with inheritance
+  std::string current_class = class_name;
+  while (!current_class.empty()) {
+    auto cls_it = classes.find(current_class);
+    if (cls_it != classes.end()) {
+      auto meth_it = cls_it->second.methods.find(member);
+      if (meth_it != cls_it->second.methods.end()) return meth_it->second;
+      current_class = cls_it->second.parent.value_or("");
+    } else {
+      break;
+    }
+  }
+
+  throw std::runtime_error("Method '" + member + "' not found in class '" +
+                           class_name + "' or its parents");
+}
+
+Value Interpreter::call_method(const Value &self, const std::string &member,
+                               const std::vector<Value> &args) {
+  const auto &obj_inst = std::get<std::shared_ptr<ObjectInstance>>(self.v);
+  return invoke_method(self, member, find_method(obj_inst->class_name, member),
+                       args);
+}
+
+Value Interpreter::invoke_method(const Value &self, const std::string &member,
+                                 const FunctionDefEntry &method,
+                                 const std::vector<Value> &args) {
+  if (method.params.size() != args.size() + 1) {
+    throw std::runtime_error(
+        "Method '" + member + "' expects " +
+        std::to_string(static_cast<int>(method.params.size()) - 1) +
+        " arguments but got " + std::to_string(args.size()));
+  }
+
+  auto method_env = call_frame(method);
+  method_env->set_local(method.params[0], self);  // self
+  for (size_t i = 0; i < args.size(); ++i) {
+    method_env->set_local(method.params[i + 1], args[i]);
+  }
+  auto code = method.code;
+  return execute(*code, method_env);
+}
+
+// Arithmetic and ordering on two plain numbers, which is what loop counters
+// and accumulators hold. Returns false for any other pair of operands.
+static bool numeric_op(BinaryOp op, const Value &left, const Value &right,
+                       Value &out) {
+  double a, b;
+  if (auto i = std::get_if<int64_t>(&left.v)) {
+    a = static_cast<double>(*i);
+  } else if (auto d = std::get_if<double>(&left.v)) {
+    a = *d;
+  } else {
+    return false;
+  }
+  if (auto i = std::get_if<int64_t>(&right.v)) {
+    b = static_cast<double>(*i);
+  } else if (auto d = std::get_if<double>(&right.v)) {
+    b = *d;
+  } else {
+    return false;
+  }
+  switch (op) {
+    case BinaryOp::Add:
+      out = Value::make_double(a + b);
+      return true;
+    case BinaryOp::Sub:
+      out = Value::make_double(a - b);
+      return true;
+    case BinaryOp::Mul:
+      out = Value::make_double(a * b);
+      return true;
+    case BinaryOp::Lt:
+      out = Value::make_bool(a < b);
+      return true;
+    case BinaryOp::Le:
+      out = Value::make_bool(a <= b);
+      return true;
+    case BinaryOp::Gt:
+      out = Value::make_bool(a > b);
+      return true;
+    case BinaryOp::Ge:
+      out = Value::make_bool(a >= b);
+      return true;
+    default:
+      return false;
+  }
+}
+
+static Value binary_op(BinaryOp op, const Value &left, const Value &right) {
+  if (Value out; numeric_op(op, left, right, out)) return out;
+  switch (op) {
+    case BinaryOp::Add:
+      if (std::holds_alternative<std::string>(left.v) ||
+          std::holds_alternative<std::string>(right.v)) {
+        return Value::make_str(value_to_string(left) + value_to_string(right));
+      }
+      return Value::make_double(value_as_number(left) + value_as_number(right));
+    case BinaryOp::Sub:
+      return Value::make_double(value_as_number(left) - value_as_number(right));
+    case BinaryOp::Mul:
+      return Value::make_double(value_as_number(left) * value_as_number(right));
+    case BinaryOp::Div: {
+      double a = value_as_number(left);
+      double b = value_as_number(right);
+      if (b == 0.0) throw std::runtime_error("Division by zero");
+      return Value::make_double(a / b);
+    }
+    case BinaryOp::Mod: {
+      double a = value_as_number(left);
+      double b = value_as_number(right);
+      if (b == 0.0) throw std::runtime_error("Modulo by zero");
+      return Value::make_double(std::fmod(a, b));
+    }
+    case BinaryOp::Pow: {
+      double a = value_as_number(left);
+      double b = value_as_number(right);
+      return Value::make_double(std::pow(a, b));
+    }
+    case BinaryOp::Eq:
+    case BinaryOp::Ne: {
+      bool equal = false;
+      if (std::holds_alternative<int64_t>(left.v) &&
+          std::holds_alternative<int64_t>(right.v)) {
+        equal = std::get<int64_t>(left.v) == std::get<int64_t>(right.v);
+      } else if (std::holds_alternative<double>(left.v) ||
+                 std::holds_alternative<double>(right.v)) {
+        equal = value_as_number(left) == value_as_number(right);
+      } else if (std::holds_alternative<std::string>(left.v) &&
+                 std::holds_alternative<std::string>(right.v)) {
+        equal = std::get<std::string>(left.v) == std::get<std::string>(right.v);
+      } else if (std::holds_alternative<bool>(left.v) &&
+                 std::holds_alternative<bool>(right.v)) {
+        equal = std::get<bool>(left.v) == std::get<bool>(right.v);
+      } else {
+        // Values of mismatched types are never equal
+        return Value::make_bool(op == BinaryOp::Ne);
+      }
+      return Value::make_bool(op == BinaryOp::Eq ? equal : !equal);
+    }
+    case BinaryOp::Lt:
+      return Value::make_bool(value_as_number(left) < value_as_number(right));
+    case BinaryOp::Le:
+      return Value::make_bool(value_as_number(left) <= value_as_number(right));
+    case BinaryOp::Gt:
+      return Value::make_bool(value_as_number(left) > value_as_number(right));
+    case BinaryOp::Ge:
+      return Value::make_bool(value_as_number(left) >= value_as_number(right));
+  }
+  return Value();
+}
+
+// Looks the variable up from env, reusing the value found last time while
+// no scope has gained or lost a variable since.
+static const Value *lookup_name(const NameExpr &name, const Environment &env) {
+  if (name.bound_env != env.id ||
+      name.bound_generation != Environment::binding_generation) {
+    name.binding = env.lookup(name.sym);
+    name.bound_env = env.id;
+    name.bound_generation = Environment::binding_generation;
+  }
+  return name.binding;
+}
+
+void Interpreter::resolve_call(const NameExpr &name) {
+  if (name.resolved_generation == generation) return;
+  auto fit = functions.find(name.id);
+  name.function = fit == functions.end() ? nullptr : &fit->second;
+  auto cit = classes.find(name.id);
+  name.class_def = cit == classes.end() ? nullptr : &cit->second;
+  name.resolved_generation = generation;
+}
+
+Value Interpreter::evaluate_name(const NameExpr &name,
+                                 const std::shared_ptr<Environment> &env) {
+  const std::string &id = name.id;
+  // cur points at the value computed so far: a variable, an element or a
+  // property read in place, or `owned` once a step has produced a new value.
+  // Anything still needed from cur is copied before code that could modify
+  // variables runs.
+  Value owned;
+  const Value *cur = lookup_name(name, *env);
+  if (!cur || !name.chain.empty()) resolve_call(name);
+  if (!cur) {
+    if (!name.function && !name.class_def)
+      throw std::runtime_error("Name '" + id + "' is not defined");
+    // The marker is only built when it is the result. A call resolves the
+    // name itself, and a subscript or member access rejects the empty value
+    // just as it would the marker string.
+    if (name.chain.empty()) {
+      if (name.function) {
+        // Mark as function for call check
+        owned = Value::make_str("<function '" + id + "'>");
+      } else {
+        // Mark as class for instantiation check
+        owned = Value::make_str("<class '" + id + "'>");
+      }
+    }
+    cur = &owned;
+  }
+
+  auto evaluate_args = [&](const ExprList &exprs) {
+    std::vector<Value> args;
+    args.reserve(exprs.size());
+    for (const auto &arg : exprs) args.push_back(evaluate(*arg, env));
+    return args;
+  };
+
+  for (const Postfix &op : name.chain) {
+    switch (op.kind) {
+      case Postfix::Kind::Call: {
+        // The builtin is looked up before the arguments run, since they may
+        // reassign the variable holding its marker
+        const Builtin *builtin = nullptr;
+        std::string unknown;
+        if (auto str = std::get_if<std::string>(&cur->v);
+            str && str->starts_with("__builtin_")) {
+          builtin = find_builtin(*str);
+          if (!builtin) unknown = *str;
         }
-        Value obj_val = *obj_val_opt;
-        if (!std::holds_alternative<std::shared_ptr<ObjectInstance>>(
-                obj_val.v)) {
-          throw std::runtime_error("Cannot assign to member of non-object");
+        static const Builtin *const len_builtin = find_builtin("__builtin_len");
+        if (builtin == len_builtin && op.args.size() == 1) {
+          // len only reads its argument, so a variable is measured in place
+          Value tmp;
+          owned = value_length(operand(*op.args[0], env, tmp));
+          cur = &owned;
+          break;
         }
+        std::vector<Value> args = evaluate_args(op.args);
 
-        // Evaluate the right-hand side expression
-        Value rhs = eval_expr(masg->expr, env);
-
-        // Set the property on the object
-        auto obj_inst = std::get<std::shared_ptr<ObjectInstance>>(obj_val.v);
-        obj_inst->properties->set(masg->member, rhs);
-      } else if (auto iff = std::dynamic_pointer_cast<If>(node)) {
-        Value cond = eval_expr(iff->cond, env);
-        if (value_is_true(cond)) {
-          execute_block(iff->then_block, std::make_shared<Environment>(env));
-        } else if (!iff->else_block.empty()) {
-          execute_block(iff->else_block, std::make_shared<Environment>(env));
-        }
-      } else if (auto rep = std::dynamic_pointer_cast<Repeat>(node)) {
-        Value timesv = eval_expr(rep->times_expr, env);
-        int64_t times = static_cast<int64_t>(value_as_number(timesv));
-        if (times < 0)
-          throw std::runtime_error("repeat count must be non-negative");
-        for (int64_t j = 0; j < times; ++j) {
-          auto loop_env = std::make_shared<Environment>(env);
-          loop_env->set("count", Value::make_int(j + 1));
-          try {
-            execute_block(rep->block, loop_env);
-          } catch (const ContinueException &) {
-            continue;
-          } catch (const BreakException &) {
-            break;
+        if (builtin) {
+          owned = builtin->second(builtin->first, args, env);
+        } else if (!unknown.empty()) {
+          owned = handle_builtin(unknown, args, env);
+        } else {
+          // A call made by an earlier link may have defined new functions
+          resolve_call(name);
+          if (name.class_def) {
+            owned = instantiate(id, *name.class_def, args);
+          } else if (name.function) {
+            owned = invoke(id, *name.function, args);
+          } else {
+            throw std::runtime_error("'" + id + "' is not callable");
           }
         }
-      } else if (auto b = std::dynamic_pointer_cast<Break>(node)) {
-        throw BreakException();
-      } else if (auto c = std::dynamic_pointer_cast<Continue>(node)) {
-        throw ContinueException();
-      } else if (auto fd = std::dynamic_pointer_cast<FunctionDef>(node)) {
-        FunctionDefEntry entry;
-        entry.params = fd->params;
-        entry.block = fd->block;
-        entry.def_env = env;
-        functions[fd->name] = std::move(entry);
-      } else if (auto fc = std::dynamic_pointer_cast<FunctionCall>(node)) {
-        std::ostringstream fake_expr;
-        fake_expr << fc->name << '(';
-        for (size_t i = 0; i < fc->args.size(); ++i) {
-          if (i > 0) fake_expr << ", ";
-          fake_expr << fc->args[i];
+        cur = &owned;
+        break;
+      }
+      case Postfix::Kind::Index: {
+        if (!is_list_value(*cur)) {
+          throw std::runtime_error("Object is not subscriptable (not a list)");
         }
-        fake_expr << ')';
-        eval_expr(fake_expr.str(), env);
-      } else if (auto ret = std::dynamic_pointer_cast<Return>(node)) {
-        if (ret->expr.has_value()) {
-          return eval_expr(ret->expr.value(), env);
-        } else {
-          return Value();
+        if (cur->is_reference() || (op.args[0]->has_calls && cur != &owned)) {
+          Value copy = resolve_reference(*cur);
+          owned = std::move(copy);
+          cur = &owned;
         }
-      } else if (auto imp = std::dynamic_pointer_cast<Import>(node)) {
-        std::string mod = imp->name;
-        std::replace(mod.begin(), mod.end(), '\\',
-                     static_cast<char>(fs::path::preferred_separator));
-        fs::path p = std::filesystem::path(stdlib_path).empty()
-                         ? (fs::path(mod) += ".bloa")
-                         : (fs::path(stdlib_path) / mod) += ".bloa";
-        if (!fs::exists(p)) {
-          throw std::runtime_error("Module not found: '" + imp->name + "'");
+        Value idx_val = evaluate(*op.args[0], env);
+        int64_t idx = static_cast<int64_t>(value_as_number(idx_val));
+        const auto &list = std::get<std::vector<Value>>(cur->v);
+        if (idx < 0 || idx >= static_cast<int64_t>(list.size())) {
+          throw std::runtime_error("List index " + std::to_string(idx) +
+                                   " out of range [0, " +
+                                   std::to_string(list.size()) + ")");
         }
-        std::ifstream ifs(p);
-        std::string code((std::istreambuf_iterator<char>(ifs)),
-                         std::istreambuf_iterator<char>());
-        auto mod_nodes = parse(code);
-        auto mod_env = std::make_shared<Environment>(global_env);
-        Interpreter mod_interp("");
-        mod_interp.execute_block(mod_nodes, mod_env);
-        loaded_modules[imp->name] = mod_env;
-        env->set(imp->name, Value::make_str("<module '" + imp->name + "'>"));
-      } else if (auto ex = std::dynamic_pointer_cast<ExprStmt>(node)) {
-        eval_expr(ex->expr, env);
-      } else if (auto wh = std::dynamic_pointer_cast<While>(node)) {
-        while (true) {
-          Value cond = eval_expr(wh->cond, env);
-          if (!value_is_true(cond)) break;
-          try {
-            execute_block(wh->block, std::make_shared<Environment>(env));
-          } catch (const ContinueException &) {
-            continue;
-          } catch (const BreakException &) {
-            break;
+        cur = &list[static_cast<size_t>(idx)];
+        break;
+      }
+      case Postfix::Kind::Member:
+      case Postfix::Kind::MethodCall: {
+        if (!std::holds_alternative<std::shared_ptr<ObjectInstance>>(cur->v)) {
+          throw std::runtime_error("Cannot access member on non-object");
+        }
+        if (op.kind == Postfix::Kind::MethodCall) {
+          Value self = *cur;
+          std::vector<Value> args = evaluate_args(op.args);
+          // The method is looked up again only when the receiver's class or
+          // the definitions have changed since the last call from here
+          const std::string &class_name =
+              std::get<std::shared_ptr<ObjectInstance>>(self.v)->class_name;
+          if (op.resolved_generation != generation ||
+              op.resolved_class != class_name) {
+            op.method = &find_method(class_name, op.member);
+            op.resolved_class = class_name;
+            op.resolved_generation = generation;
           }
+          owned = invoke_method(self, op.member, *op.method, args);
+          cur = &owned;
+          break;
         }
-      } else if (auto fin = std::dynamic_pointer_cast<ForIn>(node)) {
-        Value itv = eval_expr(fin->iterable, env);
-        if (!is_list_value(itv)) {
-          throw std::runtime_error("For-in requires a list");
+        const auto &obj_inst =
+            std::get<std::shared_ptr<ObjectInstance>>(cur->v);
+        const Value *prop_val = obj_inst->properties->lookup(op.member_sym);
+        if (!prop_val) {
+          throw std::runtime_error("Property '" + op.member +
+                                   "' not found in object");
         }
-        const auto &list = as_list(itv);
-        for (const auto &item : list) {
-          auto loop_env = std::make_shared<Environment>(env);
-          loop_env->set(fin->var, item);
-          try {
-            execute_block(fin->block, loop_env);
-          } catch (const ContinueException &) {
-            continue;
-          } catch (const BreakException &) {
-            break;
+        cur = prop_val;
+        break;
+      }
+    }
+  }
+  if (cur == &owned) return owned;
+  return *cur;
+}
+
+// The new value of target for an assignment target = rhs. When rhs has
+// the form `target op operand` the target is read where it is stored
+// rather than looked up again.
+Value Interpreter::update_in_place(const Value &target, Symbol sym,
+                                   const Expr &rhs,
+                                   const std::shared_ptr<Environment> &env) {
+  if (rhs.kind == ExprKind::Binary) {
+    const auto &b = static_cast<const BinaryExpr &>(rhs);
+    if (b.lhs->kind == ExprKind::Name) {
+      const auto &name = static_cast<const NameExpr &>(*b.lhs);
+      if (name.sym == sym && name.chain.empty()) {
+        Value tmp;
+        return binary_op(b.op, target, operand(*b.rhs, env, tmp));
+      }
+    }
+  }
+  return evaluate(rhs, env);
+}
+
+const Value &Interpreter::operand(const Expr &expr,
+                                  const std::shared_ptr<Environment> &env,
+                                  Value &scratch) {
+  // Literals and bare variables are read in place rather than copied
+  if (expr.kind == ExprKind::Literal)
+    return static_cast<const LiteralExpr &>(expr).value;
+  if (expr.kind == ExprKind::Name) {
+    const auto &name = static_cast<const NameExpr &>(expr);
+    if (name.chain.empty())
+      if (const Value *v = lookup_name(name, *env)) return *v;
+  }
+  scratch = evaluate(expr, env);
+  return scratch;
+}
+
+Value Interpreter::evaluate(const Expr &expr,
+                            const std::shared_ptr<Environment> &env) {
+  switch (expr.kind) {
+    case ExprKind::Literal:
+      return static_cast<const LiteralExpr &>(expr).value;
+    case ExprKind::List: {
+      const auto &list = static_cast<const ListExpr &>(expr);
+      std::vector<Value> elems;
+      elems.reserve(list.elems.size());
+      for (const auto &e : list.elems) elems.push_back(evaluate(*e, env));
+      return Value::make_list(std::move(elems));
+    }
+    case ExprKind::Name:
+      return evaluate_name(static_cast<const NameExpr &>(expr), env);
+    case ExprKind::New: {
+      const auto &n = static_cast<const NewExpr &>(expr);
+      std::vector<Value> args;
+      args.reserve(n.args.size());
+      for (const auto &arg : n.args) args.push_back(evaluate(*arg, env));
+      auto class_it = classes.find(n.class_name);
+      if (class_it == classes.end())
+        throw std::runtime_error("Class '" + n.class_name + "' not found");
+      return instantiate(n.class_name, class_it->second, args);
+    }
+    case ExprKind::Not: {
+      const auto &u = static_cast<const UnaryExpr &>(expr);
+      Value tmp;
+      return Value::make_bool(!value_is_true(operand(*u.operand, env, tmp)));
+    }
+    case ExprKind::Ref: {
+      const std::string &name = static_cast<const RefExpr &>(expr).name;
+      auto sym = find_symbol(name);
+      auto ref_env = sym ? env : nullptr;
+      while (ref_env && !ref_env->has_local(*sym)) ref_env = ref_env->parent;
+      if (!ref_env)
+        throw std::runtime_error("Undefined variable '" + name + "'");
+      return Value::make_ref(ref_env, name);
+    }
+    case ExprKind::Deref: {
+      const auto &u = static_cast<const UnaryExpr &>(expr);
+      Value operand = evaluate(*u.operand, env);
+      if (!operand.is_reference())
+        throw std::runtime_error("Cannot dereference non-pointer value");
+      const auto &ref = operand.as_reference();
+      auto target = ref.env->get(ref.name);
+      if (!target)
+        throw std::runtime_error("Invalid reference target: " + ref.name);
+      return *target;
+    }
+    case ExprKind::Binary: {
+      const auto &b = static_cast<const BinaryExpr &>(expr);
+      Value left_tmp, right_tmp;
+      const Value &left = operand(*b.lhs, env, left_tmp);
+      if (b.rhs->has_calls && &left != &left_tmp) left_tmp = left;
+      const Value &right = operand(*b.rhs, env, right_tmp);
+      return binary_op(b.op, b.rhs->has_calls ? left_tmp : left, right);
+    }
+    case ExprKind::And:
+    case ExprKind::Or: {
+      // An && chain that meets a false operand yields false for the whole
+      // expression, so it reports back whether it stopped early.
+      auto and_chain = [&](const Expr &term, bool &stopped) {
+        if (term.kind != ExprKind::And) return evaluate(term, env);
+        const auto &terms = static_cast<const LogicalExpr &>(term).terms;
+        Value left = evaluate(*terms[0], env);
+        for (size_t i = 1; i < terms.size(); ++i) {
+          if (!value_is_true(left)) {
+            stopped = true;
+            return Value::make_bool(false);
           }
+          left = Value::make_bool(value_is_true(evaluate(*terms[i], env)));
         }
-      } else if (auto te = std::dynamic_pointer_cast<TryExcept>(node)) {
-        try {
-          execute_block(te->try_block, std::make_shared<Environment>(env));
-        } catch (const BreakException &) {
-          throw;
-        } catch (const ContinueException &) {
-          throw;
-        } catch (const std::exception &) {
-          if (!te->except_block.empty()) {
-            execute_block(te->except_block, std::make_shared<Environment>(env));
-          } else {
-            throw;
+        return left;
+      };
+      bool stopped = false;
+      if (expr.kind == ExprKind::And) return and_chain(expr, stopped);
+      const auto &terms = static_cast<const LogicalExpr &>(expr).terms;
+      Value left = and_chain(*terms[0], stopped);
+      for (size_t i = 1; i < terms.size() && !stopped; ++i) {
+        if (value_is_true(left)) return Value::make_bool(true);
+        Value right = and_chain(*terms[i], stopped);
+        left = Value::make_bool(stopped ? false : value_is_true(right));
+      }
+      return left;
+    }
+    case ExprKind::Source:
+      return parse_expression(static_cast<const SourceExpr &>(expr).text, env);
+  }
+  throw std::runtime_error("Unknown expression");
+}
+
+// Expression text handed to eval_expr is classified and compiled once per
+// distinct text, as the expressions inside compiled statements are.
+static ExprPtr cached_expression(const std::string &text) {
+  static std::unordered_map<std::string, ExprPtr> cache;
+  auto it = cache.find(text);
+  if (it != cache.end()) return it->second;
+  if (cache.size() >= 256) cache.clear();
+  return cache.emplace(text, compile_expression(text)).first->second;
+}
+
+Value Interpreter::eval_expr(const std::string &expr,
+                             std::shared_ptr<Environment> env) {
+  ExprPtr compiled = cached_expression(expr);
+  return evaluate(*compiled, env);
+}
+
+Value Interpreter::execute_block(const NodeList &nodes,
+                                 std::shared_ptr<Environment> env) {
+  return execute(*compile(nodes), std::move(env));
+}
+
+namespace {
+
+// Loop state for repeat, for-in and while: the next iteration index, the
+// bound (repeat) or the list being walked (for-in), and the iteration scope.
+struct Iteration {
+  int64_t next = 0;
+  int64_t count = 0;
+  std::vector<Value> items;
+  std::shared_ptr<Environment> frame;
+};
+
+// Enters the scope for the next loop iteration. The previous iteration's
+// scope is cleared and reused unless something (a closure, a method) other
+// than the spare block scope kept inside it still holds on to it. A loop
+// that rebinds the same variable every iteration passes it as keep so the
+// binding is overwritten rather than recreated.
+void enter_iteration(Iteration &it, std::shared_ptr<Environment> &env,
+                     std::vector<std::shared_ptr<Environment>> &scopes,
+                     const std::shared_ptr<Environment> &spare_scope,
+                     std::optional<Symbol> keep = std::nullopt) {
+  long owners = spare_scope && spare_scope->parent == it.frame ? 2 : 1;
+  if (it.frame && it.frame.use_count() == owners) {
+    if (keep)
+      it.frame->clear_except(*keep);
+    else
+      it.frame->clear();
+  } else {
+    it.frame = std::make_shared<Environment>(env);
+  }
+  scopes.push_back(env);
+  env = it.frame;
+}
+
+struct Handler {
+  int32_t target;
+  size_t scopes;
+  size_t loops;
+};
+
+}  // namespace
+
+Value Interpreter::execute(const Code &code, std::shared_ptr<Environment> env) {
+  const Instr *ops = code.instrs.data();
+  const ExprPtr *exprs = code.exprs.data();
+  const std::string *names = code.names.data();
+  const Symbol *symbols = code.symbols.data();
+  std::vector<std::shared_ptr<Environment>> scopes;
+  std::shared_ptr<Environment> spare_scope;
+  std::vector<Iteration> loops;
+  std::vector<Handler> handlers;
+  int32_t pc = 0;
+  auto repeat_count = [&](const Expr &times) {
+    return static_cast<int64_t>(value_as_number(evaluate(times, env)));
+  };
+
+  for (;;) {
+    try {
+      for (;;) {
+        const Instr &in = ops[pc++];
+        switch (in.op) {
+          case Op::Halt:
+            return Value();
+          case Op::Say: {
+            Value tmp;
+            for (int e = in.a; e < in.a + in.b; ++e) {
+              const Value &v = operand(*exprs[e], env, tmp);
+              if (auto str = std::get_if<std::string>(&v.v))
+                std::cout << *str << '\n';
+              else
+                std::cout << value_to_string(v) << '\n';
+            }
+            break;
           }
-        }
-      } else if (auto r = std::dynamic_pointer_cast<Require>(node)) {
-        fs::path req_path(r->path);
-        if (req_path.extension() == ".baar") {
-          auto entries = read_archive(r->path);
-          std::string code;
-          for (const auto &entry : entries) {
-            if (entry.first == "main.bloa" || entry.first == "index.bloa") {
-              code = entry.second;
-              break;
+          case Op::Ask: {
+            Value tmp;
+            const Value &prompt = operand(*exprs[in.b], env, tmp);
+            if (auto str = std::get_if<std::string>(&prompt.v))
+              std::cout << *str << ' ';
+            else
+              std::cout << value_to_string(prompt) << ' ';
+            std::string input;
+            std::getline(std::cin, input);
+            // Input that reads fully as an integer or, failing that, as a
+            // number is stored as one; anything else stays a string.
+            Value parsed;
+            const char *begin = input.c_str();
+            const char *full = begin + input.size();
+            char *end = nullptr;
+            errno = 0;
+            long long xi = std::strtoll(begin, &end, 10);
+            if (end != begin && errno != ERANGE) {
+              if (end == full) {
+                parsed = Value::make_int(xi);
+              } else {
+                errno = 0;
+                double xd = std::strtod(begin, &end);
+                if (end == full && errno != ERANGE)
+                  parsed = Value::make_double(xd);
+              }
             }
+            if (std::holds_alternative<std::monostate>(parsed.v))
+              parsed = Value::make_str(std::move(input));
+            env->set(symbols[in.a], std::move(parsed));
+            break;
           }
-          if (code.empty()) {
-            for (const auto &entry : entries) {
-              if (fs::path(entry.first).extension() == ".bloa") {
-                code = entry.second;
+          case Op::Declare:
+            env->set_local(symbols[in.a], evaluate(*exprs[in.b], env));
+            break;
+          case Op::Assign: {
+            // A right-hand side without calls cannot add or remove
+            // variables, so an existing target is found before it runs and
+            // overwritten in place
+            const Expr &rhs = *exprs[in.b];
+            CachedBinding &binding = code.bindings[in.c];
+            if (!rhs.has_calls) {
+              if (Value *target = env->assignable(symbols[in.a], binding)) {
+                *target = update_in_place(*target, symbols[in.a], rhs, env);
                 break;
               }
             }
+            Value val = evaluate(rhs, env);
+            if (Value *target = env->assignable(symbols[in.a], binding)) {
+              *target = std::move(val);
+              break;
+            }
+            env->set(symbols[in.a], std::move(val));
+            break;
           }
-          if (code.empty() && !entries.empty()) code = entries[0].second;
-          if (code.empty())
-            throw std::runtime_error("Archive contains no Bloa entry: " +
-                                     r->path);
-          auto nodes = parse(code);
-          execute_block(nodes, env);
-        } else {
-          std::ifstream ifs(r->path);
-          if (!ifs) throw std::runtime_error("Require failed: " + r->path);
-          std::string code((std::istreambuf_iterator<char>(ifs)), {});
-          auto nodes = parse(code);
-          execute_block(nodes, env);
-        }
-      } else if (auto c = std::dynamic_pointer_cast<ClassDef>(node)) {
-        // Process class definition
-        ClassDefEntry class_entry;
-        class_entry.name = c->name;
-        class_entry.parent = c->parent;
-        class_entry.class_env =
-            env;  // capture the class definition environment
-
-        // Extract methods from class body
-        for (const auto &stmt : c->block) {
-          if (auto fd = std::dynamic_pointer_cast<FunctionDef>(stmt)) {
-            FunctionDefEntry method;
-            method.params = fd->params;
-            method.block = fd->block;
-            method.def_env = env;
-            class_entry.methods[fd->name] = std::move(method);
+          case Op::MemberAssign: {
+            const Value *obj_val = env->lookup(symbols[in.a]);
+            if (!obj_val) {
+              throw std::runtime_error("Undefined object '" +
+                                       symbol_name(symbols[in.a]) + "'");
+            }
+            if (!std::holds_alternative<std::shared_ptr<ObjectInstance>>(
+                    obj_val->v)) {
+              throw std::runtime_error("Cannot assign to member of non-object");
+            }
+            // Held before the right-hand side runs, as it may reassign the
+            // variable naming the object
+            auto obj_inst =
+                std::get<std::shared_ptr<ObjectInstance>>(obj_val->v);
+            Value rhs = evaluate(*exprs[in.b], env);
+            obj_inst->properties->set(symbols[in.c], std::move(rhs));
+            break;
           }
-        }
+          case Op::Eval:
+            evaluate(*exprs[in.a], env);
+            break;
+          case Op::Jump:
+            pc = in.b;
+            break;
+          case Op::JumpIfFalse: {
+            Value tmp;
+            if (!value_is_true(operand(*exprs[in.a], env, tmp))) pc = in.b;
+            break;
+          }
+          case Op::PushScope:
+            scopes.push_back(env);
+            if (spare_scope && spare_scope->parent == env)
+              env = std::move(spare_scope);
+            else
+              env = std::make_shared<Environment>(env);
+            break;
+          case Op::PopScope:
+            // A block run again from the same scope, as in a loop body,
+            // reuses its scope unless something still holds on to it
+            if (env.use_count() == 1) {
+              env->clear();
+              spare_scope = std::move(env);
+            }
+            env = std::move(scopes.back());
+            scopes.pop_back();
+            break;
+          case Op::RepeatInit: {
+            int64_t times = in.a >= 0 ? repeat_count(*exprs[in.a]) : in.b;
+            if (times < 0)
+              throw std::runtime_error("repeat count must be non-negative");
+            loops.emplace_back();
+            loops.back().count = times;
+            break;
+          }
+          case Op::RepeatSay: {
+            // A body of literal says prints the same text every iteration
+            int64_t times = repeat_count(*exprs[in.a]);
+            if (times < 0)
+              throw std::runtime_error("repeat count must be non-negative");
+            std::string text;
+            for (int e = in.b; e < in.b + in.c; ++e)
+              text += value_to_string(
+                          static_cast<const LiteralExpr &>(*exprs[e]).value) +
+                      '\n';
+            for (int64_t i = 0; i < times; ++i) std::cout << text;
+            break;
+          }
+          case Op::RepeatNext: {
+            Iteration &it = loops.back();
+            if (it.next >= it.count) {
+              loops.pop_back();
+              pc = in.b;
+              break;
+            }
+            static const Symbol count_sym = intern("count");
+            enter_iteration(it, env, scopes, spare_scope, count_sym);
+            env->set_local(count_sym, Value::make_int(++it.next));
+            break;
+          }
+          case Op::ForInit: {
+            Value itv = evaluate(*exprs[in.a], env);
+            if (!is_list_value(itv)) {
+              throw std::runtime_error("For-in requires a list");
+            }
+            loops.emplace_back();
+            loops.back().items = as_list(itv);
+            loops.back().count =
+                static_cast<int64_t>(loops.back().items.size());
+            break;
+          }
+          case Op::ForNext: {
+            Iteration &it = loops.back();
+            if (it.next >= it.count) {
+              loops.pop_back();
+              pc = in.b;
+              break;
+            }
+            enter_iteration(it, env, scopes, spare_scope);
+            env->set(symbols[in.a], it.items[static_cast<size_t>(it.next++)]);
+            break;
+          }
+          case Op::WhileInit:
+            loops.emplace_back();
+            break;
+          case Op::WhileNext: {
+            Value tmp;
+            if (!value_is_true(operand(*exprs[in.a], env, tmp))) {
+              loops.pop_back();
+              pc = in.b;
+              break;
+            }
+            enter_iteration(loops.back(), env, scopes, spare_scope);
+            break;
+          }
+          case Op::Unwind:
+            if (scopes.size() > static_cast<size_t>(in.a)) {
+              env = scopes[static_cast<size_t>(in.a)];
+              scopes.resize(static_cast<size_t>(in.a));
+            }
+            loops.resize(static_cast<size_t>(in.b));
+            handlers.resize(static_cast<size_t>(in.c));
+            break;
+          case Op::SetupExcept:
+            handlers.push_back(Handler{in.b, scopes.size(), loops.size()});
+            break;
+          case Op::PopExcept:
+            handlers.pop_back();
+            break;
+          case Op::DefineFunction: {
+            const auto &fd =
+                static_cast<const FunctionDef &>(*code.nodes[in.a]);
+            FunctionDefEntry entry;
+            for (const auto &param : fd.params)
+              entry.params.push_back(intern(param));
+            entry.code = code.children[in.b];
+            entry.def_env = env;
+            entry.pure = is_memoizable(*entry.code, fd.name, entry.params);
+            functions[fd.name] = std::move(entry);
+            generation = ++generation_counter;
+            break;
+          }
+          case Op::DefineClass: {
+            const auto &c = static_cast<const ClassDef &>(*code.nodes[in.a]);
+            ClassDefEntry class_entry;
+            class_entry.name = c.name;
+            class_entry.parent = c.parent;
+            class_entry.class_env =
+                env;  // capture the class definition environment
+
+            // Methods were compiled in declaration order
+            int32_t child = in.b;
+            for (const auto &stmt : c.block) {
+              if (stmt->kind != NodeKind::FunctionDef) continue;
+              const auto &fd = static_cast<const FunctionDef &>(*stmt);
+              FunctionDefEntry method;
+              for (const auto &param : fd.params)
+                method.params.push_back(intern(param));
+              method.code = code.children[child++];
+              method.def_env = env;
+              class_entry.methods[fd.name] = std::move(method);
+            }
 
-        // Store the class
-        classes[c->name] = std::move(class_entry);
+            // Store the class
+            classes[c.name] = std::move(class_entry);
+            generation = ++generation_counter;
 
-        // Make the class available as a value for instantiation
-        env->set(c->name, Value::make_str("<class '" + c->name + "'>"));
-      } else {
-        throw std::runtime_error("Unknown AST node");
+            // Make the class available as a value for instantiation
+            env->set(c.name, Value::make_str("<class '" + c.name + "'>"));
+            break;
+          }
+          case Op::Import: {
+            const auto &imp = static_cast<const Import &>(*code.nodes[in.a]);
+            std::string mod = imp.name;
+            std::replace(mod.begin(), mod.end(), '\\',
+                         static_cast<char>(fs::path::preferred_separator));
+            fs::path p = std::filesystem::path(stdlib_path).empty()
+                             ? (fs::path(mod) += ".bloa")
+                             : (fs::path(stdlib_path) / mod) += ".bloa";
+            if (!fs::exists(p)) {
+              throw std::runtime_error("Module not found: '" + imp.name + "'");
+            }
+            // A module runs once; it runs again only if its file changed
+            auto mod_code = cached_parse_file(p);
+            auto &loaded = loaded_modules[imp.name];
+            if (loaded.code != mod_code) {
+              auto mod_env = std::make_shared<Environment>(globals());
+              Interpreter mod_interp("");
+              mod_interp.execute(*mod_code, mod_env);
+              loaded = LoadedModule{mod_code, mod_env};
+            }
+            env->set(imp.name, Value::make_str("<module '" + imp.name + "'>"));
+            break;
+          }
+          case Op::Require: {
+            const auto &r = static_cast<const Require &>(*code.nodes[in.a]);
+            fs::path req_path(r.path);
+            std::string source;
+            if (req_path.extension() == ".baar") {
+              auto entries = read_archive(r.path);
+              for (const auto &entry : entries) {
+                if (entry.first == "main.bloa" || entry.first == "index.bloa") {
+                  source = entry.second;
+                  break;
+                }
+              }
+              if (source.empty()) {
+                for (const auto &entry : entries) {
+                  if (fs::path(entry.first).extension() == ".bloa") {
+                    source = entry.second;
+                    break;
+                  }
+                }
+              }
+              if (source.empty() && !entries.empty())
+                source = entries[0].second;
+              if (source.empty())
+                throw std::runtime_error("Archive contains no Bloa entry: " +
+                                         r.path);
+            } else if (fs::is_regular_file(req_path)) {
+              // Like a module, a file is only read again once it changes
+              execute(*cached_parse_file(req_path), env);
+              break;
+            } else {
+              std::ifstream ifs(r.path);
+              if (!ifs) throw std::runtime_error("Require failed: " + r.path);
+              source.assign((std::istreambuf_iterator<char>(ifs)), {});
+            }
+            // Compiled once per source text, like a program passed to run()
+            auto req_code = cached_parse("require:" + r.path, source, source);
+            execute(*req_code, env);
+            break;
+          }
+          case Op::Return:
+            if (in.a < 0) return Value();
+            return evaluate(*exprs[in.a], env);
+          case Op::Fail:
+            throw std::runtime_error(names[in.a]);
+        }
       }
-    } catch (const std::exception &e) {
-      throw;
+    } catch (const std::exception &) {
+      if (handlers.empty()) throw;
+      Handler h = handlers.back();
+      handlers.pop_back();
+      if (scopes.size() > h.scopes) {
+        env = scopes[h.scopes];
+        scopes.resize(h.scopes);
+      }
+      loops.resize(h.loops);
+      pc = h.target;
     }
   }
-  return Value();
 }
 
 }  // namespace bloa
@@ -1,3 +1,5 @@
+#include <unistd.h>
+
 #include <fstream>
 #include <iostream>
 #include <sstream>
@@ -42,6 +44,10 @@ void start_repl() {
 }
 
 int main(int argc, char **argv) {
+  // Output to a pipe or file goes through cout's own buffer instead of a
+  // stdio call per write; a terminal keeps seeing each line as it is said.
+  if (!isatty(STDOUT_FILENO)) std::ios::sync_with_stdio(false);
+
   if (argc < 2) {
     start_repl();
     return 0;
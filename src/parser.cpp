@@ -4,18 +4,79 @@
 #include <iostream>
 #include <sstream>
 #include <stdexcept>
+#include <string_view>
+#include <unordered_map>
 
 namespace bloa {
 
-static std::string remove_comments(const std::string &code);
-
 std::vector<std::string> split_lines(const std::string &code) {
   std::vector<std::string> out;
   std::string line;
-  std::istringstream iss(remove_comments(code));
-  while (std::getline(iss, line)) {
-    out.push_back(line);
+  // Comments are dropped as the lines are cut, in a single pass
+  auto emit = [&](char c) {
+    if (c == '\n') {
+      out.push_back(std::move(line));
+      line.clear();
+    } else {
+      line.push_back(c);
+    }
+  };
+  bool in_single = false;
+  bool in_double = false;
+  bool in_block = false;
+
+  for (size_t i = 0; i < code.size(); ++i) {
+    char c = code[i];
+
+    if (in_block) {
+      if (c == '*' && i + 1 < code.size() && code[i + 1] == '/') {
+        in_block = false;
+        ++i;
+      } else if (c == '\n') {
+        emit(c);
+      }
+      continue;
+    }
+
+    if (in_single) {
+      if (c == '\n') {
+        in_single = false;
+        emit(c);
+      }
+      continue;
+    }
+
+    if (c == '"' && !in_single) {
+      in_double = !in_double;
+      emit(c);
+      continue;
+    }
+    if (c == '\'' && !in_double) {
+      in_single = !in_single;
+      emit(c);
+      continue;
+    }
+
+    if (!in_single && !in_double) {
+      if (c == '/' && i + 1 < code.size()) {
+        if (code[i + 1] == '/') {
+          // single-line comment
+          i += 1;
+          while (i + 1 < code.size() && code[i + 1] != '\n') ++i;
+          continue;
+        }
+        if (code[i + 1] == '*') {
+          in_block = true;
+          ++i;
+          continue;
+        }
+      }
+    }
+
+    emit(c);
   }
+
+  if (!line.empty()) out.push_back(std::move(line));
   return out;
 }
 
@@ -63,6 +124,13 @@ static std::string rtrim(const std::string &s) {
   return s.substr(0, pos + 1);
 }
 
+static std::string_view trim_view(std::string_view s) {
+  size_t a = s.find_first_not_of(" \t\r\n");
+  if (a == std::string_view::npos) return {};
+  size_t b = s.find_last_not_of(" \t\r\n");
+  return s.substr(a, b - a + 1);
+}
+
 static std::string strip_trailing_semicolon(std::string line) {
   if (line.empty() || line.back() != ';') return line;
   bool in_single = false;
@@ -86,81 +154,85 @@ static std::string strip_trailing_semicolon(std::string line) {
   return line;
 }
 
-static std::string remove_comments(const std::string &code) {
-  std::string out;
-  bool in_single = false;
-  bool in_double = false;
-  bool in_block = false;
-
-  for (size_t i = 0; i < code.size(); ++i) {
-    char c = code[i];
-
-    if (in_block) {
-      if (c == '*' && i + 1 < code.size() && code[i + 1] == '/') {
-        in_block = false;
-        ++i;
-      } else if (c == '\n') {
-        out.push_back(c);
-      }
-      continue;
-    }
-
-    if (in_single) {
-      if (c == '\n') {
-        in_single = false;
-        out.push_back(c);
-      }
-      continue;
-    }
-
-    if (c == '"' && !in_single) {
-      in_double = !in_double;
-      out.push_back(c);
-      continue;
-    }
-    if (c == '\'' && !in_double) {
-      in_single = !in_single;
-      out.push_back(c);
-      continue;
-    }
+enum class Keyword {
+  None,
+  Say,
+  Echo,
+  Ask,
+  Use,
+  Require,
+  Return,
+  If,
+  While,
+  Repeat,
+  For,
+  Foreach,
+  Function,
+  Class,
+  Try,
+  Break,
+  Continue,
+};
+
+// Statements are recognised by their first word, which ends at the first
+// space, '(', '{' or ';'. Each statement still checks its full syntax, and
+// lines that do not match fall through to assignments and expressions.
+static Keyword statement_keyword(const std::string &line) {
+  static const std::unordered_map<std::string_view, Keyword> keywords = {
+      {"say", Keyword::Say},
+      {"echo", Keyword::Echo},
+      {"ask", Keyword::Ask},
+      {"use", Keyword::Use},
+      {"require", Keyword::Require},
+      {"return", Keyword::Return},
+      {"if", Keyword::If},
+      {"while", Keyword::While},
+      {"repeat", Keyword::Repeat},
+      {"for", Keyword::For},
+      {"foreach", Keyword::Foreach},
+      {"for-in", Keyword::Foreach},
+      {"function", Keyword::Function},
+      {"class", Keyword::Class},
+      {"try", Keyword::Try},
+      {"break", Keyword::Break},
+      {"continue", Keyword::Continue},
+  };
+  std::string_view head(line);
+  head = head.substr(0, head.find_first_of(" ({;"));
+  auto it = keywords.find(head);
+  return it == keywords.end() ? Keyword::None : it->second;
+}
 
-    if (!in_single && !in_double) {
-      if (c == '/' && i + 1 < code.size()) {
-        if (code[i + 1] == '/') {
-          // single-line comment
-          i += 1;
-          while (i + 1 < code.size() && code[i + 1] != '\n') ++i;
-          continue;
-        }
-        if (code[i + 1] == '*') {
-          in_block = true;
-          ++i;
-          continue;
-        }
-      }
-    }
+namespace {
 
-    out.push_back(c);
-  }
+// The lines being parsed along with their indentation and their trimmed
+// text, with and without a trailing semicolon, all worked out once up front
+// rather than each time a block or a look-ahead visits a line.
+struct SourceLines {
+  const std::vector<std::string> &lines;
+  std::vector<int> indents;
+  std::vector<std::string_view> trimmed;
+  std::vector<std::string> statements;
+};
 
-  return out;
-}
+}  // namespace
 
-std::pair<NodeList, int> parse_block(const std::vector<std::string> &lines,
-                                     int start_idx, int base_indent) {
+static std::pair<NodeList, int> parse_lines(const SourceLines &src,
+                                            int start_idx, int base_indent) {
+  const auto &lines = src.lines;
   int idx = start_idx;
   NodeList nodes;
 
   while (idx < (int)lines.size()) {
-    const std::string raw_line = lines[idx];
-    std::string line = strip_trailing_semicolon(ltrim(rtrim(raw_line)));
+    const std::string &raw_line = lines[idx];
+    const std::string &line = src.statements[idx];
 
     if (line.empty() || line.rfind("#", 0) == 0) {
       idx++;
       continue;
     }
 
-    int indent = indent_level(raw_line);
+    int indent = src.indents[idx];
     if (indent < base_indent) break;
 
     /* block end */
@@ -169,204 +241,226 @@ std::pair<NodeList, int> parse_block(const std::vector<std::string> &lines,
       break;
     }
 
-    /* say */
-    if (starts_with(line, "say ")) {
-      nodes.push_back(std::make_shared<Say>(line.substr(4)));
-      idx++;
-      continue;
-    }
+    switch (statement_keyword(line)) {
+      case Keyword::Say:
+        if (!starts_with(line, "say ")) break;
+        nodes.push_back(std::make_shared<Say>(line.substr(4)));
+        idx++;
+        continue;
 
-    /* echo */
-    if (starts_with(line, "echo ")) {
-      nodes.push_back(std::make_shared<Say>(line.substr(5)));
-      idx++;
-      continue;
-    }
+      case Keyword::Echo:
+        if (!starts_with(line, "echo ")) break;
+        nodes.push_back(std::make_shared<Say>(line.substr(5)));
+        idx++;
+        continue;
 
-    /* ask */
-    if (starts_with(line, "ask ")) {
-      auto pos = line.find("->");
-      if (pos == std::string::npos)
-        throw_parse_error(idx + 1, "Invalid ask syntax (expected '->')",
-                          raw_line, first_nonspace_col(raw_line));
-      nodes.push_back(std::make_shared<Ask>(ltrim(line.substr(4, pos - 4)),
-                                            ltrim(line.substr(pos + 2))));
-      idx++;
-      continue;
-    }
+      case Keyword::Ask: {
+        if (!starts_with(line, "ask ")) break;
+        auto pos = line.find("->");
+        if (pos == std::string::npos)
+          throw_parse_error(idx + 1, "Invalid ask syntax (expected '->')",
+                            raw_line, first_nonspace_col(raw_line));
+        nodes.push_back(std::make_shared<Ask>(ltrim(line.substr(4, pos - 4)),
+                                              ltrim(line.substr(pos + 2))));
+        idx++;
+        continue;
+      }
 
-    /* use */
-    if (starts_with(line, "use ") && line.back() == ';') {
-      std::string mod = line.substr(4, line.size() - 5);
-      nodes.push_back(std::make_shared<Import>(mod));
-      idx++;
-      continue;
-    }
+      case Keyword::Use: {
+        if (!starts_with(line, "use ")) break;
+        std::string mod = line.substr(4);
+        if (!mod.empty() && mod.back() == ';') mod.pop_back();
+        nodes.push_back(std::make_shared<Import>(mod));
+        idx++;
+        continue;
+      }
 
-    /* require */
-    if (starts_with(line, "require ")) {
-      std::string path = line.substr(8);
-      if (!path.empty() && path.back() == ';') path.pop_back();
-      nodes.push_back(std::make_shared<Require>(path));
-      idx++;
-      continue;
-    }
+      case Keyword::Require: {
+        if (!starts_with(line, "require ")) break;
+        std::string path = line.substr(8);
+        if (!path.empty() && path.back() == ';') path.pop_back();
+        nodes.push_back(std::make_shared<Require>(path));
+        idx++;
+        continue;
+      }
 
-    /* return */
-    if (line == "return;") {
-      nodes.push_back(std::make_shared<Return>(std::optional<std::string>{}));
-      idx++;
-      continue;
-    }
-    if (starts_with(line, "return ")) {
-      std::string expr = line.substr(7);
-      if (!expr.empty() && expr.back() == ';') expr.pop_back();
-      nodes.push_back(std::make_shared<Return>(expr));
-      idx++;
-      continue;
-    }
+      case Keyword::Return: {
+        if (line == "return" || line == "return;") {
+          nodes.push_back(
+              std::make_shared<Return>(std::optional<std::string>{}));
+          idx++;
+          continue;
+        }
+        if (!starts_with(line, "return ")) break;
+        std::string expr = line.substr(7);
+        if (!expr.empty() && expr.back() == ';') expr.pop_back();
+        nodes.push_back(std::make_shared<Return>(expr));
+        idx++;
+        continue;
+      }
 
-    /* if */
-    if (starts_with(line, "if (") && line.back() == '{') {
-      std::string cond = line.substr(4, line.size() - 6);
-      auto [then_block, next] = parse_block(lines, idx + 1, base_indent);
-      NodeList else_block;
-
-      if (next < (int)lines.size()) {
-        std::string next_line = ltrim(rtrim(lines[next]));
-        if (next_line == "else {") {
-          auto res = parse_block(lines, next + 1, base_indent);
-          else_block = res.first;
-          next = res.second;
+      case Keyword::If: {
+        if (!starts_with(line, "if (") || line.back() != '{') break;
+        std::string cond = line.substr(4, line.size() - 6);
+        auto [then_block, next] = parse_lines(src, idx + 1, base_indent);
+        NodeList else_block;
+
+        if (next < (int)lines.size()) {
+          std::string_view next_line = src.trimmed[next];
+          if (next_line == "else {") {
+            auto res = parse_lines(src, next + 1, base_indent);
+            else_block = res.first;
+            next = res.second;
+          }
         }
+
+        nodes.push_back(std::make_shared<If>(cond, then_block, else_block));
+        idx = next;
+        continue;
       }
 
-      nodes.push_back(std::make_shared<If>(cond, then_block, else_block));
-      idx = next;
-      continue;
-    }
+      case Keyword::While: {
+        if (!starts_with(line, "while (") || line.back() != '{') break;
+        std::string cond = line.substr(7, line.size() - 9);
+        auto res = parse_lines(src, idx + 1, base_indent);
+        nodes.push_back(std::make_shared<While>(cond, res.first));
+        idx = res.second;
+        continue;
+      }
 
-    /* while */
-    if (starts_with(line, "while (") && line.back() == '{') {
-      std::string cond = line.substr(7, line.size() - 9);
-      auto res = parse_block(lines, idx + 1, base_indent);
-      nodes.push_back(std::make_shared<While>(cond, res.first));
-      idx = res.second;
-      continue;
-    }
+      case Keyword::Repeat: {
+        if (!starts_with(line, "repeat (") || line.back() != '{') break;
+        std::string times = line.substr(8, line.size() - 11);
+        auto res = parse_lines(src, idx + 1, base_indent);
+        nodes.push_back(std::make_shared<Repeat>(times, res.first));
+        idx = res.second;
+        continue;
+      }
+
+      case Keyword::For:
+      case Keyword::Foreach: {
+        /* foreach / for-in / for syntax */
+        if ((!starts_with(line, "foreach (") &&
+             !starts_with(line, "for-in (") && !starts_with(line, "for (")) ||
+            line.back() != '{')
+          break;
+        size_t start = line.find('(');
+        std::string header = line.substr(start + 1, line.size() - start - 4);
+        std::string iterable;
+        std::string var;
+        if (starts_with(line, "for (")) {
+          auto pos = header.find(" in ");
+          if (pos == std::string::npos)
+            throw_parse_error(idx + 1,
+                              "Invalid for syntax (expected 'in' in header)",
+                              raw_line, first_nonspace_col(raw_line));
+          var = header.substr(0, pos);
+          iterable = header.substr(pos + 4);
+        } else {
+          auto pos = header.find(" as ");
+          if (pos == std::string::npos)
+            throw_parse_error(
+                idx + 1,
+                "Invalid foreach/for-in syntax (expected 'as' in header)",
+                raw_line, first_nonspace_col(raw_line));
+          iterable = header.substr(0, pos);
+          var = header.substr(pos + 4);
+        }
+        auto res = parse_lines(src, idx + 1, base_indent);
+        nodes.push_back(std::make_shared<ForIn>(
+            ltrim(rtrim(var)), ltrim(rtrim(iterable)), res.first));
+        idx = res.second;
+        continue;
+      }
 
-    /* foreach / for-in / for syntax */
-    if ((starts_with(line, "foreach (") || starts_with(line, "for-in (") ||
-         starts_with(line, "for (")) &&
-        line.back() == '{') {
-      size_t start = line.find('(');
-      std::string header = line.substr(start + 1, line.size() - start - 4);
-      std::string iterable;
-      std::string var;
-      if (starts_with(line, "for (")) {
-        auto pos = header.find(" in ");
+      case Keyword::Function: {
+        if (!starts_with(line, "function ") || line.back() != '{') break;
+        std::string header_raw = line.substr(9, line.size() - 10);
+        std::string header = ltrim(rtrim(header_raw));
+        auto pos = header.find('(');
         if (pos == std::string::npos)
           throw_parse_error(idx + 1,
-                            "Invalid for syntax (expected 'in' in header)",
+                            "Invalid function syntax (expected '(' after name)",
                             raw_line, first_nonspace_col(raw_line));
-        var = header.substr(0, pos);
-        iterable = header.substr(pos + 4);
-      } else {
-        auto pos = header.find(" as ");
-        if (pos == std::string::npos)
-          throw_parse_error(
-              idx + 1,
-              "Invalid foreach/for-in syntax (expected 'as' in header)",
-              raw_line, first_nonspace_col(raw_line));
-        iterable = header.substr(0, pos);
-        var = header.substr(pos + 4);
-      }
-      auto res = parse_block(lines, idx + 1, base_indent);
-      nodes.push_back(std::make_shared<ForIn>(
-          ltrim(rtrim(var)), ltrim(rtrim(iterable)), res.first));
-      idx = res.second;
-      continue;
-    }
 
-    /* function */
-    if (starts_with(line, "function ") && line.back() == '{') {
-      std::string header_raw = line.substr(9, line.size() - 10);
-      std::string header = ltrim(rtrim(header_raw));
-      auto pos = header.find('(');
-      if (pos == std::string::npos)
-        throw_parse_error(idx + 1,
-                          "Invalid function syntax (expected '(' after name)",
-                          raw_line, first_nonspace_col(raw_line));
-
-      std::string name = header.substr(0, pos);
-      std::string params_raw = header.substr(pos + 1, header.size() - pos - 2);
-
-      std::vector<std::string> params;
-      std::istringstream iss(params_raw);
-      std::string tok;
-      while (std::getline(iss, tok, ',')) {
-        tok = ltrim(rtrim(tok));
-        if (!tok.empty()) params.push_back(tok);
+        std::string name = header.substr(0, pos);
+        std::string params_raw =
+            header.substr(pos + 1, header.size() - pos - 2);
+
+        std::vector<std::string> params;
+        std::istringstream iss(params_raw);
+        std::string tok;
+        while (std::getline(iss, tok, ',')) {
+          tok = ltrim(rtrim(tok));
+          if (!tok.empty()) params.push_back(tok);
+        }
+
+        auto res = parse_lines(src, idx + 1, base_indent);
+        nodes.push_back(std::make_shared<FunctionDef>(name, params, res.first));
+        idx = res.second;
+        continue;
       }
 
-      auto res = parse_block(lines, idx + 1, base_indent);
-      nodes.push_back(std::make_shared<FunctionDef>(name, params, res.first));
-      idx = res.second;
-      continue;
-    }
+      case Keyword::Class: {
+        if (!starts_with(line, "class ") || line.back() != '{') break;
+        std::string header_raw = line.substr(6, line.size() - 7);
+        std::string header = ltrim(rtrim(header_raw));
+        std::optional<std::string> parent;
+        std::string name;
+
+        auto extends_pos = header.find(" extends ");
+        if (extends_pos != std::string::npos) {
+          name = ltrim(rtrim(header.substr(0, extends_pos)));
+          parent = ltrim(rtrim(header.substr(extends_pos + 9)));
+        } else {
+          name = header;
+        }
 
-    /* class */
-    if (starts_with(line, "class ") && line.back() == '{') {
-      std::string header_raw = line.substr(6, line.size() - 7);
-      std::string header = ltrim(rtrim(header_raw));
-      std::optional<std::string> parent;
-      std::string name;
-
-      auto extends_pos = header.find(" extends ");
-      if (extends_pos != std::string::npos) {
-        name = ltrim(rtrim(header.substr(0, extends_pos)));
-        parent = ltrim(rtrim(header.substr(extends_pos + 9)));
-      } else {
-        name = header;
+        auto res = parse_lines(src, idx + 1, base_indent);
+        nodes.push_back(std::make_shared<ClassDef>(name, parent, res.first));
+        idx = res.second;
+        continue;
       }
 
-      auto res = parse_block(lines, idx + 1, base_indent);
-      nodes.push_back(std::make_shared<ClassDef>(name, parent, res.first));
-      idx = res.second;
-      continue;
-    }
+      case Keyword::Try: {
+        /* try/except */
+        if (line != "try {") break;
+        auto try_res = parse_lines(src, idx + 1, base_indent);
+        NodeList except_block;
+        int next = try_res.second;
+        if (next < (int)lines.size()) {
+          std::string_view next_line = src.trimmed[next];
+          if (next_line == "except {") {
+            auto except_res = parse_lines(src, next + 1, base_indent);
+            except_block = except_res.first;
+            next = except_res.second;
+          } else {
+            throw_parse_error(next + 1, "Expected 'except {' after try block",
+                              lines[next], first_nonspace_col(lines[next]));
+          }
+        }
+        nodes.push_back(
+            std::make_shared<TryExcept>(try_res.first, except_block));
+        idx = next;
+        continue;
+      }
 
-    /* try/except */
-    if (line == "try {") {
-      auto try_res = parse_block(lines, idx + 1, base_indent);
-      NodeList except_block;
-      int next = try_res.second;
-      if (next < (int)lines.size()) {
-        std::string next_line = ltrim(rtrim(lines[next]));
-        if (next_line == "except {") {
-          auto except_res = parse_block(lines, next + 1, base_indent);
-          except_block = except_res.first;
-          next = except_res.second;
+      case Keyword::Break:
+      case Keyword::Continue: {
+        /* break / continue; the trailing ';' is already stripped */
+        if (line == "break" || line == "break;") {
+          nodes.push_back(std::make_shared<Break>());
+        } else if (line == "continue" || line == "continue;") {
+          nodes.push_back(std::make_shared<Continue>());
         } else {
-          throw_parse_error(next + 1, "Expected 'except {' after try block",
-                            lines[next], first_nonspace_col(lines[next]));
+          break;
         }
+        idx++;
+        continue;
       }
-      nodes.push_back(std::make_shared<TryExcept>(try_res.first, except_block));
-      idx = next;
-      continue;
-    }
 
-    /* break / continue */
-    if (line == "break;") {
-      nodes.push_back(std::make_shared<Break>());
-      idx++;
-      continue;
-    }
-    if (line == "continue;") {
-      nodes.push_back(std::make_shared<Continue>());
-      idx++;
-      continue;
+      case Keyword::None:
+        break;
     }
 
     /* assignment */
@@ -459,4 +553,19 @@ std::pair<NodeList, int> parse_block(const std::vector<std::string> &lines,
   return {nodes, idx};
 }
 
+std::pair<NodeList, int> parse_block(const std::vector<std::string> &lines,
+                                     int start_idx, int base_indent) {
+  SourceLines src{lines, {}, {}, {}};
+  src.indents.reserve(lines.size());
+  src.trimmed.reserve(lines.size());
+  src.statements.reserve(lines.size());
+  for (const auto &line : lines) {
+    src.indents.push_back(indent_level(line));
+    src.trimmed.push_back(trim_view(line));
+    src.statements.push_back(
+        strip_trailing_semicolon(std::string(src.trimmed.back())));
+  }
+  return parse_lines(src, start_idx, base_indent);
+}
+
 }  // namespace bloa
@@ -84,7 +84,8 @@ static std::string json_stringify_value(const Value &v);
 static std::string base64_encode(const std::string &data);
 static std::string base64_decode(const std::string &data);
 static std::string uuid4();
-static bool glob_match(const std::string &pattern, const std::string &text);
+static const std::regex &compiled_regex(const std::string &pattern);
+static std::string glob_to_regex(const std::string &pattern);
 static std::vector<Value> copy_list(const std::vector<Value> &list) {
   std::vector<Value> result;
   result.reserve(list.size());
@@ -100,11 +101,7 @@ static Value copy_value(const Value &v) {
   }
   if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(v.v)) {
     const auto &obj = std::get<std::shared_ptr<ObjectInstance>>(v.v);
-    auto props = std::make_shared<Environment>(obj->properties->parent);
-    for (const auto &name : obj->properties->local_keys()) {
-      auto value_opt = obj->properties->get_local(name);
-      if (value_opt) props->set_local(name, *value_opt);
-    }
+    auto props = std::make_shared<Environment>(*obj->properties);
     return Value::make_object(obj->class_name, std::move(props));
   }
   if (std::holds_alternative<std::shared_ptr<Reference>>(v.v)) {
@@ -438,7 +435,17 @@ static std::string uuid4() {
   return oss.str();
 }
 
-static bool glob_match(const std::string &pattern, const std::string &text) {
+// Compiling a std::regex is far more expensive than matching with it, and
+// scripts tend to reuse a handful of patterns, so compiled patterns are kept.
+static const std::regex &compiled_regex(const std::string &pattern) {
+  static std::unordered_map<std::string, std::regex> cache;
+  auto it = cache.find(pattern);
+  if (it != cache.end()) return it->second;
+  if (cache.size() >= 256) cache.clear();
+  return cache.emplace(pattern, std::regex(pattern)).first->second;
+}
+
+static std::string glob_to_regex(const std::string &pattern) {
   std::string regex_pattern;
   regex_pattern.reserve(pattern.size() * 2 + 4);
   regex_pattern.push_back('^');
@@ -475,7 +482,7 @@ static bool glob_match(const std::string &pattern, const std::string &text) {
     }
   }
   regex_pattern.push_back('$');
-  return std::regex_match(text, std::regex(regex_pattern));
+  return regex_pattern;
 }
 
 static std::vector<Value> parse_csv_text(const std::string &text, char delim) {
@@ -712,1054 +719,1326 @@ void register_stdlib(std::shared_ptr<Environment> env) {
 #endif
 }
 
-Value handle_builtin(const std::string &marker, const std::vector<Value> &args,
-                     std::shared_ptr<Environment> env) {
-  if (marker == "__builtin_print" || marker == "__builtin_echo") {
-    for (size_t i = 0; i < args.size(); ++i) {
-      if (i > 0) std::cout << ' ';
-      std::cout << value_to_string(args[i]);
-    }
-    std::cout << '\n';
-    return Value();
-  }
-  if (marker == "__builtin_isset") {
-    if (!env) throw std::runtime_error("isset() requires environment access");
-    if (args.size() == 1 && std::holds_alternative<std::string>(args[0].v)) {
-      return Value::make_bool(env->has(std::get<std::string>(args[0].v)));
-    }
-    if (args.size() == 2 &&
-        std::holds_alternative<std::shared_ptr<ObjectInstance>>(args[0].v) &&
-        std::holds_alternative<std::string>(args[1].v)) {
-      auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
-      return Value::make_bool(
-          obj->properties->has(std::get<std::string>(args[1].v)));
-    }
-    throw std::runtime_error(
-        "isset() requires 1 string argument or (object, member)");
-  }
-  if (marker == "__builtin_unset") {
-    if (!env) throw std::runtime_error("unset() requires environment access");
-    if (args.size() == 1 && std::holds_alternative<std::string>(args[0].v)) {
-      return Value::make_bool(env->remove(std::get<std::string>(args[0].v)));
-    }
-    if (args.size() == 2 &&
-        std::holds_alternative<std::shared_ptr<ObjectInstance>>(args[0].v) &&
-        std::holds_alternative<std::string>(args[1].v)) {
-      auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
-      return Value::make_bool(
-          obj->properties->remove(std::get<std::string>(args[1].v)));
-    }
-    throw std::runtime_error(
-        "unset() requires 1 string argument or (object, member)");
-  }
-  if (marker == "__builtin_ref") {
-    if (!env || args.size() != 1 ||
-        !std::holds_alternative<std::string>(args[0].v))
-      throw std::runtime_error("ref() requires 1 string argument");
-    std::string name = std::get<std::string>(args[0].v);
-    auto current = env;
-    while (current && !current->has_local(name)) current = current->parent;
-    if (!current)
-      throw std::runtime_error("Undefined variable for ref(): " + name);
-    return Value::make_ref(current, name);
-  }
-  if (marker == "__builtin_deref") {
-    if (args.size() != 1 ||
-        !std::holds_alternative<std::shared_ptr<Reference>>(args[0].v))
-      throw std::runtime_error("deref() requires 1 reference argument");
-    auto ref = std::get<std::shared_ptr<Reference>>(args[0].v);
-    auto target = ref->env->get(ref->name);
-    if (!target)
-      throw std::runtime_error("Invalid reference target: " + ref->name);
-    return *target;
-  }
-  if (marker == "__builtin_set_ref") {
-    if (args.size() != 2 ||
-        !std::holds_alternative<std::shared_ptr<Reference>>(args[0].v))
-      throw std::runtime_error("set_ref() requires 1 reference and 1 value");
-    auto ref = std::get<std::shared_ptr<Reference>>(args[0].v);
-    ref->env->set(ref->name, args[1]);
-    return Value();
-  }
-  if (marker == "__builtin_is_ref") {
-    if (args.size() != 1)
-      throw std::runtime_error("is_ref() requires 1 argument");
-    return Value::make_bool(
-        std::holds_alternative<std::shared_ptr<Reference>>(args[0].v));
-  }
-  if (marker == "__builtin_range") {
-    int64_t start = 0;
-    int64_t stop = 0;
-    int64_t step = 1;
-    if (args.size() == 1) {
-      stop = static_cast<int64_t>(value_as_number(args[0]).as_number());
-    } else if (args.size() == 2) {
-      start = static_cast<int64_t>(value_as_number(args[0]).as_number());
-      stop = static_cast<int64_t>(value_as_number(args[1]).as_number());
-    } else if (args.size() == 3) {
-      start = static_cast<int64_t>(value_as_number(args[0]).as_number());
-      stop = static_cast<int64_t>(value_as_number(args[1]).as_number());
-      step = static_cast<int64_t>(value_as_number(args[2]).as_number());
-    } else {
-      throw std::runtime_error("range() requires 1 to 3 numeric arguments");
-    }
-    if (step == 0) throw std::runtime_error("range() step cannot be zero");
-    std::vector<Value> list;
-    if (step > 0) {
-      for (int64_t i = start; i < stop; i += step)
-        list.push_back(Value::make_int(i));
-    } else {
-      for (int64_t i = start; i > stop; i += step)
-        list.push_back(Value::make_int(i));
-    }
-    return Value::make_list(list);
-  }
-  if (marker == "__builtin_len") {
-    if (args.size() != 1) throw std::runtime_error("len() requires 1 argument");
-    const auto &arg = args[0];
-    if (std::holds_alternative<std::string>(arg.v)) {
-      return Value::make_int(
-          static_cast<int64_t>(std::get<std::string>(arg.v).size()));
-    } else if (std::holds_alternative<std::vector<Value>>(arg.v)) {
-      return Value::make_int(
-          static_cast<int64_t>(std::get<std::vector<Value>>(arg.v).size()));
-    } else if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(arg.v)) {
-      return Value::make_int(
-          static_cast<int64_t>(std::get<std::shared_ptr<ObjectInstance>>(arg.v)
-                                   ->properties->local_keys()
-                                   .size()));
-    } else {
-      throw std::runtime_error(
-          "len() argument must be string, list, or object");
-    }
-  }
-  if (marker == "__builtin_copy" || marker == "__builtin_clone") {
-    if (args.size() != 1)
-      throw std::runtime_error("copy() requires 1 argument");
-    return copy_value(args[0]);
-  }
-  if (marker == "__builtin_slice") {
-    if (args.size() < 2 || args.size() > 3)
-      throw std::runtime_error("slice() requires 2 or 3 arguments");
-    const auto &source = args[0];
-    int64_t start = static_cast<int64_t>(value_as_number(args[1]).as_number());
-    int64_t length = -1;
-    if (args.size() == 3)
-      length = static_cast<int64_t>(value_as_number(args[2]).as_number());
-    if (std::holds_alternative<std::string>(source.v)) {
-      std::string s = std::get<std::string>(source.v);
-      if (start < 0) start = static_cast<int64_t>(s.size()) + start;
-      if (start < 0) start = 0;
-      if (length < 0)
-        return Value::make_str(s.substr(static_cast<size_t>(start)));
-      return Value::make_str(
-          s.substr(static_cast<size_t>(start), static_cast<size_t>(length)));
-    }
-    if (std::holds_alternative<std::vector<Value>>(source.v)) {
-      const auto &list = std::get<std::vector<Value>>(source.v);
-      if (start < 0) start = static_cast<int64_t>(list.size()) + start;
-      if (start < 0) start = 0;
-      int64_t end =
-          (length < 0) ? static_cast<int64_t>(list.size()) : start + length;
-      if (end > static_cast<int64_t>(list.size()))
-        end = static_cast<int64_t>(list.size());
-      std::vector<Value> out;
-      for (int64_t i = start; i < end; ++i)
-        out.push_back(list[static_cast<size_t>(i)]);
-      return Value::make_list(std::move(out));
-    }
-    throw std::runtime_error("slice() source must be string or list");
-  }
-  if (marker == "__builtin_sorted") {
-    if (args.size() != 1)
-      throw std::runtime_error("sorted() requires 1 list argument");
-    if (!std::holds_alternative<std::vector<Value>>(args[0].v))
-      throw std::runtime_error("sorted() requires a list");
-    auto list = std::get<std::vector<Value>>(args[0].v);
-    std::sort(list.begin(), list.end(), [](const Value &a, const Value &b) {
-      if (std::holds_alternative<std::string>(a.v) &&
-          std::holds_alternative<std::string>(b.v)) {
-        return std::get<std::string>(a.v) < std::get<std::string>(b.v);
-      }
-      return value_as_number(a).as_number() < value_as_number(b).as_number();
-    });
-    return Value::make_list(std::move(list));
-  }
-  if (marker == "__builtin_sum" || marker == "__builtin_min" ||
-      marker == "__builtin_max") {
-    if (args.size() != 1)
-      throw std::runtime_error("sum/min/max() requires 1 list argument");
-    if (!std::holds_alternative<std::vector<Value>>(args[0].v))
-      throw std::runtime_error("sum/min/max() requires a list");
-    const auto &list = std::get<std::vector<Value>>(args[0].v);
-    if (list.empty()) throw std::runtime_error("List cannot be empty");
-    double result = value_as_number(list[0]).as_number();
-    if (marker == "__builtin_sum") {
-      for (size_t i = 1; i < list.size(); ++i)
-        result += value_as_number(list[i]).as_number();
-      return Value::make_double(result);
-    }
-    for (size_t i = 1; i < list.size(); ++i) {
-      double current = value_as_number(list[i]).as_number();
-      if (marker == "__builtin_min") result = std::min(result, current);
-      if (marker == "__builtin_max") result = std::max(result, current);
-    }
-    return Value::make_double(result);
-  }
-  if (marker == "__builtin_type") {
-    if (args.size() != 1)
-      throw std::runtime_error("type() requires 1 argument");
-    const auto &arg = args[0];
-    if (std::holds_alternative<std::monostate>(arg.v))
-      return Value::make_str("none");
-    if (std::holds_alternative<int64_t>(arg.v)) return Value::make_str("int");
-    if (std::holds_alternative<double>(arg.v)) return Value::make_str("float");
-    if (std::holds_alternative<std::string>(arg.v))
-      return Value::make_str("string");
-    if (std::holds_alternative<bool>(arg.v)) return Value::make_str("bool");
-    if (std::holds_alternative<std::vector<Value>>(arg.v))
-      return Value::make_str("list");
-    if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(arg.v))
-      return Value::make_str("object");
-    if (std::holds_alternative<std::shared_ptr<Reference>>(arg.v))
-      return Value::make_str("ref");
-    return Value::make_str("unknown");
-  }
-  if (marker == "__builtin_vars") {
-    if (!env) throw std::runtime_error("vars() requires environment access");
-    if (args.empty()) {
-      std::vector<std::string> names;
-      std::unordered_set<std::string> seen;
-      for (const auto &name : env->keys()) {
-        if (seen.insert(name).second) names.push_back(name);
-      }
-      std::vector<Value> list;
-      for (const auto &name : names) list.push_back(Value::make_str(name));
-      return Value::make_list(std::move(list));
-    }
-    if (args.size() == 1 &&
-        std::holds_alternative<std::shared_ptr<ObjectInstance>>(args[0].v)) {
-      auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
-      std::vector<Value> list;
-      for (const auto &name : obj->properties->local_keys()) {
-        list.push_back(Value::make_str(name));
-      }
-      return Value::make_list(std::move(list));
-    }
-    throw std::runtime_error("vars() accepts no args or an object instance");
-  }
-  if (marker == "__builtin_keys") {
-    if (args.size() != 1)
-      throw std::runtime_error("keys() requires 1 argument");
-    if (std::holds_alternative<std::vector<Value>>(args[0].v)) {
-      const auto &list = std::get<std::vector<Value>>(args[0].v);
-      std::vector<Value> result;
-      for (size_t i = 0; i < list.size(); ++i) {
-        result.push_back(Value::make_int(static_cast<int64_t>(i)));
-      }
-      return Value::make_list(std::move(result));
-    }
-    if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(args[0].v)) {
-      auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
-      std::vector<Value> result;
-      for (const auto &name : obj->properties->local_keys()) {
-        result.push_back(Value::make_str(name));
-      }
-      return Value::make_list(std::move(result));
-    }
-    throw std::runtime_error("keys() requires a list or object");
-  }
-  if (marker == "__builtin_get") {
-    if (args.size() != 2)
-      throw std::runtime_error("get() requires 2 arguments (object, key)");
-    if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(args[0].v) &&
-        std::holds_alternative<std::string>(args[1].v)) {
-      auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
-      auto prop = obj->properties->get(std::get<std::string>(args[1].v));
-      if (!prop) return Value();
-      return *prop;
-    }
-    throw std::runtime_error("get() requires (object, string)");
-  }
-  if (marker == "__builtin_set") {
-    if (args.size() != 3)
-      throw std::runtime_error(
-          "set() requires 3 arguments (object, key, value)");
-    if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(args[0].v) &&
-        std::holds_alternative<std::string>(args[1].v)) {
-      auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
-      obj->properties->set(std::get<std::string>(args[1].v), args[2]);
-      return Value();
-    }
-    throw std::runtime_error("set() requires (object, string, value)");
-  }
-  if (marker == "__builtin_system") {
-    if (args.size() != 1)
-      throw std::runtime_error("system() requires 1 argument");
-    std::string cmd = std::get<std::string>(args[0].v);
-    int code = std::system(cmd.c_str());
-    return Value::make_int(static_cast<int64_t>(code));
-  }
-  if (marker == "__builtin_shell") {
-    if (args.size() != 1)
-      throw std::runtime_error("shell() requires 1 argument");
-    std::string cmd = std::get<std::string>(args[0].v);
-    std::string output;
-    FILE *pipe = popen(cmd.c_str(), "r");
-    if (!pipe) throw std::runtime_error("shell() failed to open pipe");
-    char buffer[256];
-    while (fgets(buffer, sizeof(buffer), pipe)) {
-      output += buffer;
-    }
-    int status = pclose(pipe);
-    if (status == -1) throw std::runtime_error("shell() failed to close pipe");
-    return Value::make_str(output);
-  }
-  if (marker == "__builtin_getenv") {
-    if (args.size() != 1)
-      throw std::runtime_error("getenv() requires 1 argument");
-    std::string name = std::get<std::string>(args[0].v);
-    const char *value = std::getenv(name.c_str());
-    return value ? Value::make_str(value) : Value();
-  }
-  if (marker == "__builtin_setenv") {
-    if (args.size() != 2)
-      throw std::runtime_error("setenv() requires 2 arguments");
-    std::string name = std::get<std::string>(args[0].v);
-    std::string value = std::get<std::string>(args[1].v);
-    if (setenv(name.c_str(), value.c_str(), 1) != 0)
-      throw std::runtime_error("setenv() failed");
-    return Value();
-  }
-  if (marker == "__builtin_sleep") {
-    if (args.size() != 1)
-      throw std::runtime_error("sleep() requires 1 argument");
-    int64_t ms = static_cast<int64_t>(value_as_number(args[0]).as_number());
-    std::this_thread::sleep_for(std::chrono::milliseconds(ms));
-    return Value();
-  }
-  if (marker == "__builtin_pwd") {
-    if (!args.empty()) throw std::runtime_error("pwd() takes no arguments");
-    return Value::make_str(fs::current_path().string());
-  }
-  if (marker == "__builtin_path_join") {
-    if (args.empty())
-      throw std::runtime_error("path_join() requires at least 1 argument");
-    fs::path result;
-    for (const auto &arg : args) {
-      result /= std::get<std::string>(arg.v);
-    }
-    return Value::make_str(result.string());
-  }
-  if (marker == "__builtin_basename") {
-    if (args.size() != 1)
-      throw std::runtime_error("basename() requires 1 argument");
-    fs::path p = std::get<std::string>(args[0].v);
-    return Value::make_str(p.filename().string());
-  }
-  if (marker == "__builtin_dirname") {
-    if (args.size() != 1)
-      throw std::runtime_error("dirname() requires 1 argument");
-    fs::path p = std::get<std::string>(args[0].v);
-    return Value::make_str(p.parent_path().string());
-  }
-  if (marker == "__builtin_path_is_absolute") {
-    if (args.size() != 1)
-      throw std::runtime_error("path_is_absolute() requires 1 argument");
-    fs::path p = std::get<std::string>(args[0].v);
-    return Value::make_bool(p.is_absolute());
-  }
-  if (marker == "__builtin_path_normalize") {
-    if (args.size() != 1)
-      throw std::runtime_error("path_normalize() requires 1 argument");
-    fs::path p = std::get<std::string>(args[0].v);
-    return Value::make_str(p.lexically_normal().string());
-  }
-  if (marker == "__builtin_file_ext") {
-    if (args.size() != 1)
-      throw std::runtime_error("file_ext() requires 1 argument");
-    fs::path p = std::get<std::string>(args[0].v);
-    return Value::make_str(p.extension().string());
-  }
-  if (marker == "__builtin_json_parse") {
-    if (args.size() != 1)
-      throw std::runtime_error("json_parse() requires 1 argument");
-    const std::string &text = std::get<std::string>(args[0].v);
-    size_t pos = 0;
-    Value result = parse_json_value(text, pos);
-    skip_json_ws(text, pos);
-    if (pos != text.size()) throw std::runtime_error("Invalid JSON input");
-    return result;
-  }
-  if (marker == "__builtin_json_stringify") {
-    if (args.size() != 1)
-      throw std::runtime_error("json_stringify() requires 1 argument");
-    return Value::make_str(json_stringify_value(args[0]));
-  }
-  if (marker == "__builtin_csv_parse") {
-    if (args.size() < 1 || args.size() > 2)
-      throw std::runtime_error("csv_parse() requires 1 or 2 arguments");
-    std::string text = std::get<std::string>(args[0].v);
-    std::string delim =
-        (args.size() == 2) ? std::get<std::string>(args[1].v) : ",";
-    if (delim.empty())
-      throw std::runtime_error("csv_parse() delimiter cannot be empty");
-    auto rows = parse_csv_text(text, delim[0]);
-    return Value::make_list(std::move(rows));
-  }
-  if (marker == "__builtin_csv_stringify") {
-    if (args.size() < 1 || args.size() > 2)
-      throw std::runtime_error("csv_stringify() requires 1 or 2 arguments");
-    const auto &rows = as_list(args[0]);
-    std::string delim =
-        (args.size() == 2) ? std::get<std::string>(args[1].v) : ",";
-    if (delim.empty())
-      throw std::runtime_error("csv_stringify() delimiter cannot be empty");
-    std::string output;
-    for (size_t ri = 0; ri < rows.size(); ++ri) {
-      const auto &row = rows[ri];
-      if (!std::holds_alternative<std::vector<Value>>(row.v))
-        throw std::runtime_error("csv_stringify() requires a list of rows");
-      const auto &fields = std::get<std::vector<Value>>(row.v);
-      for (size_t fi = 0; fi < fields.size(); ++fi) {
-        if (fi) output += delim;
-        output += csv_escape_field(value_to_string(fields[fi]), delim[0]);
-      }
-      if (ri + 1 < rows.size()) output += '\n';
-    }
-    return Value::make_str(output);
-  }
-  if (marker == "__builtin_mkdirs") {
-    if (args.size() != 1)
-      throw std::runtime_error("mkdirs() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    return Value::make_bool(fs::create_directories(path));
-  }
-  if (marker == "__builtin_base64_encode") {
-    if (args.size() != 1)
-      throw std::runtime_error("base64_encode() requires 1 argument");
-    return Value::make_str(base64_encode(std::get<std::string>(args[0].v)));
-  }
-  if (marker == "__builtin_base64_decode") {
-    if (args.size() != 1)
-      throw std::runtime_error("base64_decode() requires 1 argument");
-    return Value::make_str(base64_decode(std::get<std::string>(args[0].v)));
-  }
-  if (marker == "__builtin_uuid4") {
-    if (!args.empty()) throw std::runtime_error("uuid4() takes no arguments");
-    return Value::make_str(uuid4());
-  }
-  if (marker == "__builtin_glob") {
-    if (args.size() != 1)
-      throw std::runtime_error("glob() requires 1 argument");
-    std::string pattern = std::get<std::string>(args[0].v);
-    fs::path p(pattern);
-    fs::path dir = p.parent_path();
-    std::string filename_pattern = p.filename().string();
-    if (dir.empty()) dir = fs::current_path();
-    std::vector<Value> matches;
-    if (fs::exists(dir) && fs::is_directory(dir)) {
-      for (auto &entry : fs::directory_iterator(dir)) {
-        if (glob_match(filename_pattern, entry.path().filename().string())) {
-          matches.push_back(Value::make_str(entry.path().string()));
-        }
-      }
-    }
-    return Value::make_list(std::move(matches));
-  }
-  if (marker == "__builtin_regex_match") {
-    if (args.size() != 2)
-      throw std::runtime_error("regex_match() requires 2 arguments");
-    std::string text = std::get<std::string>(args[0].v);
-    std::string pattern = std::get<std::string>(args[1].v);
-    try {
-      return Value::make_bool(std::regex_match(text, std::regex(pattern)));
-    } catch (const std::regex_error &e) {
-      throw std::runtime_error(std::string("Invalid regex: ") + e.what());
-    }
-  }
-  if (marker == "__builtin_regex_replace") {
-    if (args.size() != 3)
-      throw std::runtime_error("regex_replace() requires 3 arguments");
-    std::string text = std::get<std::string>(args[0].v);
-    std::string pattern = std::get<std::string>(args[1].v);
-    std::string replacement = std::get<std::string>(args[2].v);
-    try {
-      return Value::make_str(
-          std::regex_replace(text, std::regex(pattern), replacement));
-    } catch (const std::regex_error &e) {
-      throw std::runtime_error(std::string("Invalid regex: ") + e.what());
-    }
-  }
+// Handlers keyed by builtin marker, so a builtin call costs one hash lookup
+// instead of a comparison against every builtin name.
+static const std::unordered_map<std::string, BuiltinHandler> &
+builtin_handlers() {
+  static const auto handlers = [] {
+    std::unordered_map<std::string, BuiltinHandler> table;
+    auto add = [&table](std::initializer_list<const char *> markers,
+                        BuiltinHandler handler) {
+      for (const char *m : markers) table.emplace(m, handler);
+    };
+    add({"__builtin_print", "__builtin_echo"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          for (size_t i = 0; i < args.size(); ++i) {
+            if (i > 0) std::cout << ' ';
+            std::cout << value_to_string(args[i]);
+          }
+          std::cout << '\n';
+          return Value();
+        });
+    add({"__builtin_isset"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (!env)
+            throw std::runtime_error("isset() requires environment access");
+          if (args.size() == 1 &&
+              std::holds_alternative<std::string>(args[0].v)) {
+            return Value::make_bool(env->has(std::get<std::string>(args[0].v)));
+          }
+          if (args.size() == 2 &&
+              std::holds_alternative<std::shared_ptr<ObjectInstance>>(
+                  args[0].v) &&
+              std::holds_alternative<std::string>(args[1].v)) {
+            auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
+            return Value::make_bool(
+                obj->properties->has(std::get<std::string>(args[1].v)));
+          }
+          throw std::runtime_error(
+              "isset() requires 1 string argument or (object, member)");
+        });
+    add({"__builtin_unset"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (!env)
+            throw std::runtime_error("unset() requires environment access");
+          if (args.size() == 1 &&
+              std::holds_alternative<std::string>(args[0].v)) {
+            return Value::make_bool(
+                env->remove(std::get<std::string>(args[0].v)));
+          }
+          if (args.size() == 2 &&
+              std::holds_alternative<std::shared_ptr<ObjectInstance>>(
+                  args[0].v) &&
+              std::holds_alternative<std::string>(args[1].v)) {
+            auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
+            return Value::make_bool(
+                obj->properties->remove(std::get<std::string>(args[1].v)));
+          }
+          throw std::runtime_error(
+              "unset() requires 1 string argument or (object, member)");
+        });
+    add({"__builtin_ref"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (!env || args.size() != 1 ||
+              !std::holds_alternative<std::string>(args[0].v))
+            throw std::runtime_error("ref() requires 1 string argument");
+          std::string name = std::get<std::string>(args[0].v);
+          auto sym = find_symbol(name);
+          auto current = sym ? env : nullptr;
+          while (current && !current->has_local(*sym))
+            current = current->parent;
+          if (!current)
+            throw std::runtime_error("Undefined variable for ref(): " + name);
+          return Value::make_ref(current, name);
+        });
+    add({"__builtin_deref"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1 ||
+              !std::holds_alternative<std::shared_ptr<Reference>>(args[0].v))
+            throw std::runtime_error("deref() requires 1 reference argument");
+          auto ref = std::get<std::shared_ptr<Reference>>(args[0].v);
+          auto target = ref->env->get(ref->name);
+          if (!target)
+            throw std::runtime_error("Invalid reference target: " + ref->name);
+          return *target;
+        });
+    add({"__builtin_set_ref"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2 ||
+              !std::holds_alternative<std::shared_ptr<Reference>>(args[0].v))
+            throw std::runtime_error(
+                "set_ref() requires 1 reference and 1 value");
+          auto ref = std::get<std::shared_ptr<Reference>>(args[0].v);
+          ref->env->set(ref->name, args[1]);
+          return Value();
+        });
+    add({"__builtin_is_ref"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("is_ref() requires 1 argument");
+          return Value::make_bool(
+              std::holds_alternative<std::shared_ptr<Reference>>(args[0].v));
+        });
+    add({"__builtin_range"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          int64_t start = 0;
+          int64_t stop = 0;
+          int64_t step = 1;
+          if (args.size() == 1) {
+            stop = static_cast<int64_t>(value_as_number(args[0]).as_number());
+          } else if (args.size() == 2) {
+            start = static_cast<int64_t>(value_as_number(args[0]).as_number());
+            stop = static_cast<int64_t>(value_as_number(args[1]).as_number());
+          } else if (args.size() == 3) {
+            start = static_cast<int64_t>(value_as_number(args[0]).as_number());
+            stop = static_cast<int64_t>(value_as_number(args[1]).as_number());
+            step = static_cast<int64_t>(value_as_number(args[2]).as_number());
+          } else {
+            throw std::runtime_error(
+                "range() requires 1 to 3 numeric arguments");
+          }
+          if (step == 0)
+            throw std::runtime_error("range() step cannot be zero");
+          std::vector<Value> list;
+          if (step > 0) {
+            for (int64_t i = start; i < stop; i += step)
+              list.push_back(Value::make_int(i));
+          } else {
+            for (int64_t i = start; i > stop; i += step)
+              list.push_back(Value::make_int(i));
+          }
+          return Value::make_list(list);
+        });
+    add({"__builtin_len"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("len() requires 1 argument");
+          return value_length(args[0]);
+        });
+    add({"__builtin_copy", "__builtin_clone"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("copy() requires 1 argument");
+          return copy_value(args[0]);
+        });
+    add({"__builtin_slice"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() < 2 || args.size() > 3)
+            throw std::runtime_error("slice() requires 2 or 3 arguments");
+          const auto &source = args[0];
+          int64_t start =
+              static_cast<int64_t>(value_as_number(args[1]).as_number());
+          int64_t length = -1;
+          if (args.size() == 3)
+            length = static_cast<int64_t>(value_as_number(args[2]).as_number());
+          if (std::holds_alternative<std::string>(source.v)) {
+            std::string s = std::get<std::string>(source.v);
+            if (start < 0) start = static_cast<int64_t>(s.size()) + start;
+            if (start < 0) start = 0;
+            if (length < 0)
+              return Value::make_str(s.substr(static_cast<size_t>(start)));
+            return Value::make_str(s.substr(static_cast<size_t>(start),
+                                            static_cast<size_t>(length)));
+          }
+          if (std::holds_alternative<std::vector<Value>>(source.v)) {
+            const auto &list = std::get<std::vector<Value>>(source.v);
+            if (start < 0) start = static_cast<int64_t>(list.size()) + start;
+            if (start < 0) start = 0;
+            int64_t end = (length < 0) ? static_cast<int64_t>(list.size())
+                                       : start + length;
+            if (end > static_cast<int64_t>(list.size()))
+              end = static_cast<int64_t>(list.size());
+            std::vector<Value> out;
+            for (int64_t i = start; i < end; ++i)
+              out.push_back(list[static_cast<size_t>(i)]);
+            return Value::make_list(std::move(out));
+          }
+          throw std::runtime_error("slice() source must be string or list");
+        });
+    add({"__builtin_sorted"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("sorted() requires 1 list argument");
+          if (!std::holds_alternative<std::vector<Value>>(args[0].v))
+            throw std::runtime_error("sorted() requires a list");
+          auto list = std::get<std::vector<Value>>(args[0].v);
+          std::sort(list.begin(), list.end(),
+                    [](const Value &a, const Value &b) {
+                      if (std::holds_alternative<std::string>(a.v) &&
+                          std::holds_alternative<std::string>(b.v)) {
+                        return std::get<std::string>(a.v) <
+                               std::get<std::string>(b.v);
+                      }
+                      return value_as_number(a).as_number() <
+                             value_as_number(b).as_number();
+                    });
+          return Value::make_list(std::move(list));
+        });
+    add({"__builtin_sum", "__builtin_min", "__builtin_max"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("sum/min/max() requires 1 list argument");
+          if (!std::holds_alternative<std::vector<Value>>(args[0].v))
+            throw std::runtime_error("sum/min/max() requires a list");
+          const auto &list = std::get<std::vector<Value>>(args[0].v);
+          if (list.empty()) throw std::runtime_error("List cannot be empty");
+          double result = value_as_number(list[0]).as_number();
+          if (marker == "__builtin_sum") {
+            for (size_t i = 1; i < list.size(); ++i)
+              result += value_as_number(list[i]).as_number();
+            return Value::make_double(result);
+          }
+          for (size_t i = 1; i < list.size(); ++i) {
+            double current = value_as_number(list[i]).as_number();
+            if (marker == "__builtin_min") result = std::min(result, current);
+            if (marker == "__builtin_max") result = std::max(result, current);
+          }
+          return Value::make_double(result);
+        });
+    add({"__builtin_type"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("type() requires 1 argument");
+          const auto &arg = args[0];
+          if (std::holds_alternative<std::monostate>(arg.v))
+            return Value::make_str("none");
+          if (std::holds_alternative<int64_t>(arg.v))
+            return Value::make_str("int");
+          if (std::holds_alternative<double>(arg.v))
+            return Value::make_str("float");
+          if (std::holds_alternative<std::string>(arg.v))
+            return Value::make_str("string");
+          if (std::holds_alternative<bool>(arg.v))
+            return Value::make_str("bool");
+          if (std::holds_alternative<std::vector<Value>>(arg.v))
+            return Value::make_str("list");
+          if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(arg.v))
+            return Value::make_str("object");
+          if (std::holds_alternative<std::shared_ptr<Reference>>(arg.v))
+            return Value::make_str("ref");
+          return Value::make_str("unknown");
+        });
+    add({"__builtin_vars"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (!env)
+            throw std::runtime_error("vars() requires environment access");
+          if (args.empty()) {
+            std::vector<std::string> names;
+            std::unordered_set<std::string> seen;
+            for (const auto &name : env->keys()) {
+              if (seen.insert(name).second) names.push_back(name);
+            }
+            std::vector<Value> list;
+            for (const auto &name : names)
+              list.push_back(Value::make_str(name));
+            return Value::make_list(std::move(list));
+          }
+          if (args.size() == 1 &&
+              std::holds_alternative<std::shared_ptr<ObjectInstance>>(
+                  args[0].v)) {
+            auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
+            std::vector<Value> list;
+            for (const auto &name : obj->properties->local_keys()) {
+              list.push_back(Value::make_str(name));
+            }
+            return Value::make_list(std::move(list));
+          }
+          throw std::runtime_error(
+              "vars() accepts no args or an object instance");
+        });
+    add({"__builtin_keys"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("keys() requires 1 argument");
+          if (std::holds_alternative<std::vector<Value>>(args[0].v)) {
+            const auto &list = std::get<std::vector<Value>>(args[0].v);
+            std::vector<Value> result;
+            for (size_t i = 0; i < list.size(); ++i) {
+              result.push_back(Value::make_int(static_cast<int64_t>(i)));
+            }
+            return Value::make_list(std::move(result));
+          }
+          if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(
+                  args[0].v)) {
+            auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
+            std::vector<Value> result;
+            for (const auto &name : obj->properties->local_keys()) {
+              result.push_back(Value::make_str(name));
+            }
+            return Value::make_list(std::move(result));
+          }
+          throw std::runtime_error("keys() requires a list or object");
+        });
+    add({"__builtin_get"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error(
+                "get() requires 2 arguments (object, key)");
+          if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(
+                  args[0].v) &&
+              std::holds_alternative<std::string>(args[1].v)) {
+            auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
+            auto prop = obj->properties->get(std::get<std::string>(args[1].v));
+            if (!prop) return Value();
+            return *prop;
+          }
+          throw std::runtime_error("get() requires (object, string)");
+        });
+    add({"__builtin_set"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 3)
+            throw std::runtime_error(
+                "set() requires 3 arguments (object, key, value)");
+          if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(
+                  args[0].v) &&
+              std::holds_alternative<std::string>(args[1].v)) {
+            auto obj = std::get<std::shared_ptr<ObjectInstance>>(args[0].v);
+            obj->properties->set(std::get<std::string>(args[1].v), args[2]);
+            return Value();
+          }
+          throw std::runtime_error("set() requires (object, string, value)");
+        });
+    add({"__builtin_system"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("system() requires 1 argument");
+          std::string cmd = std::get<std::string>(args[0].v);
+          // The command writes to the same stdout, after what was said so far
+          std::cout.flush();
+          int code = std::system(cmd.c_str());
+          return Value::make_int(static_cast<int64_t>(code));
+        });
+    add({"__builtin_shell"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("shell() requires 1 argument");
+          std::string cmd = std::get<std::string>(args[0].v);
+          std::string output;
+          FILE *pipe = popen(cmd.c_str(), "r");
+          if (!pipe) throw std::runtime_error("shell() failed to open pipe");
+          char buffer[256];
+          while (fgets(buffer, sizeof(buffer), pipe)) {
+            output += buffer;
+          }
+          int status = pclose(pipe);
+          if (status == -1)
+            throw std::runtime_error("shell() failed to close pipe");
+          return Value::make_str(output);
+        });
+    add({"__builtin_getenv"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("getenv() requires 1 argument");
+          std::string name = std::get<std::string>(args[0].v);
+          const char *value = std::getenv(name.c_str());
+          return value ? Value::make_str(value) : Value();
+        });
+    add({"__builtin_setenv"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("setenv() requires 2 arguments");
+          std::string name = std::get<std::string>(args[0].v);
+          std::string value = std::get<std::string>(args[1].v);
+          if (setenv(name.c_str(), value.c_str(), 1) != 0)
+            throw std::runtime_error("setenv() failed");
+          return Value();
+        });
+    add({"__builtin_sleep"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("sleep() requires 1 argument");
+          int64_t ms =
+              static_cast<int64_t>(value_as_number(args[0]).as_number());
+          std::this_thread::sleep_for(std::chrono::milliseconds(ms));
+          return Value();
+        });
+    add({"__builtin_pwd"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (!args.empty())
+            throw std::runtime_error("pwd() takes no arguments");
+          return Value::make_str(fs::current_path().string());
+        });
+    add({"__builtin_path_join"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.empty())
+            throw std::runtime_error(
+                "path_join() requires at least 1 argument");
+          fs::path result;
+          for (const auto &arg : args) {
+            result /= std::get<std::string>(arg.v);
+          }
+          return Value::make_str(result.string());
+        });
+    add({"__builtin_basename"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("basename() requires 1 argument");
+          fs::path p = std::get<std::string>(args[0].v);
+          return Value::make_str(p.filename().string());
+        });
+    add({"__builtin_dirname"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("dirname() requires 1 argument");
+          fs::path p = std::get<std::string>(args[0].v);
+          return Value::make_str(p.parent_path().string());
+        });
+    add({"__builtin_path_is_absolute"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("path_is_absolute() requires 1 argument");
+          fs::path p = std::get<std::string>(args[0].v);
+          return Value::make_bool(p.is_absolute());
+        });
+    add({"__builtin_path_normalize"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("path_normalize() requires 1 argument");
+          fs::path p = std::get<std::string>(args[0].v);
+          return Value::make_str(p.lexically_normal().string());
+        });
+    add({"__builtin_file_ext"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("file_ext() requires 1 argument");
+          fs::path p = std::get<std::string>(args[0].v);
+          return Value::make_str(p.extension().string());
+        });
+    add({"__builtin_json_parse"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("json_parse() requires 1 argument");
+          const std::string &text = std::get<std::string>(args[0].v);
+          size_t pos = 0;
+          Value result = parse_json_value(text, pos);
+          skip_json_ws(text, pos);
+          if (pos != text.size())
+            throw std::runtime_error("Invalid JSON input");
+          return result;
+        });
+    add({"__builtin_json_stringify"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("json_stringify() requires 1 argument");
+          return Value::make_str(json_stringify_value(args[0]));
+        });
+    add({"__builtin_csv_parse"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() < 1 || args.size() > 2)
+            throw std::runtime_error("csv_parse() requires 1 or 2 arguments");
+          std::string text = std::get<std::string>(args[0].v);
+          std::string delim =
+              (args.size() == 2) ? std::get<std::string>(args[1].v) : ",";
+          if (delim.empty())
+            throw std::runtime_error("csv_parse() delimiter cannot be empty");
+          auto rows = parse_csv_text(text, delim[0]);
+          return Value::make_list(std::move(rows));
+        });
+    add({"__builtin_csv_stringify"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() < 1 || args.size() > 2)
+            throw std::runtime_error(
+                "csv_stringify() requires 1 or 2 arguments");
+          const auto &rows = as_list(args[0]);
+          std::string delim =
+              (args.size() == 2) ? std::get<std::string>(args[1].v) : ",";
+          if (delim.empty())
+            throw std::runtime_error(
+                "csv_stringify() delimiter cannot be empty");
+          std::string output;
+          for (size_t ri = 0; ri < rows.size(); ++ri) {
+            const auto &row = rows[ri];
+            if (!std::holds_alternative<std::vector<Value>>(row.v))
+              throw std::runtime_error(
+                  "csv_stringify() requires a list of rows");
+            const auto &fields = std::get<std::vector<Value>>(row.v);
+            for (size_t fi = 0; fi < fields.size(); ++fi) {
+              if (fi) output += delim;
+              output += csv_escape_field(value_to_string(fields[fi]), delim[0]);
+            }
+            if (ri + 1 < rows.size()) output += '\n';
+          }
+          return Value::make_str(output);
+        });
+    add({"__builtin_mkdirs"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("mkdirs() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          return Value::make_bool(fs::create_directories(path));
+        });
+    add({"__builtin_base64_encode"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("base64_encode() requires 1 argument");
+          return Value::make_str(
+              base64_encode(std::get<std::string>(args[0].v)));
+        });
+    add({"__builtin_base64_decode"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("base64_decode() requires 1 argument");
+          return Value::make_str(
+              base64_decode(std::get<std::string>(args[0].v)));
+        });
+    add({"__builtin_uuid4"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (!args.empty())
+            throw std::runtime_error("uuid4() takes no arguments");
+          return Value::make_str(uuid4());
+        });
+    add({"__builtin_glob"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("glob() requires 1 argument");
+          std::string pattern = std::get<std::string>(args[0].v);
+          fs::path p(pattern);
+          fs::path dir = p.parent_path();
+          std::string filename_pattern = p.filename().string();
+          if (dir.empty()) dir = fs::current_path();
+          std::vector<Value> matches;
+          if (fs::exists(dir) && fs::is_directory(dir)) {
+            const std::regex &re =
+                compiled_regex(glob_to_regex(filename_pattern));
+            for (auto &entry : fs::directory_iterator(dir)) {
+              if (std::regex_match(entry.path().filename().string(), re)) {
+                matches.push_back(Value::make_str(entry.path().string()));
+              }
+            }
+          }
+          return Value::make_list(std::move(matches));
+        });
+    add({"__builtin_regex_match"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("regex_match() requires 2 arguments");
+          std::string text = std::get<std::string>(args[0].v);
+          std::string pattern = std::get<std::string>(args[1].v);
+          try {
+            return Value::make_bool(
+                std::regex_match(text, compiled_regex(pattern)));
+          } catch (const std::regex_error &e) {
+            throw std::runtime_error(std::string("Invalid regex: ") + e.what());
+          }
+        });
+    add({"__builtin_regex_replace"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 3)
+            throw std::runtime_error("regex_replace() requires 3 arguments");
+          std::string text = std::get<std::string>(args[0].v);
+          std::string pattern = std::get<std::string>(args[1].v);
+          std::string replacement = std::get<std::string>(args[2].v);
+          try {
+            return Value::make_str(
+                std::regex_replace(text, compiled_regex(pattern), replacement));
+          } catch (const std::regex_error &e) {
+            throw std::runtime_error(std::string("Invalid regex: ") + e.what());
+          }
+        });
 #ifdef BLOA_USE_MYSQL
-  if (marker == "__builtin_mysql_connect") {
-    if (args.size() < 4 || args.size() > 5)
-      throw std::runtime_error("mysql_connect() requires 4 or 5 arguments");
-    std::string host = std::get<std::string>(args[0].v);
-    std::string user = std::get<std::string>(args[1].v);
-    std::string pass = std::get<std::string>(args[2].v);
-    std::string db = std::get<std::string>(args[3].v);
-    unsigned int port = 3306;
-    if (args.size() == 5)
-      port = static_cast<unsigned int>(value_as_number(args[4]).as_number());
-    MYSQL *conn = mysql_init(nullptr);
-    if (!conn) throw std::runtime_error("mysql_init() failed");
-    if (!mysql_real_connect(conn, host.c_str(), user.c_str(), pass.c_str(),
-                            db.c_str(), port, nullptr, 0)) {
-      std::string err = mysql_error(conn);
-      mysql_close(conn);
-      throw std::runtime_error("MySQL connection failed: " + err);
-    }
-    int id = next_mysql_connection_id++;
-    mysql_connections[id] = conn;
-    return Value::make_int(id);
-  }
-  if (marker == "__builtin_mysql_close") {
-    if (args.size() != 1)
-      throw std::runtime_error("mysql_close() requires 1 connection id");
-    int id = static_cast<int>(value_as_number(args[0]).as_number());
-    auto it = mysql_connections.find(id);
-    if (it == mysql_connections.end())
-      throw std::runtime_error("Invalid MySQL connection id");
-    mysql_close(it->second);
-    mysql_connections.erase(it);
-    return Value();
-  }
-  if (marker == "__builtin_mysql_escape") {
-    if (args.size() != 2)
-      throw std::runtime_error("mysql_escape() requires 2 arguments");
-    int id = static_cast<int>(value_as_number(args[0]).as_number());
-    auto it = mysql_connections.find(id);
-    if (it == mysql_connections.end())
-      throw std::runtime_error("Invalid MySQL connection id");
-    std::string value = std::get<std::string>(args[1].v);
-    std::string out(value.size() * 2 + 1, '\0');
-    unsigned long len =
-        mysql_real_escape_string(it->second, out.data(), value.c_str(),
-                                 static_cast<unsigned long>(value.size()));
-    out.resize(len);
-    return Value::make_str(out);
-  }
-  if (marker == "__builtin_mysql_query") {
-    if (args.size() != 2)
-      throw std::runtime_error("mysql_query() requires 2 arguments");
-    int id = static_cast<int>(value_as_number(args[0]).as_number());
-    auto it = mysql_connections.find(id);
-    if (it == mysql_connections.end())
-      throw std::runtime_error("Invalid MySQL connection id");
-    std::string sql = std::get<std::string>(args[1].v);
-    if (mysql_query(it->second, sql.c_str()) != 0) {
-      throw std::runtime_error(std::string("MySQL query failed: ") +
-                               mysql_error(it->second));
-    }
-    MYSQL_RES *result = mysql_store_result(it->second);
-    if (!result) return Value::make_list({});
-    std::vector<Value> rows;
-    MYSQL_ROW row;
-    unsigned int num_fields = mysql_num_fields(result);
-    while ((row = mysql_fetch_row(result))) {
-      std::vector<Value> row_values;
-      unsigned long *lengths = mysql_fetch_lengths(result);
-      for (unsigned int i = 0; i < num_fields; ++i) {
-        if (row[i])
-          row_values.push_back(
-              Value::make_str(std::string(row[i], lengths[i])));
-        else
-          row_values.push_back(Value());
-      }
-      rows.push_back(Value::make_list(std::move(row_values)));
-    }
-    mysql_free_result(result);
-    return Value::make_list(std::move(rows));
-  }
-  if (marker == "__builtin_mysql_exec") {
-    if (args.size() != 2)
-      throw std::runtime_error("mysql_exec() requires 2 arguments");
-    int id = static_cast<int>(value_as_number(args[0]).as_number());
-    auto it = mysql_connections.find(id);
-    if (it == mysql_connections.end())
-      throw std::runtime_error("Invalid MySQL connection id");
-    std::string sql = std::get<std::string>(args[1].v);
-    if (mysql_query(it->second, sql.c_str()) != 0) {
-      throw std::runtime_error(std::string("MySQL exec failed: ") +
-                               mysql_error(it->second));
-    }
-    auto affected = mysql_affected_rows(it->second);
-    return Value::make_int(static_cast<int64_t>(affected));
-  }
+    add({"__builtin_mysql_connect"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() < 4 || args.size() > 5)
+            throw std::runtime_error(
+                "mysql_connect() requires 4 or 5 arguments");
+          std::string host = std::get<std::string>(args[0].v);
+          std::string user = std::get<std::string>(args[1].v);
+          std::string pass = std::get<std::string>(args[2].v);
+          std::string db = std::get<std::string>(args[3].v);
+          unsigned int port = 3306;
+          if (args.size() == 5)
+            port =
+                static_cast<unsigned int>(value_as_number(args[4]).as_number());
+          MYSQL *conn = mysql_init(nullptr);
+          if (!conn) throw std::runtime_error("mysql_init() failed");
+          if (!mysql_real_connect(conn, host.c_str(), user.c_str(),
+                                  pass.c_str(), db.c_str(), port, nullptr, 0)) {
+            std::string err = mysql_error(conn);
+            mysql_close(conn);
+            throw std::runtime_error("MySQL connection failed: " + err);
+          }
+          int id = next_mysql_connection_id++;
+          mysql_connections[id] = conn;
+          return Value::make_int(id);
+        });
+    add({"__builtin_mysql_close"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("mysql_close() requires 1 connection id");
+          int id = static_cast<int>(value_as_number(args[0]).as_number());
+          auto it = mysql_connections.find(id);
+          if (it == mysql_connections.end())
+            throw std::runtime_error("Invalid MySQL connection id");
+          mysql_close(it->second);
+          mysql_connections.erase(it);
+          return Value();
+        });
+    add({"__builtin_mysql_escape"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("mysql_escape() requires 2 arguments");
+          int id = static_cast<int>(value_as_number(args[0]).as_number());
+          auto it = mysql_connections.find(id);
+          if (it == mysql_connections.end())
+            throw std::runtime_error("Invalid MySQL connection id");
+          std::string value = std::get<std::string>(args[1].v);
+          std::string out(value.size() * 2 + 1, '\0');
+          unsigned long len = mysql_real_escape_string(
+              it->second, out.data(), value.c_str(),
+              static_cast<unsigned long>(value.size()));
+          out.resize(len);
+          return Value::make_str(out);
+        });
+    add({"__builtin_mysql_query"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("mysql_query() requires 2 arguments");
+          int id = static_cast<int>(value_as_number(args[0]).as_number());
+          auto it = mysql_connections.find(id);
+          if (it == mysql_connections.end())
+            throw std::runtime_error("Invalid MySQL connection id");
+          std::string sql = std::get<std::string>(args[1].v);
+          if (mysql_query(it->second, sql.c_str()) != 0) {
+            throw std::runtime_error(std::string("MySQL query failed: ") +
+                                     mysql_error(it->second));
+          }
+          MYSQL_RES *result = mysql_store_result(it->second);
+          if (!result) return Value::make_list({});
+          std::vector<Value> rows;
+          MYSQL_ROW row;
+          unsigned int num_fields = mysql_num_fields(result);
+          while ((row = mysql_fetch_row(result))) {
+            std::vector<Value> row_values;
+            unsigned long *lengths = mysql_fetch_lengths(result);
+            for (unsigned int i = 0; i < num_fields; ++i) {
+              if (row[i])
+                row_values.push_back(
+                    Value::make_str(std::string(row[i], lengths[i])));
+              else
+                row_values.push_back(Value());
+            }
+            rows.push_back(Value::make_list(std::move(row_values)));
+          }
+          mysql_free_result(result);
+          return Value::make_list(std::move(rows));
+        });
+    add({"__builtin_mysql_exec"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("mysql_exec() requires 2 arguments");
+          int id = static_cast<int>(value_as_number(args[0]).as_number());
+          auto it = mysql_connections.find(id);
+          if (it == mysql_connections.end())
+            throw std::runtime_error("Invalid MySQL connection id");
+          std::string sql = std::get<std::string>(args[1].v);
+          if (mysql_query(it->second, sql.c_str()) != 0) {
+            throw std::runtime_error(std::string("MySQL exec failed: ") +
+                                     mysql_error(it->second));
+          }
+          auto affected = mysql_affected_rows(it->second);
+          return Value::make_int(static_cast<int64_t>(affected));
+        });
 #endif
-  if (marker == "__builtin_str") {
-    if (args.size() != 1) throw std::runtime_error("str() requires 1 argument");
-    return Value::make_str(value_to_string(args[0]));
-  }
-  if (marker == "__builtin_sqrt") {
-    if (args.size() != 1)
-      throw std::runtime_error("sqrt() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::sqrt(x));
-  }
-  if (marker == "__builtin_pow") {
-    if (args.size() != 2)
-      throw std::runtime_error("pow() requires 2 arguments");
-    double base = value_as_number(args[0]).as_number();
-    double exp = value_as_number(args[1]).as_number();
-    return Value::make_double(std::pow(base, exp));
-  }
-  if (marker == "__builtin_sin") {
-    if (args.size() != 1) throw std::runtime_error("sin() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::sin(x));
-  }
-  if (marker == "__builtin_cos") {
-    if (args.size() != 1) throw std::runtime_error("cos() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::cos(x));
-  }
-  if (marker == "__builtin_tan") {
-    if (args.size() != 1) throw std::runtime_error("tan() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::tan(x));
-  }
-  if (marker == "__builtin_log") {
-    if (args.size() != 1) throw std::runtime_error("log() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::log(x));
-  }
-  if (marker == "__builtin_exp") {
-    if (args.size() != 1) throw std::runtime_error("exp() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::exp(x));
-  }
-  if (marker == "__builtin_abs") {
-    if (args.size() != 1) throw std::runtime_error("abs() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::abs(x));
-  }
-  if (marker == "__builtin_floor") {
-    if (args.size() != 1)
-      throw std::runtime_error("floor() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::floor(x));
-  }
-  if (marker == "__builtin_ceil") {
-    if (args.size() != 1)
-      throw std::runtime_error("ceil() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::ceil(x));
-  }
-  if (marker == "__builtin_round") {
-    if (args.size() != 1)
-      throw std::runtime_error("round() requires 1 argument");
-    double x = value_as_number(args[0]).as_number();
-    return Value::make_double(std::round(x));
-  }
-  if (marker == "__builtin_pi") {
-    return Value::make_double(3.141592653589793);
-  }
-  if (marker == "__builtin_e") {
-    return Value::make_double(2.718281828459045);
-  }
-  if (marker == "__builtin_read_file") {
-    if (args.size() != 1)
-      throw std::runtime_error("read_file() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    std::ifstream ifs(path);
-    if (!ifs) throw std::runtime_error("Cannot open file: " + path);
-    std::string content((std::istreambuf_iterator<char>(ifs)),
-                        std::istreambuf_iterator<char>());
-    return Value::make_str(content);
-  }
-  if (marker == "__builtin_write_file") {
-    if (args.size() != 2)
-      throw std::runtime_error("write_file() requires 2 arguments");
-    std::string path = std::get<std::string>(args[0].v);
-    std::string content = std::get<std::string>(args[1].v);
-    std::ofstream ofs(path);
-    if (!ofs) throw std::runtime_error("Cannot open file for writing: " + path);
-    ofs << content;
-    return Value();
-  }
-  if (marker == "__builtin_exists") {
-    if (args.size() != 1)
-      throw std::runtime_error("exists() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    return Value::make_bool(fs::exists(path));
-  }
-  if (marker == "__builtin_list_dir") {
-    if (args.size() != 1)
-      throw std::runtime_error("list_dir() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    std::vector<Value> list;
-    std::transform(fs::directory_iterator(path), fs::directory_iterator{},
-                   std::back_inserter(list), [](const auto &entry) {
-                     return Value::make_str(entry.path().string());
-                   });
-    return Value::make_list(list);
-  }
-  if (marker == "__builtin_mkdir") {
-    if (args.size() != 1)
-      throw std::runtime_error("mkdir() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    return Value::make_bool(fs::create_directory(path));
-  }
-  if (marker == "__builtin_rmdir") {
-    if (args.size() != 1)
-      throw std::runtime_error("rmdir() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    return Value::make_bool(fs::remove(path));
-  }
-  if (marker == "__builtin_remove") {
-    if (args.size() != 1)
-      throw std::runtime_error("remove() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    return Value::make_bool(fs::remove(path));
-  }
-  if (marker == "__builtin_copy_file") {
-    if (args.size() != 2)
-      throw std::runtime_error("copy_file() requires 2 arguments");
-    std::string from = std::get<std::string>(args[0].v);
-    std::string to = std::get<std::string>(args[1].v);
-    fs::copy_file(from, to);
-    return Value();
-  }
-  if (marker == "__builtin_move") {
-    if (args.size() != 2)
-      throw std::runtime_error("move() requires 2 arguments");
-    std::string from = std::get<std::string>(args[0].v);
-    std::string to = std::get<std::string>(args[1].v);
-    fs::rename(from, to);
-    return Value();
-  }
-  if (marker == "__builtin_file_size") {
-    if (args.size() != 1)
-      throw std::runtime_error("file_size() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    return Value::make_int(fs::file_size(path));
-  }
-  if (marker == "__builtin_is_dir") {
-    if (args.size() != 1)
-      throw std::runtime_error("is_dir() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    return Value::make_bool(fs::is_directory(path));
-  }
-  if (marker == "__builtin_split") {
-    if (args.size() < 1 || args.size() > 2)
-      throw std::runtime_error("split() requires 1 or 2 arguments");
-    std::string s = std::get<std::string>(args[0].v);
-    std::string delim =
-        (args.size() == 2) ? std::get<std::string>(args[1].v) : " ";
-    std::vector<Value> list;
-    size_t pos = 0;
-    while ((pos = s.find(delim)) != std::string::npos) {
-      list.push_back(Value::make_str(s.substr(0, pos)));
-      s.erase(0, pos + delim.length());
-    }
-    list.push_back(Value::make_str(s));
-    return Value::make_list(list);
-  }
-  if (marker == "__builtin_join") {
-    if (args.size() != 2)
-      throw std::runtime_error("join() requires 2 arguments");
-    const auto &list = as_list(args[0]);
-    std::string sep = std::get<std::string>(args[1].v);
-    std::string result;
-    for (size_t i = 0; i < list.size(); ++i) {
-      if (i > 0) result += sep;
-      result += value_to_string(list[i]);
-    }
-    return Value::make_str(result);
-  }
-  if (marker == "__builtin_substr") {
-    if (args.size() < 2 || args.size() > 3)
-      throw std::runtime_error("substr() requires 2 or 3 arguments");
-    std::string s = std::get<std::string>(args[0].v);
-    size_t start = static_cast<size_t>(value_as_number(args[1]).as_number());
-    size_t len = (args.size() == 3)
-                     ? static_cast<size_t>(value_as_number(args[2]).as_number())
-                     : std::string::npos;
-    return Value::make_str(s.substr(start, len));
-  }
-  if (marker == "__builtin_find") {
-    if (args.size() != 2)
-      throw std::runtime_error("find() requires 2 arguments");
-    std::string s = std::get<std::string>(args[0].v);
-    std::string sub = std::get<std::string>(args[1].v);
-    size_t pos = s.find(sub);
-    return Value::make_int(
-        pos == std::string::npos ? -1 : static_cast<int64_t>(pos));
-  }
-  if (marker == "__builtin_replace") {
-    if (args.size() != 3)
-      throw std::runtime_error("replace() requires 3 arguments");
-    std::string s = std::get<std::string>(args[0].v);
-    std::string old_str = std::get<std::string>(args[1].v);
-    std::string new_str = std::get<std::string>(args[2].v);
-    size_t pos = 0;
-    while ((pos = s.find(old_str, pos)) != std::string::npos) {
-      s.replace(pos, old_str.length(), new_str);
-      pos += new_str.length();
-    }
-    return Value::make_str(s);
-  }
-  if (marker == "__builtin_to_upper") {
-    if (args.size() != 1)
-      throw std::runtime_error("to_upper() requires 1 argument");
-    std::string s = std::get<std::string>(args[0].v);
-    std::transform(s.begin(), s.end(), s.begin(), ::toupper);
-    return Value::make_str(s);
-  }
-  if (marker == "__builtin_to_lower") {
-    if (args.size() != 1)
-      throw std::runtime_error("to_lower() requires 1 argument");
-    std::string s = std::get<std::string>(args[0].v);
-    std::transform(s.begin(), s.end(), s.begin(), ::tolower);
-    return Value::make_str(s);
-  }
-  if (marker == "__builtin_trim") {
-    if (args.size() != 1)
-      throw std::runtime_error("trim() requires 1 argument");
-    std::string s = std::get<std::string>(args[0].v);
-    s.erase(s.begin(), std::find_if(s.begin(), s.end(), [](unsigned char ch) {
-              return !std::isspace(ch);
-            }));
-    s.erase(std::find_if(s.rbegin(), s.rend(),
-                         [](unsigned char ch) { return !std::isspace(ch); })
-                .base(),
-            s.end());
-    return Value::make_str(s);
-  }
-  if (marker == "__builtin_starts_with") {
-    if (args.size() != 2)
-      throw std::runtime_error("starts_with() requires 2 arguments");
-    std::string s = std::get<std::string>(args[0].v);
-    std::string prefix = std::get<std::string>(args[1].v);
-    return Value::make_bool(s.starts_with(prefix));
-  }
-  if (marker == "__builtin_ends_with") {
-    if (args.size() != 2)
-      throw std::runtime_error("ends_with() requires 2 arguments");
-    std::string s = std::get<std::string>(args[0].v);
-    std::string suffix = std::get<std::string>(args[1].v);
-    return Value::make_bool(s.ends_with(suffix));
-  }
-  if (marker == "__builtin_contains") {
-    if (args.size() != 2)
-      throw std::runtime_error("contains() requires 2 arguments");
-    std::string s = std::get<std::string>(args[0].v);
-    std::string sub = std::get<std::string>(args[1].v);
-    return Value::make_bool(s.find(sub) != std::string::npos);
-  }
-  if (marker == "__builtin_reverse") {
-    if (args.size() != 1)
-      throw std::runtime_error("reverse() requires 1 argument");
-    std::string s = std::get<std::string>(args[0].v);
-    std::reverse(s.begin(), s.end());
-    return Value::make_str(s);
-  }
-  if (marker == "__builtin_repeat") {
-    if (args.size() != 2)
-      throw std::runtime_error("repeat() requires 2 arguments");
-    std::string s = std::get<std::string>(args[0].v);
-    int64_t n = static_cast<int64_t>(value_as_number(args[1]).as_number());
-    std::string result;
-    for (int64_t i = 0; i < n; ++i) result += s;
-    return Value::make_str(result);
-  }
-  if (marker == "__builtin_baar_create") {
-    if (args.size() != 2)
-      throw std::runtime_error("baar_create() requires 2 arguments");
-    std::string path = std::get<std::string>(args[0].v);
-    const auto &files = as_list(args[1]);
-    std::vector<std::pair<std::string, std::string>> entries;
-    for (const auto &entry_val : files) {
-      if (!std::holds_alternative<std::vector<Value>>(entry_val.v))
-        throw std::runtime_error(
-            "baar_create() file list must contain [name, data] entries");
-      const auto &entry = std::get<std::vector<Value>>(entry_val.v);
-      if (entry.size() != 2)
-        throw std::runtime_error("baar_create() entry must be [name, data]");
-      if (!std::holds_alternative<std::string>(entry[0].v))
-        throw std::runtime_error("baar_create() entry name must be a string");
-      entries.emplace_back(std::get<std::string>(entry[0].v),
-                           value_to_string(entry[1]));
-    }
-    write_archive(path, entries);
-    return Value();
-  }
-  if (marker == "__builtin_baar_extract") {
-    if (args.size() != 2)
-      throw std::runtime_error("baar_extract() requires 2 arguments");
-    std::string path = std::get<std::string>(args[0].v);
-    std::string dest = std::get<std::string>(args[1].v);
-    auto entries = read_archive(path);
-    fs::create_directories(dest);
-    for (const auto &entry : entries) {
-      fs::path out_path = fs::path(dest) / entry.first;
-      fs::create_directories(out_path.parent_path());
-      std::ofstream ofs(out_path, std::ios::binary);
-      ofs << entry.second;
-    }
-    return Value();
-  }
-  if (marker == "__builtin_baar_list") {
-    if (args.size() != 1)
-      throw std::runtime_error("baar_list() requires 1 argument");
-    std::string path = std::get<std::string>(args[0].v);
-    auto entries = read_archive(path);
-    std::vector<Value> list;
-    for (const auto &entry : entries) {
-      list.push_back(Value::make_str(entry.first));
-    }
-    return Value::make_list(list);
-  }
-  if (marker == "__builtin_baar_read") {
-    if (args.size() != 2)
-      throw std::runtime_error("baar_read() requires 2 arguments");
-    std::string path = std::get<std::string>(args[0].v);
-    std::string name = std::get<std::string>(args[1].v);
-    auto entries = read_archive(path);
-    for (const auto &entry : entries) {
-      if (entry.first == name) return Value::make_str(entry.second);
-    }
-    throw std::runtime_error("Baar entry not found: " + name);
-  }
+    add({"__builtin_str"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("str() requires 1 argument");
+          return Value::make_str(value_to_string(args[0]));
+        });
+    add({"__builtin_sqrt"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("sqrt() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::sqrt(x));
+        });
+    add({"__builtin_pow"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("pow() requires 2 arguments");
+          double base = value_as_number(args[0]).as_number();
+          double exp = value_as_number(args[1]).as_number();
+          return Value::make_double(std::pow(base, exp));
+        });
+    add({"__builtin_sin"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("sin() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::sin(x));
+        });
+    add({"__builtin_cos"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("cos() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::cos(x));
+        });
+    add({"__builtin_tan"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("tan() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::tan(x));
+        });
+    add({"__builtin_log"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("log() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::log(x));
+        });
+    add({"__builtin_exp"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("exp() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::exp(x));
+        });
+    add({"__builtin_abs"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("abs() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::abs(x));
+        });
+    add({"__builtin_floor"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("floor() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::floor(x));
+        });
+    add({"__builtin_ceil"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("ceil() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::ceil(x));
+        });
+    add({"__builtin_round"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("round() requires 1 argument");
+          double x = value_as_number(args[0]).as_number();
+          return Value::make_double(std::round(x));
+        });
+    add({"__builtin_pi"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          return Value::make_double(3.141592653589793);
+        });
+    add({"__builtin_e"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          return Value::make_double(2.718281828459045);
+        });
+    add({"__builtin_read_file"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("read_file() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          std::ifstream ifs(path);
+          if (!ifs) throw std::runtime_error("Cannot open file: " + path);
+          std::string content((std::istreambuf_iterator<char>(ifs)),
+                              std::istreambuf_iterator<char>());
+          return Value::make_str(content);
+        });
+    add({"__builtin_write_file"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("write_file() requires 2 arguments");
+          std::string path = std::get<std::string>(args[0].v);
+          std::string content = std::get<std::string>(args[1].v);
+          std::ofstream ofs(path);
+          if (!ofs)
+            throw std::runtime_error("Cannot open file for writing: " + path);
+          ofs << content;
+          return Value();
+        });
+    add({"__builtin_exists"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("exists() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          return Value::make_bool(fs::exists(path));
+        });
+    add({"__builtin_list_dir"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("list_dir() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          std::vector<Value> list;
+          std::transform(fs::directory_iterator(path), fs::directory_iterator{},
+                         std::back_inserter(list), [](const auto &entry) {
+                           return Value::make_str(entry.path().string());
+                         });
+          return Value::make_list(list);
+        });
+    add({"__builtin_mkdir"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("mkdir() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          return Value::make_bool(fs::create_directory(path));
+        });
+    add({"__builtin_rmdir"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("rmdir() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          return Value::make_bool(fs::remove(path));
+        });
+    add({"__builtin_remove"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("remove() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          return Value::make_bool(fs::remove(path));
+        });
+    add({"__builtin_copy_file"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("copy_file() requires 2 arguments");
+          std::string from = std::get<std::string>(args[0].v);
+          std::string to = std::get<std::string>(args[1].v);
+          fs::copy_file(from, to);
+          return Value();
+        });
+    add({"__builtin_move"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("move() requires 2 arguments");
+          std::string from = std::get<std::string>(args[0].v);
+          std::string to = std::get<std::string>(args[1].v);
+          fs::rename(from, to);
+          return Value();
+        });
+    add({"__builtin_file_size"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("file_size() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          return Value::make_int(fs::file_size(path));
+        });
+    add({"__builtin_is_dir"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("is_dir() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          return Value::make_bool(fs::is_directory(path));
+        });
+    add({"__builtin_split"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() < 1 || args.size() > 2)
+            throw std::runtime_error("split() requires 1 or 2 arguments");
+          std::string s = std::get<std::string>(args[0].v);
+          std::string delim =
+              (args.size() == 2) ? std::get<std::string>(args[1].v) : " ";
+          std::vector<Value> list;
+          size_t pos = 0;
+          while ((pos = s.find(delim)) != std::string::npos) {
+            list.push_back(Value::make_str(s.substr(0, pos)));
+            s.erase(0, pos + delim.length());
+          }
+          list.push_back(Value::make_str(s));
+          return Value::make_list(list);
+        });
+    add({"__builtin_join"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("join() requires 2 arguments");
+          const auto &list = as_list(args[0]);
+          std::string sep = std::get<std::string>(args[1].v);
+          std::string result;
+          for (size_t i = 0; i < list.size(); ++i) {
+            if (i > 0) result += sep;
+            result += value_to_string(list[i]);
+          }
+          return Value::make_str(result);
+        });
+    add({"__builtin_substr"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() < 2 || args.size() > 3)
+            throw std::runtime_error("substr() requires 2 or 3 arguments");
+          std::string s = std::get<std::string>(args[0].v);
+          size_t start =
+              static_cast<size_t>(value_as_number(args[1]).as_number());
+          size_t len =
+              (args.size() == 3)
+                  ? static_cast<size_t>(value_as_number(args[2]).as_number())
+                  : std::string::npos;
+          return Value::make_str(s.substr(start, len));
+        });
+    add({"__builtin_find"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("find() requires 2 arguments");
+          std::string s = std::get<std::string>(args[0].v);
+          std::string sub = std::get<std::string>(args[1].v);
+          size_t pos = s.find(sub);
+          return Value::make_int(
+              pos == std::string::npos ? -1 : static_cast<int64_t>(pos));
+        });
+    add({"__builtin_replace"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 3)
+            throw std::runtime_error("replace() requires 3 arguments");
+          std::string s = std::get<std::string>(args[0].v);
+          std::string old_str = std::get<std::string>(args[1].v);
+          std::string new_str = std::get<std::string>(args[2].v);
+          size_t pos = 0;
+          while ((pos = s.find(old_str, pos)) != std::string::npos) {
+            s.replace(pos, old_str.length(), new_str);
+            pos += new_str.length();
+          }
+          return Value::make_str(s);
+        });
+    add({"__builtin_to_upper"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("to_upper() requires 1 argument");
+          std::string s = std::get<std::string>(args[0].v);
+          std::transform(s.begin(), s.end(), s.begin(), ::toupper);
+          return Value::make_str(s);
+        });
+    add({"__builtin_to_lower"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("to_lower() requires 1 argument");
+          std::string s = std::get<std::string>(args[0].v);
+          std::transform(s.begin(), s.end(), s.begin(), ::tolower);
+          return Value::make_str(s);
+        });
+    add({"__builtin_trim"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("trim() requires 1 argument");
+          std::string s = std::get<std::string>(args[0].v);
+          s.erase(s.begin(),
+                  std::find_if(s.begin(), s.end(), [](unsigned char ch) {
+                    return !std::isspace(ch);
+                  }));
+          s.erase(
+              std::find_if(s.rbegin(), s.rend(),
+                           [](unsigned char ch) { return !std::isspace(ch); })
+                  .base(),
+              s.end());
+          return Value::make_str(s);
+        });
+    add({"__builtin_starts_with"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("starts_with() requires 2 arguments");
+          std::string s = std::get<std::string>(args[0].v);
+          std::string prefix = std::get<std::string>(args[1].v);
+          return Value::make_bool(s.starts_with(prefix));
+        });
+    add({"__builtin_ends_with"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("ends_with() requires 2 arguments");
+          std::string s = std::get<std::string>(args[0].v);
+          std::string suffix = std::get<std::string>(args[1].v);
+          return Value::make_bool(s.ends_with(suffix));
+        });
+    add({"__builtin_contains"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("contains() requires 2 arguments");
+          std::string s = std::get<std::string>(args[0].v);
+          std::string sub = std::get<std::string>(args[1].v);
+          return Value::make_bool(s.find(sub) != std::string::npos);
+        });
+    add({"__builtin_reverse"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("reverse() requires 1 argument");
+          std::string s = std::get<std::string>(args[0].v);
+          std::reverse(s.begin(), s.end());
+          return Value::make_str(s);
+        });
+    add({"__builtin_repeat"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("repeat() requires 2 arguments");
+          std::string s = std::get<std::string>(args[0].v);
+          int64_t n =
+              static_cast<int64_t>(value_as_number(args[1]).as_number());
+          std::string result;
+          for (int64_t i = 0; i < n; ++i) result += s;
+          return Value::make_str(result);
+        });
+    add({"__builtin_baar_create"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("baar_create() requires 2 arguments");
+          std::string path = std::get<std::string>(args[0].v);
+          const auto &files = as_list(args[1]);
+          std::vector<std::pair<std::string, std::string>> entries;
+          for (const auto &entry_val : files) {
+            if (!std::holds_alternative<std::vector<Value>>(entry_val.v))
+              throw std::runtime_error(
+                  "baar_create() file list must contain [name, data] entries");
+            const auto &entry = std::get<std::vector<Value>>(entry_val.v);
+            if (entry.size() != 2)
+              throw std::runtime_error(
+                  "baar_create() entry must be [name, data]");
+            if (!std::holds_alternative<std::string>(entry[0].v))
+              throw std::runtime_error(
+                  "baar_create() entry name must be a string");
+            entries.emplace_back(std::get<std::string>(entry[0].v),
+                                 value_to_string(entry[1]));
+          }
+          write_archive(path, entries);
+          return Value();
+        });
+    add({"__builtin_baar_extract"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("baar_extract() requires 2 arguments");
+          std::string path = std::get<std::string>(args[0].v);
+          std::string dest = std::get<std::string>(args[1].v);
+          auto entries = read_archive(path);
+          fs::create_directories(dest);
+          for (const auto &entry : entries) {
+            fs::path out_path = fs::path(dest) / entry.first;
+            fs::create_directories(out_path.parent_path());
+            std::ofstream ofs(out_path, std::ios::binary);
+            ofs << entry.second;
+          }
+          return Value();
+        });
+    add({"__builtin_baar_list"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 1)
+            throw std::runtime_error("baar_list() requires 1 argument");
+          std::string path = std::get<std::string>(args[0].v);
+          auto entries = read_archive(path);
+          std::vector<Value> list;
+          for (const auto &entry : entries) {
+            list.push_back(Value::make_str(entry.first));
+          }
+          return Value::make_list(list);
+        });
+    add({"__builtin_baar_read"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error("baar_read() requires 2 arguments");
+          std::string path = std::get<std::string>(args[0].v);
+          std::string name = std::get<std::string>(args[1].v);
+          auto entries = read_archive(path);
+          for (const auto &entry : entries) {
+            if (entry.first == name) return Value::make_str(entry.second);
+          }
+          throw std::runtime_error("Baar entry not found: " + name);
+        });
 #ifdef BLOA_USE_CURL
-  if (marker == "__builtin_curl_get" || marker == "__builtin_curl_post" ||
-      marker == "__builtin_curl_request") {
-    if (args.empty() || args.size() > 3)
-      throw std::runtime_error(
-          "curl_get/curl_post/curl_request() requires 1-3 arguments");
-    std::string url = std::get<std::string>(args[0].v);
-    std::string method = "GET";
-    std::string body;
-    if (marker == "__builtin_curl_post") {
-      method = "POST";
-      if (args.size() < 2)
-        throw std::runtime_error("curl_post() requires url and body");
-      body = std::get<std::string>(args[1].v);
-    }
-    if (marker == "__builtin_curl_request") {
-      if (args.size() >= 2) method = std::get<std::string>(args[1].v);
-      if (args.size() == 3) body = std::get<std::string>(args[2].v);
-    }
-    CURL *curl = curl_easy_init();
-    if (!curl) throw std::runtime_error("Failed to initialize curl");
-    std::string response;
-    curl_easy_setopt(curl, CURLOPT_URL, url.c_str());
-    curl_easy_setopt(curl, CURLOPT_FOLLOWLOCATION, 1L);
-    curl_easy_setopt(curl, CURLOPT_WRITEFUNCTION, curl_write_callback);
-    curl_easy_setopt(curl, CURLOPT_WRITEDATA, &response);
-    if (method == "POST") {
-      curl_easy_setopt(curl, CURLOPT_POST, 1L);
-      curl_easy_setopt(curl, CURLOPT_POSTFIELDS, body.c_str());
-    } else if (method != "GET") {
-      curl_easy_setopt(curl, CURLOPT_CUSTOMREQUEST, method.c_str());
-      if (!body.empty()) {
-        curl_easy_setopt(curl, CURLOPT_POSTFIELDS, body.c_str());
-      }
-    }
-    CURLcode res = curl_easy_perform(curl);
-    long http_code = 0;
-    curl_easy_getinfo(curl, CURLINFO_RESPONSE_CODE, &http_code);
-    curl_easy_cleanup(curl);
-    if (res != CURLE_OK) {
-      throw std::runtime_error(std::string("curl failed: ") +
-                               curl_easy_strerror(res));
-    }
-    return Value::make_str(response);
-  }
+    add({"__builtin_curl_get", "__builtin_curl_post", "__builtin_curl_request"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.empty() || args.size() > 3)
+            throw std::runtime_error(
+                "curl_get/curl_post/curl_request() requires 1-3 arguments");
+          std::string url = std::get<std::string>(args[0].v);
+          std::string method = "GET";
+          std::string body;
+          if (marker == "__builtin_curl_post") {
+            method = "POST";
+            if (args.size() < 2)
+              throw std::runtime_error("curl_post() requires url and body");
+            body = std::get<std::string>(args[1].v);
+          }
+          if (marker == "__builtin_curl_request") {
+            if (args.size() >= 2) method = std::get<std::string>(args[1].v);
+            if (args.size() == 3) body = std::get<std::string>(args[2].v);
+          }
+          CURL *curl = curl_easy_init();
+          if (!curl) throw std::runtime_error("Failed to initialize curl");
+          std::string response;
+          curl_easy_setopt(curl, CURLOPT_URL, url.c_str());
+          curl_easy_setopt(curl, CURLOPT_FOLLOWLOCATION, 1L);
+          curl_easy_setopt(curl, CURLOPT_WRITEFUNCTION, curl_write_callback);
+          curl_easy_setopt(curl, CURLOPT_WRITEDATA, &response);
+          if (method == "POST") {
+            curl_easy_setopt(curl, CURLOPT_POST, 1L);
+            curl_easy_setopt(curl, CURLOPT_POSTFIELDS, body.c_str());
+          } else if (method != "GET") {
+            curl_easy_setopt(curl, CURLOPT_CUSTOMREQUEST, method.c_str());
+            if (!body.empty()) {
+              curl_easy_setopt(curl, CURLOPT_POSTFIELDS, body.c_str());
+            }
+          }
+          CURLcode res = curl_easy_perform(curl);
+          long http_code = 0;
+          curl_easy_getinfo(curl, CURLINFO_RESPONSE_CODE, &http_code);
+          curl_easy_cleanup(curl);
+          if (res != CURLE_OK) {
+            throw std::runtime_error(std::string("curl failed: ") +
+                                     curl_easy_strerror(res));
+          }
+          return Value::make_str(response);
+        });
 #endif
 #ifdef BLOA_USE_SQLITE
-  if (marker == "__builtin_sqlite_query" || marker == "__builtin_sqlite_exec") {
-    if (args.size() != 2)
-      throw std::runtime_error(
-          "sqlite_query/sqlite_exec() requires 2 arguments");
-    std::string path = std::get<std::string>(args[0].v);
-    std::string sql = std::get<std::string>(args[1].v);
-    sqlite3 *db = nullptr;
-    int rc = sqlite3_open(path.c_str(), &db);
-    if (rc != SQLITE_OK) {
-      std::string err = sqlite3_errmsg(db);
-      sqlite3_close(db);
-      throw std::runtime_error("SQLite open failed: " + err);
-    }
-    if (marker == "__builtin_sqlite_exec") {
-      char *errmsg = nullptr;
-      rc = sqlite3_exec(db, sql.c_str(), nullptr, nullptr, &errmsg);
-      if (rc != SQLITE_OK) {
-        std::string err = errmsg ? errmsg : "unknown";
-        sqlite3_free(errmsg);
-        sqlite3_close(db);
-        throw std::runtime_error("SQLite exec failed: " + err);
-      }
-      sqlite3_close(db);
-      return Value::make_int(1);
-    }
-    sqlite3_stmt *stmt = nullptr;
-    rc = sqlite3_prepare_v2(db, sql.c_str(), -1, &stmt, nullptr);
-    if (rc != SQLITE_OK) {
-      std::string err = sqlite3_errmsg(db);
-      sqlite3_close(db);
-      throw std::runtime_error("SQLite prepare failed: " + err);
-    }
-    std::vector<Value> rows;
-    while ((rc = sqlite3_step(stmt)) == SQLITE_ROW) {
-      std::vector<Value> row;
-      int cols = sqlite3_column_count(stmt);
-      for (int col = 0; col < cols; ++col) {
-        const unsigned char *text = sqlite3_column_text(stmt, col);
-        row.push_back(
-            Value::make_str(text ? reinterpret_cast<const char *>(text) : ""));
-      }
-      rows.push_back(Value::make_list(std::move(row)));
-    }
-    if (rc != SQLITE_DONE) {
-      std::string err = sqlite3_errmsg(db);
-      sqlite3_finalize(stmt);
-      sqlite3_close(db);
-      throw std::runtime_error("SQLite step failed: " + err);
-    }
-    sqlite3_finalize(stmt);
-    sqlite3_close(db);
-    return Value::make_list(rows);
-  }
+    add({"__builtin_sqlite_query", "__builtin_sqlite_exec"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() != 2)
+            throw std::runtime_error(
+                "sqlite_query/sqlite_exec() requires 2 arguments");
+          std::string path = std::get<std::string>(args[0].v);
+          std::string sql = std::get<std::string>(args[1].v);
+          sqlite3 *db = nullptr;
+          int rc = sqlite3_open(path.c_str(), &db);
+          if (rc != SQLITE_OK) {
+            std::string err = sqlite3_errmsg(db);
+            sqlite3_close(db);
+            throw std::runtime_error("SQLite open failed: " + err);
+          }
+          if (marker == "__builtin_sqlite_exec") {
+            char *errmsg = nullptr;
+            rc = sqlite3_exec(db, sql.c_str(), nullptr, nullptr, &errmsg);
+            if (rc != SQLITE_OK) {
+              std::string err = errmsg ? errmsg : "unknown";
+              sqlite3_free(errmsg);
+              sqlite3_close(db);
+              throw std::runtime_error("SQLite exec failed: " + err);
+            }
+            sqlite3_close(db);
+            return Value::make_int(1);
+          }
+          sqlite3_stmt *stmt = nullptr;
+          rc = sqlite3_prepare_v2(db, sql.c_str(), -1, &stmt, nullptr);
+          if (rc != SQLITE_OK) {
+            std::string err = sqlite3_errmsg(db);
+            sqlite3_close(db);
+            throw std::runtime_error("SQLite prepare failed: " + err);
+          }
+          std::vector<Value> rows;
+          while ((rc = sqlite3_step(stmt)) == SQLITE_ROW) {
+            std::vector<Value> row;
+            int cols = sqlite3_column_count(stmt);
+            for (int col = 0; col < cols; ++col) {
+              const unsigned char *text = sqlite3_column_text(stmt, col);
+              row.push_back(Value::make_str(
+                  text ? reinterpret_cast<const char *>(text) : ""));
+            }
+            rows.push_back(Value::make_list(std::move(row)));
+          }
+          if (rc != SQLITE_DONE) {
+            std::string err = sqlite3_errmsg(db);
+            sqlite3_finalize(stmt);
+            sqlite3_close(db);
+            throw std::runtime_error("SQLite step failed: " + err);
+          }
+          sqlite3_finalize(stmt);
+          sqlite3_close(db);
+          return Value::make_list(rows);
+        });
 #endif
-  if (marker == "__builtin_random_int") {
-    if (args.size() < 1 || args.size() > 2)
-      throw std::runtime_error("random_int() requires 1 or 2 arguments");
-    int64_t min =
-        (args.size() == 2)
-            ? static_cast<int64_t>(value_as_number(args[0]).as_number())
-            : 0;
-    int64_t max =
-        (args.size() == 2)
-            ? static_cast<int64_t>(value_as_number(args[1]).as_number())
-            : static_cast<int64_t>(value_as_number(args[0]).as_number());
-    static std::random_device rd;
-    static std::mt19937 gen(rd());
-    std::uniform_int_distribution<int64_t> dist(min, max);
-    return Value::make_int(dist(gen));
-  }
-  if (marker == "__builtin_random_float") {
-    if (args.size() < 1 || args.size() > 2)
-      throw std::runtime_error("random_float() requires 1 or 2 arguments");
-    double min =
-        (args.size() == 2) ? value_as_number(args[0]).as_number() : 0.0;
-    double max = (args.size() == 2) ? value_as_number(args[1]).as_number()
-                                    : value_as_number(args[0]).as_number();
-    static std::random_device rd;
-    static std::mt19937 gen(rd());
-    std::uniform_real_distribution<double> dist(min, max);
-    return Value::make_double(dist(gen));
-  }
-  if (marker == "__builtin_now") {
-    auto now = std::chrono::system_clock::now();
-    auto duration = now.time_since_epoch();
-    auto millis =
-        std::chrono::duration_cast<std::chrono::milliseconds>(duration).count();
-    return Value::make_int(millis);
+    add({"__builtin_random_int"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() < 1 || args.size() > 2)
+            throw std::runtime_error("random_int() requires 1 or 2 arguments");
+          int64_t min =
+              (args.size() == 2)
+                  ? static_cast<int64_t>(value_as_number(args[0]).as_number())
+                  : 0;
+          int64_t max =
+              (args.size() == 2)
+                  ? static_cast<int64_t>(value_as_number(args[1]).as_number())
+                  : static_cast<int64_t>(value_as_number(args[0]).as_number());
+          static std::random_device rd;
+          static std::mt19937 gen(rd());
+          std::uniform_int_distribution<int64_t> dist(min, max);
+          return Value::make_int(dist(gen));
+        });
+    add({"__builtin_random_float"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          if (args.size() < 1 || args.size() > 2)
+            throw std::runtime_error(
+                "random_float() requires 1 or 2 arguments");
+          double min =
+              (args.size() == 2) ? value_as_number(args[0]).as_number() : 0.0;
+          double max = (args.size() == 2)
+                           ? value_as_number(args[1]).as_number()
+                           : value_as_number(args[0]).as_number();
+          static std::random_device rd;
+          static std::mt19937 gen(rd());
+          std::uniform_real_distribution<double> dist(min, max);
+          return Value::make_double(dist(gen));
+        });
+    add({"__builtin_now"},
+        [](const std::string &marker, const std::vector<Value> &args,
+           const std::shared_ptr<Environment> &env) -> Value {
+          auto now = std::chrono::system_clock::now();
+          auto duration = now.time_since_epoch();
+          auto millis =
+              std::chrono::duration_cast<std::chrono::milliseconds>(duration)
+                  .count();
+          return Value::make_int(millis);
+        });
+    return table;
+  }();
+  return handlers;
+}
+
+Value value_length(const Value &arg) {
+  if (std::holds_alternative<std::string>(arg.v)) {
+    return Value::make_int(
+        static_cast<int64_t>(std::get<std::string>(arg.v).size()));
+  } else if (std::holds_alternative<std::vector<Value>>(arg.v)) {
+    return Value::make_int(
+        static_cast<int64_t>(std::get<std::vector<Value>>(arg.v).size()));
+  } else if (std::holds_alternative<std::shared_ptr<ObjectInstance>>(arg.v)) {
+    return Value::make_int(
+        static_cast<int64_t>(std::get<std::shared_ptr<ObjectInstance>>(arg.v)
+                                 ->properties->local_size()));
+  } else {
+    throw std::runtime_error("len() argument must be string, list, or object");
   }
-  throw std::runtime_error("Unknown built-in: " + marker);
+}
+
+const Builtin *find_builtin(const std::string &marker) {
+  const auto &handlers = builtin_handlers();
+  auto it = handlers.find(marker);
+  return it == handlers.end() ? nullptr : &*it;
+}
+
+Value handle_builtin(const std::string &marker, const std::vector<Value> &args,
+                     std::shared_ptr<Environment> env) {
+  const Builtin *builtin = find_builtin(marker);
+  if (!builtin) throw std::runtime_error("Unknown built-in: " + marker);
+  return builtin->second(marker, args, env);
 }
 
 }  // namespace bloa
\ No newline at end of file
@@ -31,6 +31,6 @@ run() {
 
 run "$ROOT/test_json.bloa" '[["a","b","c"],["1","2","3"]]'
 run "$ROOT/test_csv.bloa" '[["a","b","c"],["1","2","3"]]'
-run "$ROOT/test_misc.bloa" $'true\nYWJj\nabc\ntrue\nfoo_bar\ntrue\nbar\n.txt\n/tmp\nfoo.txt\n3\ntrue'
+run "$ROOT/test_misc.bloa" $'true\nYWJj\nabc\ntrue\nfoo_bar\ntrue\nbar\n.txt\n/tmp\nfoo.txt\n3\ntrue\n120\n6\n10\n4\n22\nwoofmeowwoof\n3\n6765\n2\n11\nrr\nrr'
 
 echo "All tests passed."